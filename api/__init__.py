@@ -0,0 +1,3 @@
+"""
+Headless HTTP API for the JEE Assistant, independent of the Streamlit app
+"""
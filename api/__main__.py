@@ -0,0 +1,33 @@
+"""
+Run the HTTP API with uvicorn.
+
+Usage:
+    python -m api [--host 0.0.0.0] [--port 8000] [--workers 2]
+"""
+import argparse
+import uvicorn
+from config.settings import API_CONFIG
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JEE Assistant HTTP API")
+    parser.add_argument("--host", default=API_CONFIG.get("host", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=API_CONFIG.get("port", 8000))
+    parser.add_argument("--workers", type=int, default=API_CONFIG.get("workers", 2),
+                        help="Worker processes, each with its own copy of the engine")
+    args = parser.parse_args()
+
+    # Passing the app as an import string lets uvicorn start several worker processes
+    uvicorn.run(
+        "api.app:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        proxy_headers=True,
+        forwarded_allow_ips=API_CONFIG.get("forwarded_allow_ips", "127.0.0.1"),
+        timeout_keep_alive=API_CONFIG.get("keep_alive_seconds", 5)
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""
+ASGI application exposing chat streaming and document management over HTTP
+"""
+import io
+import json
+import os
+import uuid
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+from config.settings import API_CONFIG
+from core.memory_manager import memory_manager
+from core.rag_engine import rag_engine
+from core.vector_operations import vector_db_operations
+from core.vector_store import vector_store_manager
+from services.chat_service import chat_service
+from services.feedback_store import FEEDBACK_VALUES
+from utils.logger import setup_logging, get_logger
+from utils.registry import warmup
+from utils.tracing import tracer
+
+setup_logging()
+logger = get_logger(__name__)
+
+EMPTY_RESPONSE = "I don't have enough information to answer that. Please try rephrasing your question."
+
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    """Format one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _stream_answer(query: str, chat_id: str) -> AsyncIterator[str]:
+    """Stream the answer as SSE events and persist it once complete."""
+    yield _sse("start", {"chat_id": chat_id})
+    full_response = ""
+    try:
+        async for chunk in rag_engine.aprocess_query(query, chat_id=chat_id):
+            full_response += chunk
+            yield _sse("token", {"text": chunk})
+    except Exception as e:
+        logger.error(f"Error streaming answer for chat {chat_id}: {e}")
+        yield _sse("error", {"message": "Error processing query. Please try again."})
+        return
+
+    if not full_response:
+        full_response = EMPTY_RESPONSE
+        yield _sse("token", {"text": full_response})
+    message_id = await run_in_threadpool(chat_service.save_message, chat_id, "assistant", full_response)
+    await _mark_history_synced(chat_id)
+    yield _sse("done", {"chat_id": chat_id, "message_id": message_id})
+
+
+async def _mark_history_synced(chat_id: str) -> None:
+    """Record that this worker's memory of a chat includes the turn it just stored."""
+    revision = await run_in_threadpool(chat_service.history_revision, chat_id)
+    memory_manager.mark_revision(chat_id, revision)
+
+
+async def _read_object(request: Request):
+    """Return the JSON object in the request body, or a 400 response if it is not one."""
+    try:
+        payload = await request.json()
+    except ValueError:
+        return JSONResponse({"error": "Request body must be JSON."}, status_code=400)
+    if not isinstance(payload, dict):
+        return JSONResponse({"error": "Request body must be a JSON object."}, status_code=400)
+    return payload
+
+
+async def chat(request: Request):
+    """
+    POST /chat with {"query": str, "chat_id": optional str, "stream": optional bool}.
+    Streams the answer as Server-Sent Events unless stream is false; the final
+    event carries the answer's message_id for POST /feedback.
+    """
+    payload = await _read_object(request)
+    if isinstance(payload, JSONResponse):
+        return payload
+
+    query, chat_id = payload.get("query"), payload.get("chat_id")
+    if not isinstance(query, str) or not query.strip():
+        return JSONResponse({"error": "Field 'query' must be a non-empty string."}, status_code=400)
+    if chat_id is not None and not isinstance(chat_id, str):
+        return JSONResponse({"error": "Field 'chat_id' must be a string."}, status_code=400)
+    if not isinstance(payload.get("stream", True), bool):
+        return JSONResponse({"error": "Field 'stream' must be a boolean."}, status_code=400)
+    query = query.strip()
+    chat_id = chat_id or str(uuid.uuid4())
+
+    # Other workers may have served earlier turns of this chat; reload its history
+    # from the store only if it changed since this worker last saw it
+    revision = await run_in_threadpool(chat_service.history_revision, chat_id)
+    await run_in_threadpool(memory_manager.resync, chat_id, revision)
+    if not await run_in_threadpool(chat_service.save_message, chat_id, "user", query):
+        return JSONResponse({"error": "Failed to save the message."}, status_code=500)
+
+    if payload.get("stream", True):
+        return StreamingResponse(
+            _stream_answer(query, chat_id),
+            media_type="text/event-stream",
+            # Stop proxies such as nginx from buffering the stream
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+
+    full_response = "".join([chunk async for chunk in rag_engine.aprocess_query(query, chat_id=chat_id)])
+    full_response = full_response or EMPTY_RESPONSE
+    message_id = await run_in_threadpool(chat_service.save_message, chat_id, "assistant", full_response)
+    await _mark_history_synced(chat_id)
+    return JSONResponse({"chat_id": chat_id, "message_id": message_id, "answer": full_response})
+
+
+async def feedback(request: Request):
+    """POST /feedback with {"chat_id": str, "message_id": str, "feedback": "up" | "down"}."""
+    payload = await _read_object(request)
+    if isinstance(payload, JSONResponse):
+        return payload
+
+    chat_id, message_id = payload.get("chat_id"), payload.get("message_id")
+    if not isinstance(chat_id, str) or not isinstance(message_id, str) or not chat_id or not message_id \
+            or payload.get("feedback") not in FEEDBACK_VALUES:
+        return JSONResponse({"error": "Fields 'chat_id', 'message_id' and 'feedback' (up/down) are required."},
+                            status_code=400)
+    if not await run_in_threadpool(chat_service.save_feedback, chat_id, message_id, payload["feedback"]):
+        return JSONResponse({"error": "Failed to save feedback."}, status_code=500)
+    return JSONResponse({"success": True})
+
+
+async def list_documents(request: Request):
+    """GET /documents: filenames in the knowledge base and collection stats."""
+    documents = await run_in_threadpool(vector_db_operations.list_documents)
+    stats = await run_in_threadpool(vector_db_operations.get_document_stats)
+    return JSONResponse({"documents": documents, "stats": stats})
+
+
+async def add_document(request: Request):
+    """
+    POST /documents?filename=name.pdf with the raw PDF as the request body.
+    Pass update=true to re-ingest an existing document incrementally.
+    """
+    filename = request.query_params.get("filename", "").strip()
+    if not filename.lower().endswith(".pdf") or "/" in filename or "\\" in filename:
+        return JSONResponse({"error": "Query parameter 'filename' must be a PDF file name."}, status_code=400)
+
+    max_bytes = API_CONFIG.get("max_upload_mb", 50) * 1024 * 1024
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+        return JSONResponse({"error": "File is too large."}, status_code=413)
+
+    data = await request.body()
+    if len(data) > max_bytes:
+        return JSONResponse({"error": "File is too large."}, status_code=413)
+    if not data.startswith(b"%PDF"):
+        return JSONResponse({"error": "Request body is not a PDF file."}, status_code=400)
+
+    # BytesIO offers the getvalue() the vector operations expect from uploads
+    update = request.query_params.get("update", "").lower() in ("1", "true", "yes")
+    operation = vector_db_operations.update_document if update else vector_db_operations.add_pdf_to_vectorstore
+    result = await run_in_threadpool(operation, io.BytesIO(data), filename)
+    return JSONResponse(result, status_code=201 if result.get("success") else 400)
+
+
+async def delete_document(request: Request):
+    """DELETE /documents/{filename}: remove a document and all its chunks."""
+    filename = request.path_params["filename"]
+    result = await run_in_threadpool(vector_db_operations.delete_document_by_filename, filename)
+    return JSONResponse(result, status_code=200 if result.get("success") else 404)
+
+
+async def health(request: Request):
+    """GET /health: liveness and vector store availability, for load balancer checks."""
+    available = await run_in_threadpool(vector_store_manager.is_available)
+    return JSONResponse(
+        {"status": "ok" if available else "degraded", "vector_store": available},
+        status_code=200 if available else 503
+    )
+
+
+async def traces(request: Request):
+    """GET /traces?limit=200: this worker's stage latency histograms and most recent spans."""
+    limit = request.query_params.get("limit", "200")
+    limit = int(limit) if limit.isdigit() else 200
+    return JSONResponse({"pid": os.getpid(), "stages": tracer.summary(), "spans": tracer.recent_spans(limit)})
+
+
+routes = [
+    Route("/health", health, methods=["GET"]),
+    Route("/traces", traces, methods=["GET"]),
+    Route("/chat", chat, methods=["POST"]),
+    Route("/feedback", feedback, methods=["POST"]),
+    Route("/documents", list_documents, methods=["GET"]),
+    Route("/documents", add_document, methods=["POST"]),
+    Route("/documents/{filename:path}", delete_document, methods=["DELETE"]),
+]
+
+
+@asynccontextmanager
+async def lifespan(app: Starlette):
+    """
+    Warm every worker up before it accepts traffic, so first requests are not
+    slow, and write its traces to TRACING_CONFIG["export_path"] on shutdown.
+    """
+    await run_in_threadpool(warmup)
+    yield
+    if tracer.enabled:
+        await run_in_threadpool(tracer.export, tracer.process_export_path())
+
+
+app = Starlette(routes=routes, lifespan=lifespan)
@@ -6,6 +6,7 @@ from ui.pages.chatbot import show_chatbot_page
 from ui.pages.vector_operations import show_vector_operations_page
 from config.settings import PAGE_CONFIG
 from utils.logger import setup_logging, get_logger
+from utils.registry import warmup
 
 # Setup logging
 setup_logging()
@@ -14,12 +15,18 @@ logger = get_logger(__name__)
 # Configure page settings
 st.set_page_config(**PAGE_CONFIG)
 
+@st.cache_resource(show_spinner="Loading knowledge base...")
+def warm_up_services():
+    """Construct the engine, vector store and chat store once per server process."""
+    return warmup()
+
 def main():
     """
     Main application entry point for BSK Assistant.
     Initializes session state, determines current page, and routes to the appropriate page.
     """
     logger.debug("Entered main() function.")
+    warm_up_services()
     if "current_page" not in st.session_state:
         st.session_state.current_page = "chat"
         logger.info("Initialized session state with default page: chat")
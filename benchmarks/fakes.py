@@ -0,0 +1,96 @@
+"""
+Deterministic local stand-ins for the OpenAI embedding and chat models
+"""
+import hashlib
+import math
+import re
+from typing import Any, Iterator, List, Optional
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import RunnableLambda
+
+_WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Feature-hashed bag of words and bigrams, L2-normalised.
+
+    Similar texts get similar vectors, which is enough to exercise retrieval,
+    MMR and the answer cache without a network call.
+    """
+
+    def __init__(self, model: str = "hashing", dimensions: int = 256, **kwargs: Any):
+        self.model = model
+        self.dimensions = dimensions
+        self.calls = 0
+        self.texts = 0
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.dimensions
+        words = _WORD_PATTERN.findall(text.lower())
+        for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            digest = hashlib.md5(feature.encode("utf-8")).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dimensions
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+        return [x / norm for x in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        self.texts += len(texts)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+class EchoChatModel(BaseChatModel):
+    """
+    Chat model that streams a fixed-length answer derived from the prompt.
+
+    Structured output (used for query reformulation) returns the current query
+    unchanged, tagged as English.
+    """
+
+    model: str = "echo"
+    temperature: float = 0.0
+    streaming: bool = True
+    answer_words: int = 60
+
+    @property
+    def _llm_type(self) -> str:
+        return "echo"
+
+    def _answer_words(self, messages: List[BaseMessage]) -> List[str]:
+        words = _WORD_PATTERN.findall(str(messages[-1].content)) or ["answer"]
+        return [words[i % len(words)] for i in range(self.answer_words)]
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        content = " ".join(self._answer_words(messages))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        for word in self._answer_words(messages):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+
+    def with_structured_output(self, schema: Any, **kwargs: Any):
+        def reformulate(prompt_value: Any):
+            text = prompt_value.to_string() if hasattr(prompt_value, "to_string") else str(prompt_value)
+            query = text.rsplit("Current query:", 1)[-1].strip()
+            return schema(query=query, language="English")
+        return RunnableLambda(reformulate)
+
+
+def install() -> None:
+    """Swap the OpenAI classes used by the model factories for the local stand-ins."""
+    import models.embeddings
+    import models.llm_models
+
+    models.embeddings.OpenAIEmbeddings = HashingEmbeddings
+    models.llm_models.ChatOpenAI = EchoChatModel
@@ -0,0 +1,360 @@
+"""
+End-to-end benchmark over the PDFs in Docs/, using local model stand-ins.
+
+Usage:
+    python -m benchmarks.run [--docs Docs] [--output results.json]
+
+The run happens in a scratch working directory, so the vector store, indexes,
+caches and chat history it creates never touch the ones under data/.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BENCHMARK_QUERIES = [
+    "What is the eligibility criteria for JEE Main?",
+    "How many attempts are allowed for JEE Advanced?",
+    "What is the exam pattern of JEE Main paper 1?",
+    "Which documents are required at the examination centre?",
+    "What is the age limit for appearing in JEE?",
+    "How is the NTA score calculated?",
+    "What are the reservation rules for admission?",
+    "What happens if a candidate uses unfair means?",
+    "What is the marking scheme for numerical value questions?",
+    "Tell me more about that",
+]
+
+# Labelled queries the local reformulation decision must keep getting right
+FOLLOW_UP_CASES = [
+    ("what is its last date to apply", True),
+    ("What is their cutoff for general category", True),
+    ("Where is it held in Delhi", True),
+    ("Tell me more about them please", True),
+    ("How much does it cost per year", True),
+    ("what about the fee for girls", True),
+    ("Can you explain the above again", True),
+    ("is that course free for girls", False),
+    ("What is the fee for that course", False),
+    ("List the documents that are needed for admission", False),
+    ("When does the counselling for NEET start", False),
+]
+
+LANGUAGE_CASES = [
+    ("JEE ki date", "Unknown"),
+    ("JEE Main ka syllabus kya hai", "Unknown"),
+    ("Exam kab hai aur kahan", "Unknown"),
+    ("Is KI a valid abbreviation", "English"),
+    ("What is the JEE Main exam date", "English"),
+    ("जेईई की तारीख क्या है", "Hindi"),
+]
+
+
+def _summarize(samples: List[float]) -> Dict:
+    """Summarise a list of durations in seconds as millisecond statistics."""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def percentile(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(round(p * (len(ordered) - 1))))]
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(statistics.mean(ordered) * 1000, 3),
+        "p50_ms": round(percentile(0.50) * 1000, 3),
+        "p95_ms": round(percentile(0.95) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3)
+    }
+
+
+def _configure(args: argparse.Namespace) -> None:
+    """Adjust configuration before any core module reads it."""
+    from config import settings
+
+    settings.ANSWER_CACHE_CONFIG["enabled"] = args.answer_cache
+    settings.RETRIEVAL_CACHE_CONFIG["enabled"] = args.retrieval_cache
+    settings.CHAT_STORE_CONFIG["backend"] = args.chat_store
+    settings.VECTOR_STORE_CONFIG["retrieval_mode"] = args.retrieval_mode
+    settings.VECTOR_STORE_CONFIG["index_backend"] = args.index_backend
+    if args.chroma_server:
+        host, _, port = args.chroma_server.rpartition(":")
+        settings.VECTOR_STORE_CONFIG.update({
+            "mode": "http",
+            "server_host": host or "localhost",
+            "server_port": int(port),
+            # A throwaway collection, so a shared server's real data is left alone
+            "collection_name": f"benchmark-{uuid.uuid4().hex[:12]}"
+        })
+    if args.embeddings == "local":
+        settings.MODEL_CONFIG["embedding_provider"] = "local"
+        settings.LOCAL_EMBEDDING_CONFIG["corpus_dir"] = os.path.abspath(args.docs)
+
+
+def bench_query_classification() -> Dict:
+    """Check the local language and follow-up decisions against the labelled cases."""
+    from config.settings import REFORMULATION_CONFIG
+    from utils.helpers import detect_language, references_prior_turns
+
+    mismatches = []
+    for query, expected in FOLLOW_UP_CASES:
+        actual = references_prior_turns(
+            query,
+            REFORMULATION_CONFIG.get("follow_up_openers", []),
+            REFORMULATION_CONFIG.get("follow_up_pronouns", []),
+            REFORMULATION_CONFIG.get("follow_up_phrases", []),
+            REFORMULATION_CONFIG.get("max_short_words", 3)
+        )
+        if actual != expected:
+            mismatches.append({"check": "follow_up", "query": query, "expected": expected, "actual": actual})
+    for query, expected in LANGUAGE_CASES:
+        actual = detect_language(query)
+        if actual != expected:
+            mismatches.append({"check": "language", "query": query, "expected": expected, "actual": actual})
+    return {"cases": len(FOLLOW_UP_CASES) + len(LANGUAGE_CASES), "mismatches": mismatches}
+
+
+def bench_startup() -> Dict:
+    """Measure module import time and service warm-up separately."""
+    start = time.perf_counter()
+    import core.ingestion  # noqa: F401
+    import core.rag_engine  # noqa: F401
+    import services.chat_service  # noqa: F401
+    import_seconds = time.perf_counter() - start
+
+    from utils.registry import warmup
+    start = time.perf_counter()
+    timings = warmup()
+    return {
+        "import_seconds": round(import_seconds, 4),
+        "warmup_seconds": round(time.perf_counter() - start, 4),
+        "warmup": timings
+    }
+
+
+def bench_ingestion(pdf_paths: List[str]) -> Dict:
+    """Ingest every PDF through the bulk ingestion pipeline."""
+    from core.ingestion import ingestion_pipeline
+
+    files = []
+    for path in pdf_paths:
+        with open(path, "rb") as f:
+            files.append((os.path.basename(path), f.read()))
+
+    report = ingestion_pipeline.ingest(files)
+    pages = report["stages"].get("parse", {}).get("items", 0)
+    chunks = sum(result["chunks_added"] for result in report["results"].values())
+    total = report["total_seconds"]
+    return {
+        "files": len(files),
+        "files_failed": sum(1 for result in report["results"].values() if not result["success"]),
+        "pages": pages,
+        "chunks": chunks,
+        "total_seconds": total,
+        "pages_per_second": round(pages / total, 2) if total else 0.0,
+        "chunks_per_second": round(chunks / total, 2) if total else 0.0,
+        "stages": report["stages"]
+    }
+
+
+def bench_retrieval(queries: List[str], repeat: int) -> Dict:
+    """Measure retriever latency and the size of the assembled context."""
+    from core.rag_engine import rag_engine
+    from core.vector_store import vector_store_manager
+    from utils.token_counter import count_tokens
+
+    latencies, context_chars, context_tokens, chunk_chars = [], [], [], []
+    for _ in range(repeat):
+        for query in queries:
+            start = time.perf_counter()
+            documents = vector_store_manager.retriever.invoke(query)
+            latencies.append(time.perf_counter() - start)
+
+            context = rag_engine._get_context(documents, query)
+            chunk_chars.append(sum(len(doc.page_content) for doc in documents))
+            context_chars.append(len(context))
+            context_tokens.append(count_tokens(context))
+
+    return {
+        "latency": _summarize(latencies),
+        "context": {
+            "mean_chunk_chars": round(statistics.mean(chunk_chars), 1),
+            "mean_chars": round(statistics.mean(context_chars), 1),
+            "mean_tokens": round(statistics.mean(context_tokens), 1),
+            "max_tokens": max(context_tokens)
+        }
+    }
+
+
+def bench_end_to_end(queries: List[str], repeat: int) -> Dict:
+    """Measure time to first token and total latency through rag_engine.process_query."""
+    from core.rag_engine import rag_engine
+    from core.retrieval_cache import retrieval_cache
+    from core.token_budget import token_budget
+
+    first_token, total, chunks = [], [], []
+    for _ in range(repeat):
+        # One conversation per pass, so follow-up queries see earlier turns
+        chat_id = str(uuid.uuid4())
+        for query in queries:
+            start = time.perf_counter()
+            first = None
+            count = 0
+            for chunk in rag_engine.process_query(query, chat_id=chat_id):
+                if first is None:
+                    first = time.perf_counter() - start
+                count += 1
+            total.append(time.perf_counter() - start)
+            first_token.append(first if first is not None else total[-1])
+            chunks.append(count)
+
+    return {
+        "time_to_first_token": _summarize(first_token),
+        "total": _summarize(total),
+        "mean_chunks": round(statistics.mean(chunks), 1),
+        "reformulation": rag_engine.get_reformulation_stats(),
+        "retrieval_cache": retrieval_cache.stats(),
+        "tokens": token_budget.stats()
+    }
+
+
+def bench_chat_store(messages: int) -> Dict:
+    """Measure message write, history read and feedback write latency of the configured chat store."""
+    from services.chat_service import chat_service
+
+    chat_ids = [str(uuid.uuid4()) for _ in range(10)]
+    writes = []
+    answers = []
+    for i in range(messages):
+        role = "user" if i % 2 == 0 else "assistant"
+        start = time.perf_counter()
+        message_id = chat_service.save_message(chat_ids[i % len(chat_ids)], role, f"Benchmark message {i} " * 20)
+        writes.append(time.perf_counter() - start)
+        if role == "assistant":
+            answers.append((chat_ids[i % len(chat_ids)], message_id))
+
+    reads = []
+    for chat_id in chat_ids:
+        start = time.perf_counter()
+        chat_service.load_chat_messages(chat_id)
+        reads.append(time.perf_counter() - start)
+
+    feedback_writes = []
+    for i, (chat_id, message_id) in enumerate(answers):
+        start = time.perf_counter()
+        chat_service.save_feedback(chat_id, message_id, "up" if i % 3 else "down")
+        feedback_writes.append(time.perf_counter() - start)
+
+    return {
+        "backend": type(chat_service.store).__name__,
+        "write": _summarize(writes),
+        "read_history": _summarize(reads),
+        "feedback_write": _summarize(feedback_writes)
+    }
+
+
+def run(args: argparse.Namespace) -> Dict:
+    """Run every benchmark in a scratch directory and return the results."""
+    docs_dir = os.path.abspath(args.docs)
+    traces_path = os.path.abspath(args.traces) if args.traces else None
+    pdf_paths = sorted(
+        os.path.join(docs_dir, name) for name in os.listdir(docs_dir) if name.lower().endswith(".pdf")
+    )
+    if not pdf_paths:
+        raise SystemExit(f"No PDF files found in {docs_dir}")
+
+    workdir = tempfile.mkdtemp(prefix="jee_bench_")
+    previous_cwd = os.getcwd()
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    os.chdir(workdir)
+    try:
+        _configure(args)
+        from benchmarks import fakes
+        fakes.install()
+
+        queries = BENCHMARK_QUERIES[:args.queries] if args.queries else BENCHMARK_QUERIES
+        results = {
+            "timestamp": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "settings": {
+                "documents": len(pdf_paths),
+                "queries": len(queries),
+                "repeat": args.repeat,
+                "answer_cache": args.answer_cache,
+                "retrieval_cache": args.retrieval_cache,
+                "chat_store": args.chat_store,
+                "retrieval_mode": args.retrieval_mode,
+                "index_backend": args.index_backend,
+                "vector_store": f"http://{args.chroma_server}" if args.chroma_server else "embedded",
+                "embeddings": args.embeddings
+            },
+            "query_classification": bench_query_classification(),
+            "startup": bench_startup(),
+            "ingestion": bench_ingestion(pdf_paths),
+            "retrieval": bench_retrieval(queries, args.repeat),
+            "end_to_end": bench_end_to_end(queries, args.repeat),
+            "chat_store": bench_chat_store(args.messages)
+        }
+        from utils.tracing import tracer
+        results["stages"] = tracer.summary()
+        if args.traces:
+            tracer.export(traces_path)
+        if args.chroma_server:
+            from core.vector_store import vector_store_manager
+            vector_store_manager.vector_store.delete_collection()
+    finally:
+        os.chdir(previous_cwd)
+        if not args.keep_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of the JEE Assistant pipeline")
+    parser.add_argument("--docs", default=os.path.join(REPO_ROOT, "Docs"), help="Directory of PDFs to ingest")
+    parser.add_argument("--output", help="Write the JSON results to this file as well as stdout")
+    parser.add_argument("--queries", type=int, default=0, help="Use only the first N benchmark queries")
+    parser.add_argument("--repeat", type=int, default=3, help="Passes over the query set")
+    parser.add_argument("--messages", type=int, default=500, help="Messages written in the chat store benchmark")
+    parser.add_argument("--chat-store", choices=["sqlite", "jsonl"], default="sqlite")
+    parser.add_argument("--retrieval-mode", choices=["dense", "hybrid"], default="dense")
+    parser.add_argument("--index-backend", choices=["chroma", "mmap"], default="chroma")
+    parser.add_argument("--chroma-server", metavar="HOST:PORT",
+                        help="Use a running Chroma server (client/server mode) instead of an embedded store")
+    parser.add_argument("--embeddings", choices=["hashing", "local"], default="hashing",
+                        help="Deterministic hashing stand-in, or the local TF-IDF + SVD provider fitted on --docs")
+    parser.add_argument("--answer-cache", action="store_true",
+                        help="Keep the semantic answer cache on (off by default so every query runs the full pipeline)")
+    parser.add_argument("--retrieval-cache", action="store_true",
+                        help="Keep the retrieval result cache on (off by default, like the answer cache)")
+    parser.add_argument("--traces", metavar="PATH",
+                        help="Also export every recorded span and the stage histograms to this JSON file")
+    parser.add_argument("--keep-workdir", action="store_true", help="Do not delete the scratch directory")
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+    mismatches = results["query_classification"]["mismatches"]
+    if mismatches:
+        raise SystemExit(f"{len(mismatches)} query classification cases failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,3 @@
+"""
+Command-line tools for managing the JEE Assistant knowledge base
+"""
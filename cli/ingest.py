@@ -0,0 +1,227 @@
+"""
+Bulk-ingest a directory of PDFs from the command line.
+
+Usage:
+    python -m cli.ingest Docs [--workers 4] [--update] [--restart]
+
+New files go through the parallel ingestion pipeline in batches; with --update,
+files already in the knowledge base are re-ingested incrementally. The outcome
+of every file is written to a checkpoint after each batch, so an interrupted
+run picks up where it stopped: files recorded as done are skipped without
+being read again unless their size or modification time changed.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Dict, List, Optional
+
+from tqdm import tqdm
+
+from config.settings import INGESTION_CONFIG
+from utils.logger import setup_logging, get_logger
+
+logger = get_logger(__name__)
+
+# Outcomes that do not need another attempt on resume
+_FINISHED = ("done", "skipped")
+
+
+def _file_signature(path: str) -> Dict:
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+class _Upload:
+    """Minimal stand-in for an uploaded file, as update_document expects."""
+
+    def __init__(self, data: bytes):
+        self._data = data
+
+    def getvalue(self) -> bytes:
+        return self._data
+
+
+def load_checkpoint(path: str, directory: str) -> Dict:
+    """Load the checkpoint of a previous run over directory, or start a new one."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            checkpoint = json.load(f)
+        if checkpoint.get("directory") == directory:
+            return checkpoint
+        logger.info(f"Checkpoint {path} belongs to {checkpoint.get('directory')}; starting over")
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable checkpoint {path}: {e}")
+    return {"directory": directory, "files": {}}
+
+
+def save_checkpoint(path: str, checkpoint: Dict) -> None:
+    """Write the checkpoint atomically, so a crash mid-write keeps the previous one."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    checkpoint["updated_at"] = time.time()
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f, ensure_ascii=False, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+def pending_files(directory: str, checkpoint: Dict, retry_failed: bool = True) -> List[str]:
+    """PDF names in directory that the checkpoint does not record as finished."""
+    pending = []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if not name.lower().endswith(".pdf") or not os.path.isfile(path):
+            continue
+        entry = checkpoint["files"].get(name)
+        if entry and entry.get("signature") == _file_signature(path):
+            if entry["status"] in _FINISHED or (entry["status"] == "failed" and not retry_failed):
+                continue
+        pending.append(name)
+    return pending
+
+
+def ingest_directory(directory: str, checkpoint_path: str, update: bool = False,
+                     batch_files: int = 16, restart: bool = False, retry_failed: bool = True,
+                     show_progress: bool = True) -> Dict:
+    """
+    Ingest every PDF in directory, resuming from the checkpoint unless restart is set.
+
+    Returns:
+        Dict with the number of files per outcome and the elapsed seconds
+    """
+    from core.ingestion import ingestion_pipeline
+    from core.vector_operations import vector_db_operations
+
+    directory = os.path.abspath(directory)
+    checkpoint = {"directory": directory, "files": {}} if restart else load_checkpoint(checkpoint_path, directory)
+    pending = pending_files(directory, checkpoint, retry_failed)
+    existing = set(vector_db_operations.list_documents())
+    counts = {
+        "done": 0, "skipped": 0, "failed": 0,
+        "resumed": sum(1 for name, entry in checkpoint["files"].items()
+                       if entry["status"] in _FINISHED and name not in set(pending))
+    }
+    start = time.perf_counter()
+
+    # tqdm disables itself when stderr is not a terminal, e.g. in CI logs
+    with tqdm(total=len(pending), unit="file", desc="Ingesting",
+              disable=None if show_progress else True) as bar:
+
+        def record(name: str, signature: Dict, status: str, result: Dict):
+            checkpoint["files"][name] = {
+                "status": status,
+                "signature": signature,
+                "chunks": result.get("chunks_added", 0),
+                "message": result.get("message", "")
+            }
+            counts[status] += 1
+            if status == "failed":
+                bar.write(f"Failed: {name}: {result.get('message', '')}")
+
+        def show_stage(stage: str, done: int, total: int):
+            bar.set_postfix_str(f"{stage} {done}/{total}")
+
+        for offset in range(0, len(pending), batch_files):
+            names = pending[offset:offset + batch_files]
+            files, signatures = [], {}
+            for name in names:
+                path = os.path.join(directory, name)
+                signatures[name] = _file_signature(path)
+                with open(path, "rb") as f:
+                    files.append((name, f.read()))
+
+            new_files = [(name, data) for name, data in files if name not in existing]
+            for name, data in files:
+                if name not in existing:
+                    continue
+                if not update:
+                    record(name, signatures[name], "skipped",
+                           {"message": "Already in the knowledge base; pass --update to re-ingest."})
+                    continue
+                show_stage(f"update {name}", 0, 1)
+                result = vector_db_operations.update_document(_Upload(data), name)
+                record(name, signatures[name], "done" if result["success"] else "failed", result)
+
+            if new_files:
+                report = ingestion_pipeline.ingest(new_files, progress_callback=show_stage)
+                for name, _ in new_files:
+                    result = report["results"].get(name, {"success": False, "message": "File was not processed."})
+                    record(name, signatures[name], "done" if result["success"] else "failed", result)
+                    if result["success"]:
+                        existing.add(name)
+
+            save_checkpoint(checkpoint_path, checkpoint)
+            bar.update(len(names))
+
+    counts["seconds"] = round(time.perf_counter() - start, 2)
+    logger.info(f"Directory ingestion of {directory} finished: {counts}")
+    return counts
+
+
+def _report_stages(traces_path: Optional[str]) -> None:
+    """Print the latency of every ingestion stage and optionally export the traces."""
+    from utils.tracing import tracer
+
+    for name, stats in tracer.summary().items():
+        if name.startswith("ingest."):
+            print(f"{name}: {stats['count']} runs, mean {stats['mean_ms']:.1f} ms, "
+                  f"p95 {stats['p95_ms']:.1f} ms, max {stats['max_ms']:.1f} ms")
+    if traces_path:
+        tracer.export(traces_path)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Ingest a directory of PDFs into the knowledge base")
+    parser.add_argument("directory", help="Directory containing the PDF files")
+    parser.add_argument("--update", action="store_true",
+                        help="Re-ingest files already in the knowledge base, embedding only changed chunks")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Parser processes (default: INGESTION_CONFIG, one per CPU)")
+    parser.add_argument("--embed-concurrency", type=int, default=None,
+                        help="Embedding batches in flight at once")
+    parser.add_argument("--batch-files", type=int, default=INGESTION_CONFIG.get("cli_batch_files", 16),
+                        help="Files per pipeline run; the checkpoint is saved after each")
+    parser.add_argument("--checkpoint", default=INGESTION_CONFIG.get("checkpoint_path", "data/ingest_checkpoint.json"))
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint of a previous run")
+    parser.add_argument("--skip-failed", action="store_true",
+                        help="Do not retry files that failed in a previous run")
+    parser.add_argument("--no-progress", action="store_true", help="Hide the progress bar")
+    parser.add_argument("--traces", metavar="PATH",
+                        help="Also export every recorded span and the stage histograms to this JSON file")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.directory):
+        parser.error(f"{args.directory} is not a directory")
+
+    setup_logging()
+    from core.ingestion import ingestion_pipeline
+    if args.workers:
+        ingestion_pipeline.parse_workers = args.workers
+    if args.embed_concurrency:
+        ingestion_pipeline.embed_concurrency = args.embed_concurrency
+
+    try:
+        counts = ingest_directory(
+            args.directory,
+            args.checkpoint,
+            update=args.update,
+            batch_files=max(1, args.batch_files),
+            restart=args.restart,
+            retry_failed=not args.skip_failed,
+            show_progress=not args.no_progress
+        )
+    except KeyboardInterrupt:
+        print(f"\nInterrupted; run the same command again to resume from {args.checkpoint}", file=sys.stderr)
+        return 130
+    finally:
+        _report_stages(args.traces)
+
+    print(f"{counts['done']} ingested, {counts['skipped']} skipped, {counts['failed']} failed, "
+          f"{counts['resumed']} already done in an earlier run ({counts['seconds']}s)")
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
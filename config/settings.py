@@ -17,31 +17,213 @@ PAGE_CONFIG = {
 
 # Model Configuration
 MODEL_CONFIG = {
+    # "openai" (text-embedding-3-small over the API) or "local" (CPU model, see LOCAL_EMBEDDING_CONFIG).
+    # Vectors of different providers are not comparable: re-ingest documents after switching.
+    "embedding_provider": "openai",
     "embedding_model": "text-embedding-3-small",
     "chat_model": "gpt-4o-mini-2024-07-18",
     "temperature": 0.2,
     "streaming": True
 }
 
+# Local Embedding Model Configuration (TF-IDF + SVD fitted on corpus_dir, no downloads)
+LOCAL_EMBEDDING_CONFIG = {
+    "path": "data/local_embedder.npz",
+    "corpus_dir": "Docs",
+    "dimensions": 256,
+    "max_features": 8192,
+    "min_df": 2,
+    "batch_size": 64,
+    "num_threads": None  # None uses one thread per CPU
+}
+
+# Lexical (BM25) Index Configuration, used when retrieval_mode is "hybrid"
+LEXICAL_INDEX_CONFIG = {
+    "path": "data/bm25_index.db",
+    "k1": 1.5,
+    "b": 0.75,
+    "fetch_k": 20,
+    "rrf_k": 60,
+    # Skip the dense search when the top BM25 hit clearly dominates
+    "lexical_fast_path": True,
+    "decisive_min_score": 8.0,
+    "decisive_score_ratio": 1.5
+}
+
+# Document Catalog Configuration
+DOCUMENT_CATALOG_CONFIG = {
+    "path": "data/document_catalog.db"
+}
+
+# Embedding Cache Configuration
+EMBEDDING_CACHE_CONFIG = {
+    "enabled": True,
+    "path": "data/embedding_cache.db",
+    "max_entries": 200000,
+    "cache_queries": True
+}
+
 # Vector Store Configuration
 VECTOR_STORE_CONFIG = {
+    # "embedded" opens db_path in this process; "http" connects to a Chroma server shared by
+    # all app and API worker processes (e.g. `chroma run --path data/chroma_db --port 8001`)
+    "mode": "embedded",
     "db_path": "data/chroma_db",
+    "collection_name": "langchain",
+    "server_host": "localhost",
+    "server_port": 8001,
+    "server_ssl": False,
+    "server_timeout_seconds": 30.0,
+    "server_connect_timeout_seconds": 5.0,
+    "server_max_connections": 20,  # Per process
+    "server_max_keepalive": 10,
+    "server_retries": 3,
+    # "dense" (vector only) or "hybrid" (BM25 + vector, opt-in until its retrieval quality is evaluated)
+    "retrieval_mode": "dense",
+    # Dense search backend: "chroma" (HNSW) or "mmap" (exact search over a memory-mapped matrix
+    # exported from Chroma, shared read-only between worker processes)
+    "index_backend": "chroma",
+    "mmap_path": "data/vector_index",
+    "mmap_dtype": "float32",  # "float16" halves memory at a small precision cost
     "search_type": "mmr",
     "k": 5,
+    # MMR candidates, reranked from their stored embeddings; raising it (e.g. to 50)
+    # gives MMR a larger pool to diversify from at the cost of fetching more vectors
     "fetch_k": 10,
     "lambda_mult": 0.8
 }
 
+# RAG Engine Configuration
+RAG_ENGINE_CONFIG = {
+    # Upper bound on queries processed concurrently by aprocess_query per event loop
+    "max_concurrent_queries": 32
+}
+
+# HTTP API Configuration (python -m api)
+API_CONFIG = {
+    "host": "0.0.0.0",
+    "port": 8000,
+    "workers": 2,
+    # Proxies whose X-Forwarded-* headers are trusted
+    "forwarded_allow_ips": "127.0.0.1",
+    "keep_alive_seconds": 5,
+    "max_upload_mb": 50
+}
+
+# Tracing Configuration
+TRACING_CONFIG = {
+    "enabled": True,
+    # Most recent spans kept in memory for export
+    "max_spans": 10000,
+    "export_path": "logs/traces.json"
+}
+
+# Context Assembly Configuration
+CONTEXT_CONFIG = {
+    # Token budget for the retrieved context section of the prompt
+    "max_tokens": 3000,
+    # Chunks of the same file at most this many characters apart are joined into one span
+    "merge_gap": 1
+}
+
+# Prompt Token Budget Configuration
+# The system prompt and the question always fit. Context is guaranteed
+# min_context_tokens, history then gets up to max_history_tokens (newest turns
+# first, each message cut to max_message_tokens), and whatever is left goes to
+# context up to CONTEXT_CONFIG["max_tokens"].
+PROMPT_BUDGET_CONFIG = {
+    "max_prompt_tokens": 6000,
+    "max_query_tokens": 500,
+    "min_context_tokens": 1000,
+    "max_history_tokens": 1500,
+    "max_message_tokens": 400
+}
+
+# Answer Cache Configuration
+ANSWER_CACHE_CONFIG = {
+    "enabled": True,
+    "similarity_threshold": 0.95,
+    "max_entries": 1000,
+    "ttl_seconds": 86400,
+    "replay_chunk_words": 3
+}
+
+# Retrieval Result Cache Configuration
+# Entries are keyed by the index version, so adding, updating or deleting a
+# document invalidates them exactly; no TTL is needed.
+RETRIEVAL_CACHE_CONFIG = {
+    "enabled": True,
+    "max_entries": 2048
+}
+
+# Query Reformulation Configuration
+# mode "always" calls the reformulation model on every turn; "conditional" only
+# does so for non-English input or follow-ups that reference earlier turns.
+# Openers only count at the start of a query and pronouns only when used as a
+# reference (leading the query or not followed by a noun); phrases count anywhere.
+REFORMULATION_CONFIG = {
+    "mode": "conditional",
+    "max_short_words": 3,
+    "follow_up_openers": [
+        "what about", "how about", "what else", "and", "also", "then", "more", "but", "same"
+    ],
+    "follow_up_pronouns": [
+        "it", "it's", "its", "this", "that", "these", "those", "they", "them", "their",
+        "he", "she", "him", "his", "her"
+    ],
+    "follow_up_phrases": [
+        "the above", "the previous", "the same", "you said", "you mentioned"
+    ]
+}
+
+# Bulk Ingestion Configuration
+INGESTION_CONFIG = {
+    "parse_workers": None,  # None uses one worker per CPU
+    "embed_batch_size": 64,
+    "embed_concurrency": 4,
+    "insert_batch_size": 500,
+    # Command-line ingestion: files per pipeline run, checkpointed after each run
+    "cli_batch_files": 16,
+    "checkpoint_path": "data/ingest_checkpoint.json"
+}
+
 # Memory Configuration
 MEMORY_CONFIG = {
     "window_size": 6,
     "return_messages": True,
+    # Per-chat memory pool limits
+    "max_sessions": 500,
+    "ttl_seconds": 3600,
+    "max_total_chars": 20_000_000,
+    # Rebuild evicted sessions from the chat store on next use
+    "rehydrate": True,
 }
 
 # File Paths
-CHAT_HISTORY_FILE = "data/chat_history.json"
+CHAT_HISTORY_FILE = "data/chat_history.json"  # Legacy store, migrated once into CHAT_STORE_CONFIG
 LOG_FILE = "logs/rag_chatbot.log"
 
+# Chat Store Configuration
+# backend "sqlite" (WAL mode) or "jsonl" (segmented JSONL with per-chat offset index)
+CHAT_STORE_CONFIG = {
+    "backend": "sqlite",
+    "sqlite_path": "data/chat_history.db",
+    "jsonl_dir": "data/chat_store",
+    "partition": "day",  # JSONL segments per "day", per "chat", or by "size" only
+    "segment_max_bytes": 16 * 1024 * 1024,
+    # Background maintenance; None disables the respective step
+    "retention_days": None,  # History idle for longer is archived (or deleted)
+    "compact_after_days": 2,  # JSONL segments untouched for longer are gzipped
+    "archive_dir": "data/chat_archive",  # None deletes expired history instead
+    "maintenance_interval_hours": 6
+}
+
+# Feedback Configuration
+# Append-only JSONL log of thumbs up/down events keyed by (chat_id, message_id)
+FEEDBACK_CONFIG = {
+    "path": "data/feedback.jsonl"
+}
+
 # API Keys
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
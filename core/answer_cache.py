@@ -0,0 +1,139 @@
+"""
+Semantic answer cache for repeated student queries
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+from config.settings import ANSWER_CACHE_CONFIG
+from utils.logger import get_logger
+from utils.registry import lazy_service
+
+logger = get_logger(__name__)
+
+
+class SemanticAnswerCache:
+    """
+    Caches final answers keyed by standalone query embedding and response language.
+
+    Entries are stamped with the document index version they were answered
+    against. The version lives in the document catalog, so documents added or
+    deleted by any process (another API worker, the ingestion CLI) invalidate
+    the answers here too; entries of older versions are dropped once a newer
+    version is seen.
+    """
+
+    def __init__(self):
+        self.enabled = ANSWER_CACHE_CONFIG.get("enabled", False)
+        self.similarity_threshold = ANSWER_CACHE_CONFIG.get("similarity_threshold", 0.95)
+        self.max_entries = ANSWER_CACHE_CONFIG.get("max_entries", 1000)
+        self.ttl_seconds = ANSWER_CACHE_CONFIG.get("ttl_seconds", 0)
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[int, Dict]" = OrderedDict()
+        self._next_id = 0
+        self._index_version = 0
+        self._lock = threading.Lock()
+        logger.info("Semantic answer cache initialized.")
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        """Return the vector as a unit-length float32 array."""
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        return array / norm if norm else array
+
+    def _observe_version(self, index_version: int) -> None:
+        """Drop every entry once a newer index version appears. Caller holds the lock."""
+        if index_version > self._index_version:
+            if self._entries:
+                logger.info(f"Answer cache invalidated by index version {index_version} "
+                            f"({len(self._entries)} entries dropped)")
+            self._entries.clear()
+            self._index_version = index_version
+
+    def _is_expired(self, entry: Dict, now: float) -> bool:
+        """Check whether an entry is older than the configured TTL."""
+        return bool(self.ttl_seconds) and now - entry["created_at"] > self.ttl_seconds
+
+    def lookup(self, query_vector: List[float], language: str, index_version: int) -> Optional[str]:
+        """
+        Return the cached answer whose query is most similar to query_vector,
+        provided it was answered in the same language against the same index
+        version and clears the threshold.
+        """
+        if not self.enabled:
+            return None
+
+        vector = self._normalize(query_vector)
+        language_key = (language or "").strip().lower()
+        now = time.time()
+
+        with self._lock:
+            self._observe_version(index_version)
+            candidates = [
+                (entry_id, entry) for entry_id, entry in self._entries.items()
+                if entry["language"] == language_key and entry["index_version"] == index_version
+                and not self._is_expired(entry, now)
+            ]
+            if candidates:
+                matrix = np.stack([entry["vector"] for _, entry in candidates])
+                scores = matrix @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.similarity_threshold:
+                    entry_id, entry = candidates[best]
+                    self._entries.move_to_end(entry_id)
+                    self.hits += 1
+                    logger.info(f"Answer cache hit (similarity {scores[best]:.3f})")
+                    return entry["answer"]
+            self.misses += 1
+        return None
+
+    def store(self, query_vector: List[float], language: str, answer: str, index_version: int) -> None:
+        """
+        Store an answer given against index_version, the version read before
+        retrieval, evicting the least recently used entry when full.
+        """
+        if not self.enabled or not answer.strip():
+            return
+
+        with self._lock:
+            self._observe_version(index_version)
+            # Answered while the knowledge base changed; it may already be stale
+            if index_version < self._index_version:
+                return
+            self._entries[self._next_id] = {
+                "vector": self._normalize(query_vector),
+                "language": (language or "").strip().lower(),
+                "answer": answer,
+                "index_version": index_version,
+                "created_at": time.time()
+            }
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Drop every cached answer, e.g. after the knowledge base changes."""
+        with self._lock:
+            count = len(self._entries)
+            self._entries.clear()
+        if count:
+            logger.info(f"Answer cache invalidated ({count} entries dropped)")
+
+    def stats(self) -> Dict:
+        """Return hit/miss counters and the current number of cached answers."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "index_version": self._index_version
+        }
+
+
+# Global answer cache instance
+answer_cache = lazy_service("answer_cache", SemanticAnswerCache)
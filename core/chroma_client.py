@@ -0,0 +1,123 @@
+"""
+HTTP client for a shared Chroma server, with pooled connections, timeouts and retries
+"""
+import time
+
+import chromadb
+import httpx
+from chromadb.api.client import Client
+from chromadb.config import Settings
+from config.settings import VECTOR_STORE_CONFIG
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Requests that only read, so a timed-out or rejected attempt can be repeated safely
+_READ_SUFFIXES = ("/get", "/query", "/count", "/heartbeat")
+_RETRY_STATUSES = (502, 503, 504)
+
+
+class RetryTransport(httpx.HTTPTransport):
+    """
+    Pooled transport that retries failed connection attempts for every request,
+    and read requests also on timeouts and 502/503/504, with exponential backoff.
+    """
+
+    def __init__(self, retries: int = 3, backoff_seconds: float = 0.2, **kwargs):
+        super().__init__(retries=retries, **kwargs)
+        self.read_retries = retries
+        self.backoff_seconds = backoff_seconds
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        retryable = request.method == "GET" or request.url.path.endswith(_READ_SUFFIXES)
+        attempt = 0
+        while True:
+            try:
+                response = super().handle_request(request)
+                if not retryable or response.status_code not in _RETRY_STATUSES or attempt >= self.read_retries:
+                    return response
+                response.close()
+                reason = f"status {response.status_code}"
+            except httpx.TimeoutException as e:
+                if not retryable or attempt >= self.read_retries:
+                    raise
+                reason = type(e).__name__
+            attempt += 1
+            logger.warning(f"Chroma request {request.method} {request.url.path} failed ({reason}); retry {attempt}")
+            time.sleep(self.backoff_seconds * 2 ** (attempt - 1))
+
+
+def _pooled_session(headers: httpx.Headers, verify) -> httpx.Client:
+    """An httpx.Client with a bounded keep-alive pool, timeouts and retries from VECTOR_STORE_CONFIG."""
+    return httpx.Client(
+        transport=RetryTransport(
+            retries=VECTOR_STORE_CONFIG.get("server_retries", 3),
+            verify=verify,
+            limits=httpx.Limits(
+                max_connections=VECTOR_STORE_CONFIG.get("server_max_connections", 20),
+                max_keepalive_connections=VECTOR_STORE_CONFIG.get("server_max_keepalive", 10)
+            )
+        ),
+        timeout=httpx.Timeout(
+            VECTOR_STORE_CONFIG.get("server_timeout_seconds", 30.0),
+            connect=VECTOR_STORE_CONFIG.get("server_connect_timeout_seconds", 5.0)
+        ),
+        headers=headers
+    )
+
+
+def _install_pooled_session(server) -> None:
+    """Replace the untimed session of Chroma's HTTP API client with a pooled one."""
+    session = getattr(server, "_session", None)
+    if not isinstance(session, httpx.Client):
+        raise RuntimeError(
+            f"chromadb {chromadb.__version__} does not keep an httpx session on its HTTP client; "
+            "core/chroma_client.py needs updating for this version"
+        )
+    headers = session.headers
+    # Request bodies are pre-serialised JSON bytes; newer servers need the content type to parse them
+    headers["Content-Type"] = "application/json"
+    verify = server._settings.chroma_server_ssl_verify
+    session.close()
+    server._session = _pooled_session(headers, True if verify is None else verify)
+
+
+class _PooledClient(Client):
+    """
+    Chroma client whose HTTP session is swapped for a pooled one right before the
+    identity check, the first request __init__ makes, so connecting is already
+    bounded by the timeouts and covered by the retries.
+    """
+
+    def get_user_identity(self):
+        if not getattr(self._server, "_pooled", False):
+            _install_pooled_session(self._server)
+            self._server._pooled = True
+        # The base class turns every failure, timeouts included, into a ValueError
+        try:
+            return self._server.get_user_identity()
+        except httpx.TransportError as e:
+            raise ConnectionError(f"Chroma server at {self._server._api_url} is not reachable: {e}") from e
+
+
+def create_http_client():
+    """Connect to the Chroma server configured in VECTOR_STORE_CONFIG."""
+    host = VECTOR_STORE_CONFIG.get("server_host", "localhost")
+    port = VECTOR_STORE_CONFIG.get("server_port", 8001)
+    settings = Settings(
+        chroma_api_impl="chromadb.api.fastapi.FastAPI",
+        chroma_server_host=host,
+        chroma_server_http_port=port,
+        chroma_server_ssl_enabled=VECTOR_STORE_CONFIG.get("server_ssl", False)
+    )
+    try:
+        client = _PooledClient(settings=settings)
+    except httpx.TransportError as e:
+        raise ConnectionError(f"Chroma server at {host}:{port} is not reachable: {e}") from e
+    if not getattr(client._server, "_pooled", False):
+        raise RuntimeError(
+            f"chromadb {chromadb.__version__} no longer checks the user identity on connect; "
+            "core/chroma_client.py needs updating for this version"
+        )
+    logger.info(f"Connected to Chroma server at {host}:{port}")
+    return client
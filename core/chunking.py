@@ -0,0 +1,58 @@
+"""
+Incremental splitting of text that arrives in pieces, e.g. page by page
+"""
+from typing import Dict, List, Optional
+from langchain.docstore.document import Document
+from langchain.text_splitter import TextSplitter
+
+
+class StreamingTextSplitter:
+    """
+    Splits a stream of text into chunks without holding the whole text.
+
+    Text is buffered until a window of window_chars is available; the window is
+    split with the wrapped splitter and every chunk but the last is emitted.
+    The last chunk may be cut off by the window edge, so splitting resumes at
+    its start once more text has arrived. Windows are taken at fixed positions
+    of the stream, so the chunks do not depend on how the text was cut into
+    pieces. start_index metadata refers to the position in the whole stream.
+    """
+
+    def __init__(self, text_splitter: TextSplitter, metadata: Optional[Dict] = None,
+                 window_chars: Optional[int] = None):
+        self.text_splitter = text_splitter
+        self.metadata = dict(metadata or {})
+        self.window_chars = window_chars or 8 * text_splitter._chunk_size
+        self._buffer = ""
+        # Position of the first buffered character in the whole stream
+        self._offset = 0
+
+    def _split(self, text: str) -> List[Document]:
+        chunks = self.text_splitter.create_documents([text], [self.metadata])
+        for chunk in chunks:
+            chunk.metadata["start_index"] = chunk.metadata.get("start_index", 0) + self._offset
+        return chunks
+
+    def feed(self, text: str) -> List[Document]:
+        """Add text to the stream and return the chunks that are now final."""
+        self._buffer += text
+        ready: List[Document] = []
+        while len(self._buffer) >= self.window_chars:
+            chunks = self._split(self._buffer[:self.window_chars])
+            resume = chunks[-1].metadata["start_index"] - self._offset if chunks else -1
+            if len(chunks) < 2 or resume <= 0:
+                # No safe resume point; emit the window as split
+                ready.extend(chunks)
+                resume = self.window_chars
+            else:
+                ready.extend(chunks[:-1])
+            self._buffer = self._buffer[resume:]
+            self._offset += resume
+        return ready
+
+    def finish(self) -> List[Document]:
+        """Split and return whatever text is still buffered."""
+        chunks = self._split(self._buffer) if self._buffer.strip() else []
+        self._offset += len(self._buffer)
+        self._buffer = ""
+        return chunks
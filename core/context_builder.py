@@ -0,0 +1,102 @@
+"""
+Overlap-aware assembly of retrieved chunks into prompt context
+"""
+from typing import Dict, List, Optional
+from langchain.docstore.document import Document
+from utils.token_counter import count_tokens, truncate_to_tokens
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Separates non-contiguous spans of the same file
+_SPAN_SEPARATOR = "\n...\n"
+
+
+class _Span:
+    """A contiguous piece of a source document, possibly merged from several chunks."""
+
+    def __init__(self, start: Optional[int], text: str, rank: int):
+        self.start = start
+        self.end = start + len(text) if start is not None else None
+        self.text = text
+        self.rank = rank
+
+    def try_merge(self, other: "_Span", merge_gap: int) -> bool:
+        """Absorb a span that overlaps or directly follows this one."""
+        if self.start is None or other.start is None or other.start > self.end + merge_gap:
+            return False
+        if other.end > self.end:
+            if other.start >= self.end:
+                self.text += " " + other.text
+            else:
+                self.text += other.text[self.end - other.start:]
+            self.end = other.end
+        self.rank = min(self.rank, other.rank)
+        return True
+
+
+def _merge_spans(documents: List[Document], merge_gap: int) -> Dict[str, List[_Span]]:
+    """Group chunks by filename and merge overlapping or adjacent ones using start_index."""
+    grouped: Dict[str, List[_Span]] = {}
+    for rank, doc in enumerate(documents):
+        metadata = getattr(doc, "metadata", {}) or {}
+        filename = metadata.get("filename", "Unknown Document")
+        grouped.setdefault(filename, []).append(_Span(metadata.get("start_index"), doc.page_content, rank))
+
+    merged: Dict[str, List[_Span]] = {}
+    for filename, spans in grouped.items():
+        positioned = sorted((s for s in spans if s.start is not None), key=lambda s: s.start)
+        result: List[_Span] = []
+        for span in positioned:
+            if not result or not result[-1].try_merge(span, merge_gap):
+                result.append(span)
+        # Chunks without a start_index cannot be placed, so keep them as-is
+        result.extend(s for s in spans if s.start is None)
+        merged[filename] = result
+    return merged
+
+
+def assemble_context(documents: List[Document], max_tokens: int, merge_gap: int = 1) -> str:
+    """
+    Build the context section of the prompt from retrieved chunks.
+
+    Chunks of the same file are merged where they overlap or touch, so shared
+    text appears once under a single "Source:" header. The token budget is
+    handed out to spans in rank order, so the best-ranked chunks are always
+    kept; the chosen spans are then emitted grouped by file, files in the
+    order of their best-ranked chunk and spans in document order.
+    """
+    merged = _merge_spans(documents, merge_gap)
+    separator_tokens = count_tokens(_SPAN_SEPARATOR)
+    file_separator_tokens = count_tokens("\n\n")
+
+    chosen: Dict[int, str] = {}
+    remaining = max_tokens
+    started_files = set()
+    for filename, span in sorted(((f, s) for f, spans in merged.items() for s in spans),
+                                 key=lambda item: item[1].rank):
+        if filename in started_files:
+            overhead = separator_tokens
+        else:
+            overhead = count_tokens(f"Source: {filename}\n") + (file_separator_tokens if started_files else 0)
+        budget = remaining - overhead
+        if budget <= 0:
+            break
+        span_tokens = count_tokens(span.text)
+        text = span.text if span_tokens <= budget else truncate_to_tokens(span.text, budget)
+        chosen[id(span)] = text
+        started_files.add(filename)
+        remaining = budget - min(span_tokens, budget)
+        if span_tokens > budget:
+            break
+
+    parts: List[str] = []
+    for filename in sorted(merged, key=lambda f: min(s.rank for s in merged[f])):
+        body_parts = [chosen[id(span)] for span in merged[filename] if id(span) in chosen]
+        if body_parts:
+            parts.append(f"Source: {filename}\n" + _SPAN_SEPARATOR.join(body_parts))
+
+    input_chars = sum(len(doc.page_content) for doc in documents)
+    context = "\n\n".join(parts)
+    logger.info(f"Assembled context from {len(documents)} chunks: {input_chars} -> {len(context)} chars")
+    return context
@@ -0,0 +1,152 @@
+"""
+Document catalog: a manifest of the documents stored in the vector store
+"""
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+from config.settings import DOCUMENT_CATALOG_CONFIG
+from utils.logger import get_logger
+from utils.registry import lazy_service
+
+logger = get_logger(__name__)
+
+
+class CatalogTransaction:
+    """Catalog writes staged inside DocumentCatalog.transaction()."""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self._conn = conn
+
+    def upsert(self, filename: str, chunk_count: int, byte_size: int = 0,
+               content_hash: str = "", ingested_at: Optional[str] = None) -> None:
+        """Insert or replace the catalog entry of a document."""
+        self._conn.execute(
+            "INSERT OR REPLACE INTO documents (filename, chunk_count, byte_size, ingested_at, content_hash) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (filename, chunk_count, byte_size, ingested_at or datetime.now().isoformat(), content_hash)
+        )
+
+    def remove(self, filename: str) -> None:
+        """Remove the catalog entry of a document."""
+        self._conn.execute("DELETE FROM documents WHERE filename = ?", (filename,))
+
+
+class DocumentCatalog:
+    """SQLite-backed manifest of filename, chunk count, byte size, ingest time and content hash."""
+
+    def __init__(self):
+        self.path = DOCUMENT_CATALOG_CONFIG["path"]
+        self._lock = threading.RLock()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS documents (
+                filename TEXT PRIMARY KEY,
+                chunk_count INTEGER NOT NULL,
+                byte_size INTEGER NOT NULL,
+                ingested_at TEXT NOT NULL,
+                content_hash TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            """
+        )
+        logger.info(f"Document catalog opened at: {self.path}")
+
+    @contextmanager
+    def transaction(self) -> Iterator[CatalogTransaction]:
+        """
+        Stage catalog writes that must only persist if the surrounding vector
+        store operation succeeds; any exception rolls them back.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield CatalogTransaction(self._conn)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def list_filenames(self) -> List[str]:
+        """Return the sorted filenames of all cataloged documents."""
+        with self._lock:
+            rows = self._conn.execute("SELECT filename FROM documents ORDER BY filename").fetchall()
+        return [row[0] for row in rows]
+
+    def get(self, filename: str) -> Optional[Dict]:
+        """Return the catalog entry of a document, or None if it is not cataloged."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT filename, chunk_count, byte_size, ingested_at, content_hash "
+                "FROM documents WHERE filename = ?", (filename,)
+            ).fetchone()
+        if not row:
+            return None
+        return dict(zip(("filename", "chunk_count", "byte_size", "ingested_at", "content_hash"), row))
+
+    def contains(self, filename: str) -> bool:
+        """Check whether a document is cataloged."""
+        return self.get(filename) is not None
+
+    def stats(self) -> Dict:
+        """Return the number of documents and the total number of chunks."""
+        with self._lock:
+            documents, chunks = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(chunk_count), 0) FROM documents"
+            ).fetchone()
+        return {"total_documents": documents, "total_chunks": chunks}
+
+    def index_version(self) -> int:
+        """Return the version of the indexed content, which changes whenever documents do."""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'index_version'").fetchone()
+        return int(row[0]) if row else 0
+
+    def bump_index_version(self) -> int:
+        """
+        Advance the index version after documents were added, updated or deleted.
+        The counter lives in the database, so every process sharing it sees the change.
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('index_version', '1') "
+                "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+            )
+            version = self.index_version()
+        logger.info(f"Index version advanced to {version}")
+        return version
+
+    def is_bootstrapped(self) -> bool:
+        """Check whether the catalog has been built from the existing collection."""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'bootstrapped'").fetchone()
+        return row is not None
+
+    def bootstrap(self, metadatas: List[Optional[Dict]]) -> None:
+        """
+        Build the catalog once from the chunk metadata of an existing collection.
+        Byte size and content hash are unknown for documents ingested before the catalog existed.
+        """
+        counts: Dict[str, int] = {}
+        for metadata in metadatas:
+            if metadata and "filename" in metadata:
+                counts[metadata["filename"]] = counts.get(metadata["filename"], 0) + 1
+
+        with self.transaction() as txn:
+            for filename, chunk_count in counts.items():
+                txn.upsert(filename, chunk_count)
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('bootstrapped', ?)",
+                               (datetime.now().isoformat(),))
+        logger.info(f"Document catalog bootstrapped with {len(counts)} documents")
+
+
+# Global document catalog instance
+document_catalog = lazy_service("document_catalog", DocumentCatalog)
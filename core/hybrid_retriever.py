@@ -0,0 +1,93 @@
+"""
+Hybrid lexical + dense retriever using reciprocal rank fusion
+"""
+import asyncio
+import hashlib
+from typing import Any, Dict, List
+
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def _document_key(doc: Document) -> str:
+    """Identify a chunk independently of which retriever returned it."""
+    metadata = doc.metadata or {}
+    if "start_index" in metadata:
+        return f"{metadata.get('filename', '')}:{metadata['start_index']}"
+    return hashlib.sha256(doc.page_content.encode("utf-8")).hexdigest()
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Fuses BM25 and dense retrieval results with reciprocal rank fusion.
+
+    When lexical_fast_path is enabled and the best BM25 hit clearly beats the
+    runner-up, the lexical results are returned directly and the dense
+    retriever (and its embedding call) is skipped.
+    """
+
+    dense_retriever: BaseRetriever
+    lexical_index: Any
+    k: int = 5
+    lexical_fetch_k: int = 20
+    rrf_k: int = 60
+    lexical_fast_path: bool = True
+    decisive_min_score: float = 8.0
+    decisive_score_ratio: float = 1.5
+
+    def _is_decisive(self, hits: List) -> bool:
+        """Check whether the lexical ranking alone is confident enough."""
+        if not hits or hits[0][1] < self.decisive_min_score:
+            return False
+        if len(hits) == 1:
+            return True
+        return hits[0][1] >= self.decisive_score_ratio * hits[1][1]
+
+    def _lexical_search(self, query: str):
+        """Return the BM25 hits and their documents."""
+        hits = self.lexical_index.search(query, self.lexical_fetch_k)
+        lexical_docs = [doc for doc in (self.lexical_index.get_document(doc_id) for doc_id, _ in hits) if doc]
+        return hits, lexical_docs
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        hits, lexical_docs = self._lexical_search(query)
+
+        if self.lexical_fast_path and self._is_decisive(hits):
+            logger.info(f"Lexical fast path used (top BM25 score {hits[0][1]:.2f})")
+            return lexical_docs[:self.k]
+
+        dense_docs = self.dense_retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+        return self._fuse(dense_docs, lexical_docs)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        # BM25 scoring is CPU-bound and may reload the index from disk
+        hits, lexical_docs = await asyncio.to_thread(self._lexical_search, query)
+
+        if self.lexical_fast_path and self._is_decisive(hits):
+            logger.info(f"Lexical fast path used (top BM25 score {hits[0][1]:.2f})")
+            return lexical_docs[:self.k]
+
+        dense_docs = await self.dense_retriever.ainvoke(query, config={"callbacks": run_manager.get_child()})
+        return self._fuse(dense_docs, lexical_docs)
+
+    def _fuse(self, dense_docs: List[Document], lexical_docs: List[Document]) -> List[Document]:
+        """Merge the dense and lexical rankings."""
+        # Reciprocal rank fusion over both rankings
+        scores: Dict[str, float] = {}
+        documents: Dict[str, Document] = {}
+        for ranking in (dense_docs, lexical_docs):
+            for rank, doc in enumerate(ranking):
+                key = _document_key(doc)
+                scores[key] = scores.get(key, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+                documents.setdefault(key, doc)
+
+        fused = sorted(scores, key=scores.get, reverse=True)[:self.k]
+        return [documents[key] for key in fused]
@@ -0,0 +1,288 @@
+"""
+Parallel, batched PDF ingestion pipeline
+"""
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Tuple
+
+from langchain.docstore.document import Document
+from config.settings import INGESTION_CONFIG
+from core.answer_cache import answer_cache
+from core.document_catalog import document_catalog
+from core.pdf_parsing import extract_pdf_text
+from core.vector_operations import vector_db_operations
+from core.vector_store import vector_store_manager
+from utils.logger import get_logger
+from utils.registry import lazy_service
+from utils.tracing import tracer
+
+logger = get_logger(__name__)
+
+ProgressCallback = Callable[[str, int, int], None]
+
+
+class _StageTimer:
+    """Accumulates wall time and item counts for one pipeline stage."""
+
+    def __init__(self, unit: str):
+        self.unit = unit
+        self.seconds = 0.0
+        self.items = 0
+
+    def to_dict(self) -> Dict:
+        return {
+            "seconds": round(self.seconds, 3),
+            "items": self.items,
+            "unit": self.unit,
+            "per_second": round(self.items / self.seconds, 2) if self.seconds else 0.0
+        }
+
+
+class IngestionPipeline:
+    """
+    Ingests many PDFs at once: parses them in a process pool, embeds chunks from
+    all files in fixed-size batches with bounded concurrency, and bulk-inserts
+    the precomputed vectors into Chroma.
+    """
+
+    def __init__(self, operations=vector_db_operations):
+        self.operations = operations
+        self.parse_workers = INGESTION_CONFIG.get("parse_workers") or os.cpu_count() or 1
+        self.embed_batch_size = INGESTION_CONFIG.get("embed_batch_size", 64)
+        self.embed_concurrency = INGESTION_CONFIG.get("embed_concurrency", 4)
+        self.insert_batch_size = INGESTION_CONFIG.get("insert_batch_size", 500)
+
+    def _parse(self, files: List[Tuple[str, bytes]], timer: _StageTimer,
+               progress: ProgressCallback) -> Dict[str, Tuple[Optional[str], str]]:
+        """Extract text from every file, returning filename -> (text or None, error)."""
+        parsed: Dict[str, Tuple[Optional[str], str]] = {}
+        start = time.perf_counter()
+
+        if self.parse_workers > 1 and len(files) > 1:
+            # "spawn" keeps workers from inheriting Chroma/SQLite handles of this process
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=min(self.parse_workers, len(files)),
+                                     mp_context=context) as pool:
+                futures = {pool.submit(extract_pdf_text, data): filename for filename, data in files}
+                for done, future in enumerate(as_completed(futures), 1):
+                    filename = futures[future]
+                    try:
+                        text, pages = future.result()
+                        parsed[filename] = (text, "")
+                        timer.items += pages
+                    except Exception as e:
+                        logger.error(f"Error parsing {filename}: {e}")
+                        parsed[filename] = (None, f"Error processing PDF: {str(e)}")
+                    progress("parse", done, len(files))
+        else:
+            for done, (filename, data) in enumerate(files, 1):
+                try:
+                    text, pages = extract_pdf_text(data)
+                    parsed[filename] = (text, "")
+                    timer.items += pages
+                except Exception as e:
+                    logger.error(f"Error parsing {filename}: {e}")
+                    parsed[filename] = (None, f"Error processing PDF: {str(e)}")
+                progress("parse", done, len(files))
+
+        timer.seconds += time.perf_counter() - start
+        return parsed
+
+    def _embed(self, chunks: List[Document], timer: _StageTimer,
+               progress: ProgressCallback) -> List[List[float]]:
+        """Embed all chunks in fixed-size batches, several batches in flight at once."""
+        start = time.perf_counter()
+        texts = [chunk.page_content for chunk in chunks]
+        batches = [texts[i:i + self.embed_batch_size] for i in range(0, len(texts), self.embed_batch_size)]
+        vectors: List[List[float]] = []
+
+        with ThreadPoolExecutor(max_workers=max(1, self.embed_concurrency)) as pool:
+            # map preserves batch order, so vectors line up with chunks
+            for done, batch_vectors in enumerate(
+                    pool.map(vector_store_manager.embeddings.embed_documents, batches), 1):
+                vectors.extend(batch_vectors)
+                progress("embed", done, len(batches))
+
+        timer.items += len(texts)
+        timer.seconds += time.perf_counter() - start
+        return vectors
+
+    def _insert(self, file_chunks: Dict[str, List[Document]], vectors: Dict[str, List[List[float]]],
+                file_bytes: Dict[str, bytes], timer: _StageTimer,
+                progress: ProgressCallback) -> Dict[str, str]:
+        """
+        Bulk-insert chunks into Chroma, packing whole files into batches of up to
+        insert_batch_size chunks, and catalog each batch in the same transaction.
+        Returns filename -> error for files that failed.
+        """
+        start = time.perf_counter()
+        collection = vector_store_manager.vector_store._collection
+        errors: Dict[str, str] = {}
+
+        # Greedily pack whole files into insert batches
+        batches: List[List[str]] = []
+        current: List[str] = []
+        current_size = 0
+        for filename, chunks in file_chunks.items():
+            if current and current_size + len(chunks) > self.insert_batch_size:
+                batches.append(current)
+                current, current_size = [], 0
+            current.append(filename)
+            current_size += len(chunks)
+        if current:
+            batches.append(current)
+
+        for done, filenames in enumerate(batches, 1):
+            ids, embeddings, metadatas, documents = [], [], [], []
+            for filename in filenames:
+                chunks = file_chunks[filename]
+                ids.extend(self.operations.make_chunk_ids(filename, chunks))
+                embeddings.extend(vectors[filename])
+                metadatas.extend(chunk.metadata for chunk in chunks)
+                documents.extend(chunk.page_content for chunk in chunks)
+            try:
+                with document_catalog.transaction() as txn:
+                    for filename in filenames:
+                        data = file_bytes[filename]
+                        txn.upsert(filename, len(file_chunks[filename]), byte_size=len(data),
+                                   content_hash=self.operations.content_hash(data))
+                    # A single file can still exceed the batch size, so slice defensively
+                    for i in range(0, len(ids), self.insert_batch_size):
+                        end = i + self.insert_batch_size
+                        collection.add(ids=ids[i:end], embeddings=embeddings[i:end],
+                                       metadatas=metadatas[i:end], documents=documents[i:end])
+                self.operations.index_lexical(ids, [chunk for filename in filenames for chunk in file_chunks[filename]])
+                self.operations.index_vectors(ids)
+                timer.items += len(ids)
+            except Exception as e:
+                logger.error(f"Error inserting batch of {len(filenames)} files: {e}")
+                try:
+                    collection.delete(ids=ids)
+                except Exception as cleanup_error:
+                    logger.error(f"Error rolling back failed batch: {cleanup_error}")
+                for filename in filenames:
+                    errors[filename] = f"Error inserting chunks: {str(e)}"
+            progress("insert", done, len(batches))
+
+        timer.seconds += time.perf_counter() - start
+        return errors
+
+    def ingest(self, files: List[Tuple[str, bytes]],
+               progress_callback: Optional[ProgressCallback] = None) -> Dict:
+        """
+        Ingest a set of PDF files.
+
+        Args:
+            files: List of (filename, raw PDF bytes)
+            progress_callback: Optional callable(stage, done, total)
+
+        Returns:
+            Dict with per-file results and per-stage throughput
+        """
+        progress = progress_callback or (lambda stage, done, total: None)
+        stages = {
+            "parse": _StageTimer("pages"),
+            "split": _StageTimer("chunks"),
+            "embed": _StageTimer("chunks"),
+            "insert": _StageTimer("chunks")
+        }
+        results: Dict[str, Dict] = {}
+        pipeline_start = time.perf_counter()
+
+        def fail(filename: str, message: str):
+            results[filename] = {"success": False, "message": message, "chunks_added": 0}
+
+        # Nothing to ingest: the same report shape whatever the reason
+        nothing_done = {"results": results, "stages": {}, "total_seconds": 0.0}
+        if not files:
+            return nothing_done
+
+        if not vector_store_manager.is_available() and not vector_store_manager.reinitialize_vector_store():
+            for filename, _ in files:
+                fail(filename, "Vector store is not available and could not be reinitialized. Please check the database connection.")
+            return nothing_done
+
+        # Skip documents that already exist, and duplicates within this batch
+        existing_docs = set(self.operations.list_documents())
+        pending: List[Tuple[str, bytes]] = []
+        for filename, data in files:
+            if filename in existing_docs:
+                fail(filename, f"Document '{filename}' already exists in the vector store. Please delete it first or use a different name.")
+            else:
+                existing_docs.add(filename)
+                pending.append((filename, data))
+        if not pending:
+            logger.info(f"Nothing to ingest: all {len(files)} files already exist")
+            return nothing_done
+
+        parsed = self._parse(pending, stages["parse"], progress)
+
+        # Split each document into chunks
+        split_start = time.perf_counter()
+        file_chunks: Dict[str, List[Document]] = {}
+        for filename, (text, error) in parsed.items():
+            if text is None:
+                fail(filename, error)
+                continue
+            chunks = self.operations.split_text(text, filename)
+            if not chunks:
+                fail(filename, "Failed to create chunks from the document.")
+                continue
+            file_chunks[filename] = chunks
+            stages["split"].items += len(chunks)
+        stages["split"].seconds += time.perf_counter() - split_start
+
+        if file_chunks:
+            # Embed chunks of all files together, then regroup vectors per file
+            all_chunks = [chunk for chunks in file_chunks.values() for chunk in chunks]
+            try:
+                flat_vectors = self._embed(all_chunks, stages["embed"], progress)
+            except Exception as e:
+                logger.error(f"Error embedding chunks: {e}")
+                for filename in file_chunks:
+                    fail(filename, f"Error embedding document: {str(e)}")
+                file_chunks = {}
+                flat_vectors = []
+
+            vectors: Dict[str, List[List[float]]] = {}
+            offset = 0
+            for filename, chunks in file_chunks.items():
+                vectors[filename] = flat_vectors[offset:offset + len(chunks)]
+                offset += len(chunks)
+
+            errors = self._insert(file_chunks, vectors, dict(pending), stages["insert"], progress)
+            for filename, chunks in file_chunks.items():
+                if filename in errors:
+                    fail(filename, errors[filename])
+                else:
+                    results[filename] = {
+                        "success": True,
+                        "message": f"Successfully added '{filename}' to vector store.",
+                        "chunks_added": len(chunks)
+                    }
+
+            # Cached answers and retrieval results may no longer reflect the knowledge base
+            answer_cache.clear()
+            document_catalog.bump_index_version()
+
+        total_seconds = time.perf_counter() - pipeline_start
+        stage_report = {name: timer.to_dict() for name, timer in stages.items()}
+        # Same span names as single-file uploads, so both feed one histogram per stage
+        with tracer.trace(files=len(pending)):
+            for name, timer in stages.items():
+                if timer.items:
+                    tracer.record(f"ingest.{name}", timer.seconds, **{timer.unit: timer.items})
+            tracer.record("ingest.total", total_seconds)
+        logger.info(f"Ingested {len(file_chunks)} of {len(files)} files in {total_seconds:.2f}s: {stage_report}")
+
+        return {
+            "results": results,
+            "stages": stage_report,
+            "total_seconds": round(total_seconds, 3)
+        }
+
+
+# Global ingestion pipeline instance
+ingestion_pipeline = lazy_service("ingestion_pipeline", IngestionPipeline)
@@ -0,0 +1,238 @@
+"""
+BM25 inverted index kept alongside the vector store for exact-term lookups
+"""
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from langchain.docstore.document import Document
+from config.settings import LEXICAL_INDEX_CONFIG
+from utils.logger import get_logger
+from utils.registry import lazy_service
+
+logger = get_logger(__name__)
+
+_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "how", "i",
+    "in", "is", "it", "of", "on", "or", "the", "to", "what", "when", "where",
+    "which", "who", "will", "with", "do", "does", "can", "me", "my", "tell", "about"
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens with common English stopwords removed."""
+    return [token for token in _TOKEN_PATTERN.findall(text.lower()) if token not in _STOPWORDS]
+
+
+class BM25Index:
+    """
+    In-memory BM25 index over chunk texts, persisted in SQLite.
+
+    Chunks are stored one row each and every add or remove appends its chunk ids
+    to a change log, so a write costs O(batch) rather than rewriting the corpus.
+    Other processes (API workers, the ingestion CLI) replay the log entries they
+    have not seen yet before searching; a rebuild advances a generation counter
+    that makes them reload everything instead.
+    """
+
+    def __init__(self):
+        self.path = LEXICAL_INDEX_CONFIG["path"]
+        self.k1 = LEXICAL_INDEX_CONFIG.get("k1", 1.5)
+        self.b = LEXICAL_INDEX_CONFIG.get("b", 0.75)
+        self._lock = threading.RLock()
+        self._documents: Dict[str, Dict] = {}
+        self._term_freqs: Dict[str, Counter] = {}
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._lengths: Dict[str, int] = {}
+        self._total_length = 0
+        self._generation: Optional[int] = None
+        self._last_seq = 0
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS chunks (
+                doc_id TEXT PRIMARY KEY,
+                text TEXT NOT NULL,
+                metadata TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS changes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                doc_id TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            """
+        )
+        self._import_legacy_json()
+        self._sync()
+        logger.info(f"Lexical index loaded with {len(self._documents)} chunks")
+
+    def _import_legacy_json(self) -> None:
+        """Move chunks from the JSON file earlier versions rewrote on every change."""
+        legacy_path = os.path.splitext(self.path)[0] + ".json"
+        if legacy_path == self.path or not os.path.exists(legacy_path):
+            return
+        try:
+            with open(legacy_path, "r", encoding="utf-8") as f:
+                documents = json.load(f).get("documents", {})
+        except (IOError, ValueError) as e:
+            logger.error(f"Failed to read legacy lexical index {legacy_path}: {e}")
+            return
+        with self._transaction() as conn:
+            if conn.execute("SELECT 1 FROM chunks LIMIT 1").fetchone() is None:
+                self._write_chunks(conn, list(documents), [doc["text"] for doc in documents.values()],
+                                   [doc["metadata"] for doc in documents.values()])
+        os.replace(legacy_path, f"{legacy_path}.migrated")
+        logger.info(f"Imported {len(documents)} chunks from legacy lexical index {legacy_path}")
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    @staticmethod
+    def _write_chunks(conn: sqlite3.Connection, ids: List[str], texts: List[str], metadatas: List[Dict]) -> None:
+        conn.executemany(
+            "INSERT OR REPLACE INTO chunks (doc_id, text, metadata) VALUES (?, ?, ?)",
+            [(doc_id, text, json.dumps(dict(metadata or {}), ensure_ascii=False))
+             for doc_id, text, metadata in zip(ids, texts, metadatas)]
+        )
+        conn.executemany("INSERT INTO changes (doc_id) VALUES (?)", [(doc_id,) for doc_id in ids])
+
+    def _index_document(self, doc_id: str, text: str, metadata: Dict) -> None:
+        """Add one document to the in-memory structures."""
+        if doc_id in self._documents:
+            self._unindex_document(doc_id)
+        term_freqs = Counter(tokenize(text))
+        self._documents[doc_id] = {"text": text, "metadata": metadata}
+        self._term_freqs[doc_id] = term_freqs
+        self._lengths[doc_id] = sum(term_freqs.values())
+        self._total_length += self._lengths[doc_id]
+        for term, count in term_freqs.items():
+            self._postings.setdefault(term, {})[doc_id] = count
+
+    def _unindex_document(self, doc_id: str) -> None:
+        """Remove one document from the in-memory structures."""
+        term_freqs = self._term_freqs.pop(doc_id, Counter())
+        self._documents.pop(doc_id, None)
+        self._total_length -= self._lengths.pop(doc_id, 0)
+        for term in term_freqs:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+
+    def _sync(self) -> None:
+        """Apply the changes written by any process since the last sync."""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+            generation = row[0] if row else 0
+            if generation != self._generation:
+                self._reload(generation)
+                return
+            rows = self._conn.execute(
+                "SELECT changes.seq, changes.doc_id, chunks.text, chunks.metadata FROM changes "
+                "LEFT JOIN chunks ON chunks.doc_id = changes.doc_id WHERE changes.seq > ? ORDER BY changes.seq",
+                (self._last_seq,)
+            ).fetchall()
+            for seq, doc_id, text, metadata in rows:
+                if text is None:
+                    self._unindex_document(doc_id)
+                else:
+                    self._index_document(doc_id, text, json.loads(metadata))
+                self._last_seq = seq
+
+    def _reload(self, generation: int) -> None:
+        """Rebuild the in-memory structures from every stored chunk. Caller holds the lock."""
+        self._documents, self._term_freqs, self._postings, self._lengths = {}, {}, {}, {}
+        self._total_length = 0
+        self._conn.execute("BEGIN")
+        try:
+            self._last_seq = self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+            for doc_id, text, metadata in self._conn.execute("SELECT doc_id, text, metadata FROM chunks"):
+                self._index_document(doc_id, text, json.loads(metadata))
+        finally:
+            self._conn.execute("COMMIT")
+        self._generation = generation
+
+    def add(self, ids: List[str], texts: List[str], metadatas: List[Dict]) -> None:
+        """Index a batch of chunks and persist them."""
+        with self._transaction() as conn:
+            self._write_chunks(conn, ids, texts, metadatas)
+        self._sync()
+
+    def remove(self, ids: List[str]) -> None:
+        """Remove a batch of chunks from the index and its storage."""
+        with self._transaction() as conn:
+            conn.executemany("DELETE FROM chunks WHERE doc_id = ?", [(doc_id,) for doc_id in ids])
+            conn.executemany("INSERT INTO changes (doc_id) VALUES (?)", [(doc_id,) for doc_id in ids])
+        self._sync()
+
+    def rebuild(self, ids: List[str], texts: List[str], metadatas: List[Dict]) -> None:
+        """Replace the whole index, e.g. from the contents of the vector store."""
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM chunks")
+            conn.execute("DELETE FROM changes")
+            self._write_chunks(conn, ids, texts, metadatas)
+            # The change log was cut, so every process has to reload from scratch
+            conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('generation', 1) "
+                "ON CONFLICT(key) DO UPDATE SET value = value + 1"
+            )
+        self._sync()
+        logger.info(f"Lexical index rebuilt with {len(ids)} chunks")
+
+    def __len__(self) -> int:
+        self._sync()
+        return len(self._documents)
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        """Return the top-k (chunk id, BM25 score) pairs for a query."""
+        with self._lock:
+            self._sync()
+            total_docs = len(self._documents)
+            if not total_docs:
+                return []
+            avg_length = self._total_length / total_docs or 1.0
+
+            scores: Dict[str, float] = {}
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (total_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    norm = tf + self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / avg_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def get_document(self, doc_id: str) -> Optional[Document]:
+        """Return the stored chunk as a Document."""
+        doc = self._documents.get(doc_id)
+        if doc is None:
+            return None
+        return Document(page_content=doc["text"], metadata=dict(doc["metadata"]))
+
+
+# Global lexical index instance
+lexical_index = lazy_service("lexical_index", BM25Index)
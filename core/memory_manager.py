@@ -1,66 +1,232 @@
 """
-Simplified Memory management for single chat interface
+Per-session memory management keyed by chat_id
 """
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
 from langchain.memory import ConversationBufferWindowMemory
 from config.settings import MEMORY_CONFIG
 from utils.logger import get_logger
+from utils.registry import lazy_service
 
 logger = get_logger(__name__)
 
+# Session used by callers that do not pass a chat_id
+DEFAULT_SESSION = "default"
+
+
+class _Session:
+    """A conversation memory together with its bookkeeping."""
+
+    def __init__(self, memory: ConversationBufferWindowMemory):
+        self.memory = memory
+        self.last_access = time.time()
+        self.size_chars = 0
+        # Chat store history revision the window reflects, when known
+        self.revision: Optional[str] = None
+
+
 class SimplifiedMemoryManager:
-    """Simplified memory manager for single chat interface."""
-    
+    """
+    Pool of conversation memories, one per chat_id.
+
+    Sessions are evicted least-recently-used first when the pool exceeds
+    max_sessions or max_total_chars, and dropped after ttl_seconds of
+    inactivity. An evicted session is rebuilt lazily from the chat store
+    the next time it is used, when rehydrate is enabled.
+    """
+
     def __init__(self):
-        self.memory = ConversationBufferWindowMemory(
-            k=MEMORY_CONFIG.get("window_size", 10),
+        self.window_size = MEMORY_CONFIG.get("window_size", 10)
+        self.max_sessions = MEMORY_CONFIG.get("max_sessions", 500)
+        self.ttl_seconds = MEMORY_CONFIG.get("ttl_seconds", 3600)
+        self.max_total_chars = MEMORY_CONFIG.get("max_total_chars", 20_000_000)
+        self.rehydrate = MEMORY_CONFIG.get("rehydrate", True)
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._total_chars = 0
+        self._lock = threading.RLock()
+        logger.info("Simplified Memory Manager initialized.")
+
+    def _new_memory(self) -> ConversationBufferWindowMemory:
+        return ConversationBufferWindowMemory(
+            k=self.window_size,
             return_messages=MEMORY_CONFIG.get("return_messages", True)
         )
-        logger.info("Simplified Memory Manager initialized.")
-    
-    def get_memory(self) -> ConversationBufferWindowMemory:
+
+    def _rehydrate(self, chat_id: str, memory: ConversationBufferWindowMemory) -> None:
+        """Rebuild a session's window from the persisted chat history."""
+        # Imported here so the chat store is only opened when rehydration is used
+        from services.chat_service import chat_service
+
+        messages = chat_service.load_chat_messages(chat_id)
+        pairs = []
+        pending_input = None
+        for message in messages:
+            if message["role"] == "user":
+                pending_input = message["content"]
+            elif message["role"] == "assistant" and pending_input is not None:
+                pairs.append((pending_input, message["content"]))
+                pending_input = None
+
+        for user_input, output in pairs[-self.window_size:]:
+            memory.save_context({"input": user_input}, {"output": output})
+        if pairs:
+            logger.info(f"Rehydrated memory for chat {chat_id} with {min(len(pairs), self.window_size)} turns")
+
+    def _measure(self, session: _Session) -> None:
+        """Trim a session to its window and update the pool's size accounting."""
+        messages = session.memory.chat_memory.messages
+        # The window only ever reads the last 2k messages, so older ones are dead weight
+        if len(messages) > 2 * self.window_size:
+            del messages[:len(messages) - 2 * self.window_size]
+        size = sum(len(str(message.content)) for message in messages)
+        self._total_chars += size - session.size_chars
+        session.size_chars = size
+
+    def _evict(self) -> None:
+        """Drop expired sessions, then least recently used ones until within budget."""
+        now = time.time()
+        if self.ttl_seconds:
+            for chat_id in [cid for cid, s in self._sessions.items() if now - s.last_access > self.ttl_seconds]:
+                self._drop(chat_id)
+        while self._sessions and (len(self._sessions) > self.max_sessions or self._total_chars > self.max_total_chars):
+            chat_id = next(iter(self._sessions))
+            self._drop(chat_id)
+            logger.info(f"Evicted memory of chat {chat_id}")
+
+    def _drop(self, chat_id: str) -> None:
+        session = self._sessions.pop(chat_id, None)
+        if session is not None:
+            self._total_chars -= session.size_chars
+
+    def _get_session(self, chat_id: Optional[str]) -> _Session:
+        """Return the session of a chat, creating (and possibly rehydrating) it."""
+        chat_id = chat_id or DEFAULT_SESSION
+        with self._lock:
+            session = self._sessions.get(chat_id)
+            if session is not None:
+                self._sessions.move_to_end(chat_id)
+                session.last_access = time.time()
+                return session
+
+        # Read the chat store without the pool lock, so a slow history load only delays this chat
+        session = _Session(self._new_memory())
+        if self.rehydrate and chat_id != DEFAULT_SESSION:
+            try:
+                self._rehydrate(chat_id, session.memory)
+            except Exception as e:
+                logger.error(f"Error rehydrating memory for chat {chat_id}: {e}")
+
+        with self._lock:
+            existing = self._sessions.get(chat_id)
+            if existing is not None:
+                # Another thread created the session meanwhile; its window may already hold a new turn
+                self._sessions.move_to_end(chat_id)
+                session = existing
+            else:
+                self._sessions[chat_id] = session
+                self._measure(session)
+                self._evict()
+            session.last_access = time.time()
+            return session
+
+    def resync(self, chat_id: str, revision: Optional[str] = None) -> bool:
+        """
+        Rebuild a chat's window from the chat store, discarding the cached one.
+        Needed when other processes may have served turns of the same chat.
+        With a history revision, the window is only rebuilt if it was built
+        from a different one. Returns True if successful, False otherwise.
+        """
+        if revision is not None:
+            with self._lock:
+                session = self._sessions.get(chat_id)
+                if session is not None and session.revision == revision:
+                    return True
+        try:
+            session = _Session(self._new_memory())
+            self._rehydrate(chat_id, session.memory)
+            session.revision = revision
+            with self._lock:
+                self._drop(chat_id)
+                self._sessions[chat_id] = session
+                self._measure(session)
+                self._evict()
+            return True
+        except Exception as e:
+            logger.error(f"Error resyncing memory for chat {chat_id}: {e}")
+            return False
+
+    def mark_revision(self, chat_id: str, revision: Optional[str]) -> None:
+        """Record that a chat's window is up to date with the given history revision."""
+        with self._lock:
+            session = self._sessions.get(chat_id)
+            if session is not None:
+                session.revision = revision
+
+    def get_memory(self, chat_id: Optional[str] = None) -> ConversationBufferWindowMemory:
         """
-        Returns the current ConversationBufferWindowMemory instance.
+        Returns the ConversationBufferWindowMemory instance of a chat session.
         """
-        return self.memory
-    
-    def save_context(self, input_data: dict, output_data: dict) -> bool:
+        return self._get_session(chat_id).memory
+
+    def save_context(self, input_data: dict, output_data: dict, chat_id: Optional[str] = None) -> bool:
         """
-        Saves the conversation context to memory.
+        Saves the conversation context to the memory of a chat session.
         Returns True if successful, False otherwise.
         """
         try:
-            self.memory.save_context(input_data, output_data)
+            key = chat_id or DEFAULT_SESSION
+            # The session is looked up (and rehydrated) outside the pool lock, so it may be
+            # replaced by a resync before the lock is taken; look it up again once if so
+            for attempt in range(2):
+                session = self._get_session(chat_id)
+                with self._lock:
+                    pooled = self._sessions.get(key) is session
+                    if not pooled and attempt == 0:
+                        continue
+                    session.memory.save_context(input_data, output_data)
+                    if pooled:
+                        self._measure(session)
+                        self._evict()
+                    break
             logger.info("Context saved to memory")
             return True
         except Exception as e:
             logger.error(f"Error saving context to memory: {e}")
             return False
-    
-    def load_memory_variables(self) -> dict:
+
+    def load_memory_variables(self, chat_id: Optional[str] = None) -> dict:
         """
-        Loads and returns memory variables from the current memory instance.
+        Loads and returns memory variables of a chat session.
         Returns a dictionary of memory variables.
         """
         try:
-            memory_vars = self.memory.load_memory_variables({})
+            memory_vars = self._get_session(chat_id).memory.load_memory_variables({})
             logger.debug("Loaded memory variables")
             return memory_vars
         except Exception as e:
             logger.error(f"Error loading memory variables: {e}")
             return {"history": []}
-    
-    def reset_memory(self) -> bool:
+
+    def reset_memory(self, chat_id: Optional[str] = None) -> bool:
         """
-        Resets the memory, clearing all conversation history.
+        Resets the memory of a chat session, clearing its conversation history.
         Returns True if successful, False otherwise.
         """
         try:
-            self.memory.clear()
+            with self._lock:
+                self._drop(chat_id or DEFAULT_SESSION)
             logger.info("Memory reset successfully")
             return True
         except Exception as e:
             logger.error(f"Error resetting memory: {e}")
             return False
 
+    def stats(self) -> Dict:
+        """Return the number of pooled sessions and their total size."""
+        with self._lock:
+            return {"sessions": len(self._sessions), "total_chars": self._total_chars}
+
 # Global simplified memory manager instance
-memory_manager = SimplifiedMemoryManager()
\ No newline at end of file
+memory_manager = lazy_service("memory_manager", SimplifiedMemoryManager)
@@ -0,0 +1,279 @@
+"""
+Memory-mapped dense vector index with exact top-k search
+"""
+import asyncio
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from config.settings import VECTOR_STORE_CONFIG
+from core.mmr import mmr_select
+from utils.file_lock import file_lock
+from utils.logger import get_logger
+from utils.registry import lazy_service
+
+logger = get_logger(__name__)
+
+# Rows scored per block; float16 blocks are widened to float32 for the dot product
+_SEARCH_BLOCK_ROWS = 16384
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class MmapVectorIndex:
+    """
+    Chunk embeddings stored as one contiguous, unit-normalised matrix in a .npy
+    file that is memory-mapped read-only, so worker processes share the pages
+    through the OS cache. Chunk texts and metadata live in a JSON sidecar.
+
+    Every change writes a new numbered version and then atomically repoints
+    the CURRENT file, so readers never see a half-written index; readers in
+    other processes pick the new version up on their next search. Writers
+    hold a file lock from reloading the current version until the new one is
+    current, so concurrent writers never reuse a version number.
+    """
+
+    def __init__(self):
+        self.directory = VECTOR_STORE_CONFIG.get("mmap_path", "data/vector_index")
+        self.dtype = np.dtype(VECTOR_STORE_CONFIG.get("mmap_dtype", "float32"))
+        self._lock = threading.RLock()
+        self._version = 0
+        self._vectors: Optional[np.ndarray] = None
+        self._ids: List[str] = []
+        self._documents: List[str] = []
+        self._metadatas: List[Dict] = []
+        self._loaded_stamp: Optional[Tuple[int, int]] = None
+        self._load()
+
+    @property
+    def _current_path(self) -> str:
+        return os.path.join(self.directory, "CURRENT")
+
+    @staticmethod
+    def _stamp(stat: os.stat_result) -> Tuple[int, int]:
+        # CURRENT is replaced on every write, so the inode changes even within one mtime tick
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _write_lock(self):
+        return file_lock(os.path.join(self.directory, "write.lock"))
+
+    def _version_paths(self, version: int) -> Tuple[str, str]:
+        return (os.path.join(self.directory, f"vectors-{version:06d}.npy"),
+                os.path.join(self.directory, f"meta-{version:06d}.json"))
+
+    def _load(self) -> None:
+        """Map the version named by CURRENT, if any."""
+        with self._lock:
+            try:
+                with open(self._current_path, "r", encoding="utf-8") as f:
+                    self._loaded_stamp = self._stamp(os.fstat(f.fileno()))
+                    current = json.load(f)
+                version = current["version"]
+            except (OSError, ValueError, KeyError):
+                self._loaded_stamp = None
+                return
+            vectors_path, meta_path = self._version_paths(version)
+            try:
+                # An empty array cannot be memory-mapped
+                vectors = np.load(vectors_path, mmap_mode="r" if current.get("count") else None)
+                with open(meta_path, "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.error(f"Failed to load vector index version {version}: {e}")
+                return
+            self._version = version
+            self._vectors = vectors
+            self._ids = meta["ids"]
+            self._documents = meta["documents"]
+            self._metadatas = meta["metadatas"]
+            logger.info(f"Vector index version {version} mapped with {len(self._ids)} vectors")
+
+    def _reload_if_changed(self) -> None:
+        """Pick up versions written by another process since the index was loaded."""
+        try:
+            stamp = self._stamp(os.stat(self._current_path))
+        except OSError:
+            return
+        if stamp != self._loaded_stamp:
+            self._load()
+
+    def _write_version(self, vectors: np.ndarray, ids: List[str], documents: List[str],
+                       metadatas: List[Dict]) -> None:
+        """Write a new version and atomically make it current."""
+        os.makedirs(self.directory, exist_ok=True)
+        version = self._version + 1
+        vectors_path, meta_path = self._version_paths(version)
+
+        if len(ids):
+            matrix = np.lib.format.open_memmap(f"{vectors_path}.tmp", mode="w+", dtype=self.dtype, shape=vectors.shape)
+            matrix[:] = vectors
+            matrix.flush()
+            del matrix
+        else:
+            with open(f"{vectors_path}.tmp", "wb") as f:
+                np.save(f, np.zeros((0, 0), dtype=self.dtype))
+        os.replace(f"{vectors_path}.tmp", vectors_path)
+        with open(f"{meta_path}.tmp", "w", encoding="utf-8") as f:
+            json.dump({"ids": ids, "documents": documents, "metadatas": metadatas}, f, ensure_ascii=False)
+        os.replace(f"{meta_path}.tmp", meta_path)
+
+        with open(f"{self._current_path}.tmp", "w", encoding="utf-8") as f:
+            json.dump({"version": version, "count": len(ids), "dtype": self.dtype.name}, f)
+        os.replace(f"{self._current_path}.tmp", self._current_path)
+
+        self._load()
+        self._remove_old_versions(keep_from=version - 1)
+
+    def _remove_old_versions(self, keep_from: int) -> None:
+        """Delete versions older than keep_from; the previous one stays for readers mid-switch."""
+        for name in os.listdir(self.directory):
+            prefix, _, rest = name.partition("-")
+            if prefix in ("vectors", "meta") and rest[:6].isdigit() and int(rest[:6]) < keep_from:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def rebuild(self, ids: List[str], embeddings: List[List[float]], documents: List[str],
+                metadatas: List[Dict]) -> None:
+        """Replace the whole index, e.g. with an export of the vector store."""
+        with self._lock, self._write_lock():
+            self._reload_if_changed()
+            vectors = _normalize(np.asarray(embeddings, dtype=np.float32)) if ids else np.zeros((0, 0), np.float32)
+            self._write_version(vectors, list(ids), list(documents), [dict(m or {}) for m in metadatas])
+        logger.info(f"Vector index rebuilt with {len(ids)} vectors")
+
+    def upsert(self, ids: List[str], embeddings: List[List[float]], documents: List[str],
+               metadatas: List[Dict]) -> None:
+        """Add chunks, replacing any with the same IDs."""
+        if not ids:
+            return
+        with self._lock, self._write_lock():
+            self._reload_if_changed()
+            replaced = set(ids)
+            keep = [row for row, chunk_id in enumerate(self._ids) if chunk_id not in replaced]
+            new_vectors = _normalize(np.asarray(embeddings, dtype=np.float32))
+            if keep and self._vectors is not None and self._vectors.shape[1] == new_vectors.shape[1]:
+                vectors = np.vstack([np.asarray(self._vectors[keep], dtype=np.float32), new_vectors])
+            else:
+                if keep:
+                    logger.warning("Embedding dimension changed; dropping vectors of the old model")
+                keep = []
+                vectors = new_vectors
+            self._write_version(
+                vectors,
+                [self._ids[row] for row in keep] + list(ids),
+                [self._documents[row] for row in keep] + list(documents),
+                [self._metadatas[row] for row in keep] + [dict(m or {}) for m in metadatas]
+            )
+
+    def remove(self, ids: List[str]) -> None:
+        """Remove chunks by ID."""
+        with self._lock, self._write_lock():
+            self._reload_if_changed()
+            removed = set(ids)
+            keep = [row for row, chunk_id in enumerate(self._ids) if chunk_id not in removed]
+            if len(keep) == len(self._ids):
+                return
+            vectors = (np.asarray(self._vectors[keep], dtype=np.float32)
+                       if keep else np.zeros((0, 0), np.float32))
+            self._write_version(
+                vectors,
+                [self._ids[row] for row in keep],
+                [self._documents[row] for row in keep],
+                [self._metadatas[row] for row in keep]
+            )
+
+    def _snapshot(self) -> Tuple[Optional[np.ndarray], List[str], List[Dict]]:
+        """Vectors, texts and metadata of one version, consistent with each other."""
+        with self._lock:
+            self._reload_if_changed()
+            return self._vectors, self._documents, self._metadatas
+
+    @staticmethod
+    def _scores(vectors: np.ndarray, query_vector: List[float]) -> np.ndarray:
+        """Cosine similarity of the query with every stored vector."""
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        if vectors.dtype == np.float32 and len(vectors) <= _SEARCH_BLOCK_ROWS:
+            return vectors @ query
+        scores = np.empty(len(vectors), dtype=np.float32)
+        for start in range(0, len(vectors), _SEARCH_BLOCK_ROWS):
+            block = np.asarray(vectors[start:start + _SEARCH_BLOCK_ROWS], dtype=np.float32)
+            scores[start:start + len(block)] = block @ query
+        return scores
+
+    def _top_rows(self, vectors: np.ndarray, query_vector: List[float], k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Rows of the k best matches, best first, and their scores."""
+        scores = self._scores(vectors, query_vector)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return top, scores[top]
+
+    def search(self, query_vector: List[float], k: int) -> List[Tuple[Document, float]]:
+        """Exact top-k chunks by cosine similarity, as (document, score) pairs."""
+        vectors, documents, metadatas = self._snapshot()
+        if vectors is None or not len(vectors) or k <= 0:
+            return []
+
+        rows, scores = self._top_rows(vectors, query_vector, k)
+        return [
+            (Document(page_content=documents[row], metadata=dict(metadatas[row])), float(score))
+            for row, score in zip(rows, scores)
+        ]
+
+    def search_with_vectors(self, query_vector: List[float], k: int) -> Tuple[List[Document], np.ndarray]:
+        """Exact top-k chunks together with their stored vectors, e.g. for MMR."""
+        vectors, documents, metadatas = self._snapshot()
+        if vectors is None or not len(vectors) or k <= 0:
+            return [], np.zeros((0, 0), dtype=np.float32)
+
+        rows, _ = self._top_rows(vectors, query_vector, k)
+        rows = np.sort(rows)  # ascending rows read the memory map sequentially
+        docs = [Document(page_content=documents[row], metadata=dict(metadatas[row])) for row in rows]
+        return docs, np.asarray(vectors[rows], dtype=np.float32)
+
+
+class MmapRetriever(BaseRetriever):
+    """Dense retriever over the memory-mapped index, by similarity or MMR."""
+
+    index: Any
+    embeddings: Any
+    k: int = 5
+    search_type: str = "similarity"
+    fetch_k: int = 10
+    lambda_mult: float = 0.8
+
+    def _search(self, query_vector: List[float]) -> List[Document]:
+        if self.search_type != "mmr":
+            return [doc for doc, _ in self.index.search(query_vector, self.k)]
+        candidates, vectors = self.index.search_with_vectors(query_vector, max(self.k, self.fetch_k))
+        return [candidates[i] for i in mmr_select(query_vector, vectors, self.k, self.lambda_mult)]
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return self._search(self.embeddings.embed_query(query))
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        query_vector = await self.embeddings.aembed_query(query)
+        # Scoring reads the memory map, which can fault pages in from disk
+        return await asyncio.to_thread(self._search, query_vector)
+
+
+# Global memory-mapped vector index instance
+mmap_index = lazy_service("mmap_index", MmapVectorIndex)
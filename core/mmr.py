@@ -0,0 +1,92 @@
+"""
+Maximal marginal relevance over stored candidate embeddings
+"""
+import asyncio
+from typing import Any, List
+
+import numpy as np
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def mmr_select(query_vector, candidate_vectors, k: int, lambda_mult: float = 0.5) -> List[int]:
+    """
+    Pick k candidates balancing relevance to the query against similarity to
+    the candidates already picked.
+
+    Query and candidate similarities come from two matrix products computed up
+    front; the greedy loop then only updates a running maximum, so the cost is
+    O(fetch_k^2 * dim) once plus O(k * fetch_k).
+
+    Returns:
+        Indices into candidate_vectors, in selection order
+    """
+    candidates = np.asarray(candidate_vectors, dtype=np.float32)
+    if not len(candidates) or k <= 0:
+        return []
+    candidates = candidates / np.maximum(np.linalg.norm(candidates, axis=1, keepdims=True), 1e-12)
+    query = np.asarray(query_vector, dtype=np.float32)
+    query = query / max(float(np.linalg.norm(query)), 1e-12)
+
+    relevance = candidates @ query
+    pairwise = candidates @ candidates.T
+
+    k = min(k, len(candidates))
+    selected = [int(np.argmax(relevance))]
+    # Highest similarity of every candidate to anything selected so far
+    redundancy = pairwise[selected[0]].copy()
+    available = np.ones(len(candidates), dtype=bool)
+    available[selected[0]] = False
+
+    while len(selected) < k:
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(redundancy, pairwise[best], out=redundancy)
+    return selected
+
+
+class ChromaMMRRetriever(BaseRetriever):
+    """
+    MMR retriever over a Chroma collection that reads the candidates' stored
+    embeddings back with the query results instead of recomputing anything.
+    """
+
+    collection: Any
+    embeddings: Any
+    k: int = 5
+    fetch_k: int = 10
+    lambda_mult: float = 0.8
+
+    def _select(self, query_vector: List[float]) -> List[Document]:
+        if not self.collection.count():
+            return []
+        results = self.collection.query(
+            query_embeddings=[query_vector],
+            n_results=max(self.k, self.fetch_k),
+            include=["embeddings", "documents", "metadatas"]
+        )
+        embeddings = results["embeddings"][0]
+        if embeddings is None or not len(embeddings):
+            return []
+        chosen = mmr_select(query_vector, embeddings, self.k, self.lambda_mult)
+        documents, metadatas = results["documents"][0], results["metadatas"][0]
+        return [Document(page_content=documents[i], metadata=dict(metadatas[i] or {})) for i in chosen]
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return self._select(self.embeddings.embed_query(query))
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        query_vector = await self.embeddings.aembed_query(query)
+        # count() and query() block on disk or the Chroma server, so keep them off the event loop
+        return await asyncio.to_thread(self._select, query_vector)
@@ -0,0 +1,70 @@
+"""
+PDF text extraction helpers.
+
+Kept free of vector store imports so the functions can run in worker processes.
+"""
+import re
+from typing import Iterable, Iterator, List, Tuple
+
+
+def clean_pdf_text(text: str) -> str:
+    """
+    Cleans up whitespace and line breaks from text extracted from a PDF.
+    
+    - Replaces multiple newlines and spaces with a single space to join broken lines.
+    - Consolidates multiple spaces into a single space.
+    - Removes leading/trailing whitespace.
+    """
+    # Replace newlines that are not preceded by a punctuation mark, effectively joining sentences.
+    text = re.sub(r'(?<![.\-:])\s*\n\s*', ' ', text)
+    # Replace multiple spaces with a single space
+    text = re.sub(r'\s+', ' ', text)
+    return text.strip()
+
+
+def iter_pdf_pages(data: bytes) -> Iterator[str]:
+    """
+    Yield the raw text of each page of a PDF held in memory, one page at a time.
+    
+    Uses PyMuPDF directly rather than PyMuPDFLoader so worker processes do not
+    pay the langchain import cost.
+    """
+    import fitz
+    
+    with fitz.open(stream=data, filetype="pdf") as pdf:
+        for page in pdf:
+            yield page.get_text()
+
+
+def load_pdf_pages(data: bytes) -> List[str]:
+    """Extract the raw text of every page of a PDF."""
+    return list(iter_pdf_pages(data))
+
+
+def iter_clean_pages(pages: Iterable[str]) -> Iterator[str]:
+    """
+    Clean pages one at a time. The pieces concatenate to
+    clean_pdf_text("\n".join(pages)): cleaning collapses every whitespace run to
+    one space, so each page is cleaned on its own and non-empty pages are
+    separated by a single space.
+    """
+    started = False
+    for page in pages:
+        text = clean_pdf_text(page)
+        if text:
+            yield f" {text}" if started else text
+            started = True
+
+
+def extract_pdf_text(data: bytes) -> Tuple[str, int]:
+    """
+    Extract and clean the text of a PDF.
+    
+    Args:
+        data: Raw bytes of the PDF file
+        
+    Returns:
+        Tuple of (cleaned text, number of pages)
+    """
+    pages = load_pdf_pages(data)
+    return "".join(iter_clean_pages(pages)), len(pages)
@@ -1,13 +1,24 @@
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain.schema.output_parser import StrOutputParser
-from langchain.schema.runnable import RunnablePassthrough
+from langchain.schema.runnable import RunnablePassthrough, RunnableLambda
 from models.llm_models import get_chat_model
 from core.vector_store import vector_store_manager
 from core.memory_manager import memory_manager
-from config.settings import SYSTEM_PROMPT, VECTOR_STORE_CONFIG
+from core.answer_cache import answer_cache
+from core.document_catalog import document_catalog
+from core.context_builder import assemble_context
+from core.token_budget import token_budget, count_message_tokens
+from config.settings import SYSTEM_PROMPT, VECTOR_STORE_CONFIG, ANSWER_CACHE_CONFIG, REFORMULATION_CONFIG, RAG_ENGINE_CONFIG, CONTEXT_CONFIG
 from utils.logger import get_logger
-from typing import List, Any
+from utils.registry import lazy_service
+from utils.tracing import tracer
+from utils.helpers import detect_language, references_prior_turns
+from typing import List, Any, Iterator, AsyncIterator, Optional
 from models.pydantic_models import StandaloneQuery
+import asyncio
+import re
+import time
+import weakref
 
 logger = get_logger(__name__)
 
@@ -18,7 +29,12 @@ class SimplifiedRAGEngine:
         self.llm_model = get_chat_model()
         self.prompt_template = self._create_prompt_template()
         self.chain = None
+        self.reformulation_chain = None
+        self.reformulation_stats = {"calls": 0, "skipped": 0}
         self.retrieval_config = VECTOR_STORE_CONFIG
+        self._fixed_tokens = None
+        # One concurrency limiter per event loop, created on first use
+        self._query_semaphores = weakref.WeakKeyDictionary()
         self._initialize_chain()
     
     def _create_prompt_template(self):
@@ -31,8 +47,8 @@ class SimplifiedRAGEngine:
              "Language in which response should be: {language}"),
         ])
     
-    def _get_context(self, documents: List, query: str) -> str:
-        """Get context from retrieved documents."""
+    def _get_context(self, documents: List, query: str, max_tokens: Optional[int] = None) -> str:
+        """Get context from retrieved documents, within max_tokens (CONTEXT_CONFIG by default)."""
         try:
             if not documents:
                 logger.info(f"No documents retrieved for query: {query}")
@@ -40,13 +56,14 @@ class SimplifiedRAGEngine:
 
             logger.info(f"Processing {len(documents)} retrieved documents")
 
-            context_parts = []
-            for doc in documents:
-                filename = getattr(doc, 'metadata', {}).get('filename', 'Unknown Document')
-                formatted_content = f"Source: {filename}\n{doc.page_content}"
-                context_parts.append(formatted_content)
+            # Merge overlapping chunks of the same file and cap the context size
+            context = assemble_context(
+                documents,
+                max_tokens=CONTEXT_CONFIG.get("max_tokens", 3000) if max_tokens is None else max_tokens,
+                merge_gap=CONTEXT_CONFIG.get("merge_gap", 1)
+            )
 
-            return "\n\n".join(context_parts) if context_parts else "No BSK service information found."
+            return context if context else "No BSK service information found."
 
         except Exception as e:
             logger.error(f"Error in context retrieval: {e}")
@@ -81,49 +98,79 @@ class SimplifiedRAGEngine:
                 return None
             
             # Create reformulation chain
-            reformulation_chain = self.llm_model.with_structured_output(StandaloneQuery)
+            self.reformulation_chain = self.llm_model.with_structured_output(StandaloneQuery)
             
             # Enhanced chain
             def get_context_and_history(x):
                 """Get context and history for the query."""
                 query = x["input"]
+                request_state = x.get("request_state", {})
                 
-                # Load history from memory
-                memory_vars = memory_manager.load_memory_variables()
-                history = memory_vars.get("history", [])
-                
-                # Use only the last two messages from history if available
-                if len(history) >= 2:
-                    last_pair = history[-2:]
-                    history_str = "\n".join([f"{msg.type}: {msg.content}" for msg in last_pair])
-                else:
-                    history_str = ""
+                # Load history from memory unless the caller already did
+                history = x["history"] if "history" in x else self._load_history(x.get("chat_id"))
                 
-                # Reformulate query
-                reformulation_input = f"Conversation history:\n{history_str}\n\nCurrent query: {query}"
-                standalone_query_obj = reformulation_chain.invoke(reformulation_input)
+                # Reformulate query unless the caller already did
+                standalone_query_obj = x.get("standalone") or self._reformulate_query(query, history)
                 standalone_query = standalone_query_obj.query
                 
+                # Fit history and question into the token budget before sizing the context
+                budget = self._plan_budget(history, standalone_query)
+                
                 # Retrieve documents
                 try:
-                    documents = retriever.invoke(standalone_query)
-                    context = self._get_context(documents, standalone_query)
+                    with tracer.span("query.retrieval") as span:
+                        documents = retriever.invoke(standalone_query)
+                        span["documents"] = len(documents)
+                    with tracer.span("query.context_build"):
+                        context = self._get_context(documents, standalone_query, budget["context_tokens"])
+                    request_state["retrieval_ok"] = True
                 except Exception as e:
                     logger.error(f"Error retrieving documents: {e}")
                     context = "Error retrieving documents. Please try again."
+                    request_state["retrieval_ok"] = False
+                request_state["tokens"] = token_budget.account(budget, context)
                 
                 return {
                     "context": context,
-                    "history": history,
-                    "input": standalone_query,
+                    "history": budget["history"],
+                    "input": budget["query"],
+                    "language": standalone_query_obj.language
+                }
+            
+            async def aget_context_and_history(x):
+                """Async counterpart of get_context_and_history used by astream."""
+                query = x["input"]
+                request_state = x.get("request_state", {})
+                history = x["history"] if "history" in x else self._load_history(x.get("chat_id"))
+                standalone_query_obj = x.get("standalone") or await self._areformulate_query(query, history)
+                standalone_query = standalone_query_obj.query
+                budget = self._plan_budget(history, standalone_query)
+                
+                try:
+                    with tracer.span("query.retrieval") as span:
+                        documents = await retriever.ainvoke(standalone_query)
+                        span["documents"] = len(documents)
+                    with tracer.span("query.context_build"):
+                        context = self._get_context(documents, standalone_query, budget["context_tokens"])
+                    request_state["retrieval_ok"] = True
+                except Exception as e:
+                    logger.error(f"Error retrieving documents: {e}")
+                    context = "Error retrieving documents. Please try again."
+                    request_state["retrieval_ok"] = False
+                request_state["tokens"] = token_budget.account(budget, context)
+                
+                return {
+                    "context": context,
+                    "history": budget["history"],
+                    "input": budget["query"],
                     "language": standalone_query_obj.language
                 }
             
             # Create the chain
             chain = (
                 RunnablePassthrough() 
-                | get_context_and_history
-                | self.prompt_template
+                | RunnableLambda(get_context_and_history, afunc=aget_context_and_history)
+                | RunnableLambda(self._render_prompt, afunc=self._arender_prompt)
                 | self.llm_model
                 | StrOutputParser()
             )
@@ -135,6 +182,127 @@ class SimplifiedRAGEngine:
             logger.error(f"Failed to create RAG chain: {e}")
             return None
     
+    def _render_prompt(self, values: dict):
+        """Fill the prompt template, timed as its own stage."""
+        with tracer.span("query.prompt_render"):
+            return self.prompt_template.invoke(values)
+    
+    async def _arender_prompt(self, values: dict):
+        """Async entry point of _render_prompt; rendering itself is synchronous."""
+        return self._render_prompt(values)
+    
+    def _get_fixed_tokens(self) -> int:
+        """Tokens of the prompt template without context, history and question, counted once."""
+        if self._fixed_tokens is None:
+            empty = self.prompt_template.invoke({"context": "", "history": [], "input": "", "language": ""})
+            self._fixed_tokens = count_message_tokens(empty.to_messages())
+        return self._fixed_tokens
+    
+    def _plan_budget(self, history: List, query: str) -> dict:
+        """Split the prompt token budget between history, question and context."""
+        with tracer.span("query.token_budget") as span:
+            budget = token_budget.plan(history, query, self._get_fixed_tokens())
+            span.update({f"{section}_tokens": tokens for section, tokens in budget["tokens"].items()})
+            span["messages_dropped"] = budget["messages_dropped"]
+        return budget
+    
+    def _record_tokens(self, request_state: dict, full_response: str, elapsed: float) -> dict:
+        """Count the answer's tokens and record the request's token usage with its total latency."""
+        tokens = token_budget.record_completion(request_state.get("tokens", {}), full_response)
+        tracer.record("query.last_token", elapsed,
+                      prompt_tokens=tokens.get("prompt", 0), completion_tokens=tokens["completion"])
+        return tokens
+    
+    def _load_history(self, chat_id: Optional[str] = None) -> List:
+        """Load the conversation history of a chat session from memory."""
+        with tracer.span("query.memory_load"):
+            memory_vars = memory_manager.load_memory_variables(chat_id)
+        return memory_vars.get("history", [])
+    
+    def _needs_reformulation(self, query: str, history: List) -> bool:
+        """Decide locally whether the reformulation model has to be called for this query."""
+        if REFORMULATION_CONFIG.get("mode", "always") != "conditional":
+            return True
+        if detect_language(query) != "English":
+            return True
+        return bool(history) and references_prior_turns(
+            query,
+            REFORMULATION_CONFIG.get("follow_up_openers", []),
+            REFORMULATION_CONFIG.get("follow_up_pronouns", []),
+            REFORMULATION_CONFIG.get("follow_up_phrases", []),
+            REFORMULATION_CONFIG.get("max_short_words", 3)
+        )
+    
+    def get_reformulation_stats(self) -> dict:
+        """Return how often the reformulation model was called or skipped."""
+        total = self.reformulation_stats["calls"] + self.reformulation_stats["skipped"]
+        return {
+            **self.reformulation_stats,
+            "skip_rate": self.reformulation_stats["skipped"] / total if total else 0.0
+        }
+    
+    def _build_reformulation_input(self, query: str, history: List) -> Optional[str]:
+        """
+        Build the prompt for the reformulation model, or return None when the
+        query can be used as-is. Updates the call/skip counters.
+        """
+        if not self._needs_reformulation(query, history):
+            self.reformulation_stats["skipped"] += 1
+            logger.info("Skipped reformulation for standalone English query")
+            return None
+        
+        self.reformulation_stats["calls"] += 1
+        
+        # Use only the last two messages from history if available
+        if len(history) >= 2:
+            last_pair = history[-2:]
+            history_str = "\n".join([f"{msg.type}: {msg.content}" for msg in last_pair])
+        else:
+            history_str = ""
+        
+        return f"Conversation history:\n{history_str}\n\nCurrent query: {query}"
+    
+    def _reformulate_query(self, query: str, history: List) -> StandaloneQuery:
+        """Rewrite the query as a standalone English query and detect its language."""
+        with tracer.span("query.reformulation") as span:
+            reformulation_input = self._build_reformulation_input(query, history)
+            span["skipped"] = reformulation_input is None
+            if reformulation_input is None:
+                return StandaloneQuery(query=query.strip(), language="English")
+            return self.reformulation_chain.invoke(reformulation_input)
+    
+    async def _areformulate_query(self, query: str, history: List) -> StandaloneQuery:
+        """Async counterpart of _reformulate_query."""
+        with tracer.span("query.reformulation") as span:
+            reformulation_input = self._build_reformulation_input(query, history)
+            span["skipped"] = reformulation_input is None
+            if reformulation_input is None:
+                return StandaloneQuery(query=query.strip(), language="English")
+            return await self.reformulation_chain.ainvoke(reformulation_input)
+    
+    @staticmethod
+    def _replay_answer(answer: str) -> Iterator[str]:
+        """Split a cached answer into small chunks so it streams like a live response."""
+        words_per_chunk = max(1, ANSWER_CACHE_CONFIG.get("replay_chunk_words", 3))
+        pieces = re.findall(r"\s*\S+\s*", answer)
+        for start in range(0, len(pieces), words_per_chunk):
+            yield "".join(pieces[start:start + words_per_chunk])
+    
+    def _save_to_memory(self, query: str, full_response: str, chat_id: Optional[str] = None) -> None:
+        """Save the exchange to the conversation memory of a chat session."""
+        if full_response.strip():
+            save_success = memory_manager.save_context(
+                {"input": query},
+                {"output": full_response},
+                chat_id=chat_id
+            )
+            
+            if save_success:
+                logger.info("Context saved to memory")
+            else:
+                logger.warning("Failed to save context to memory")
+        else:
+            logger.warning("Empty response generated, not saving to memory")
     
     def _ensure_chain_availability(self) -> bool:
         """Ensure the RAG chain is available."""
@@ -148,8 +316,8 @@ class SimplifiedRAGEngine:
         
         return True
     
-    def process_query(self, query: str) -> Any:
-        """Process query with simplified interface."""
+    def process_query(self, query: str, chat_id: Optional[str] = None) -> Any:
+        """Process query with simplified interface, using the memory of the given chat session."""
         
         # Ensure chain availability
         if not self._ensure_chain_availability():
@@ -159,36 +327,135 @@ class SimplifiedRAGEngine:
             return
         
         # Process query
+        request_trace = tracer.start(chat_id=chat_id)
+        yield from tracer.traced(self._stream_query(query, chat_id, request_trace), request_trace)
+    
+    def _stream_query(self, query: str, chat_id: Optional[str], request_trace) -> Iterator[str]:
+        """Body of process_query; advanced only while request_trace is bound."""
+        start = time.perf_counter()
         try:
             full_response = ""
             chunk_count = 0
 
-            chain_input = {"input": query}
+            history = self._load_history(chat_id)
+            chain_input = {"input": query, "chat_id": chat_id, "history": history, "request_state": {}}
+
+            # Reformulate up front so the standalone query can be looked up in the answer cache
+            query_vector = None
+            if answer_cache.enabled:
+                standalone_query_obj = self._reformulate_query(query, history)
+                chain_input["standalone"] = standalone_query_obj
+                with tracer.span("query.answer_cache") as span:
+                    # Read before retrieval, so an answer racing with ingestion is filed under the old version
+                    index_version = document_catalog.index_version()
+                    query_vector = vector_store_manager.embeddings.embed_query(standalone_query_obj.query)
+                    cached_answer = answer_cache.lookup(query_vector, standalone_query_obj.language, index_version)
+                    span["hit"] = bool(cached_answer)
+                if cached_answer:
+                    tracer.record("query.first_token", time.perf_counter() - start, cached=True)
+                    for chunk in self._replay_answer(cached_answer):
+                        yield chunk
+                    logger.info("Query served from answer cache")
+                    self._save_to_memory(query, cached_answer, chat_id)
+                    return
+
             for chunk in self.chain.stream(chain_input):
                 if chunk:
+                    if not chunk_count:
+                        tracer.record("query.first_token", time.perf_counter() - start)
                     full_response += chunk
                     chunk_count += 1
                     yield chunk
+            tokens = self._record_tokens(chain_input["request_state"], full_response, time.perf_counter() - start)
+
+            logger.info(f"Query processed in {(time.perf_counter() - start) * 1000:.0f} ms, "
+                        f"{tokens.get('prompt', 0)} prompt + {tokens['completion']} completion tokens "
+                        f"({request_trace.breakdown()})")
 
-            logger.info(f"Query processed successfully ")
+            # Cache the answer only when it was grounded in a successful retrieval
+            if query_vector is not None and chain_input["request_state"].get("retrieval_ok"):
+                answer_cache.store(query_vector, chain_input["standalone"].language, full_response, index_version)
 
             # Save context to memory
-            if full_response.strip():
-                save_success = memory_manager.save_context(
-                    {"input": query},
-                    {"output": full_response}
-                )
-                
-                if save_success:
-                    logger.info("Context saved to memory")
-                else:
-                    logger.warning("Failed to save context to memory")
-            else:
-                logger.warning("Empty response generated, not saving to memory")
+            self._save_to_memory(query, full_response, chat_id)
             
         except Exception as e:
             error_msg = f"Error processing query: {str(e)}"
             logger.error(error_msg)
 
+
+    def _get_query_semaphore(self) -> asyncio.Semaphore:
+        """Return the concurrency limiter of the running event loop."""
+        loop = asyncio.get_running_loop()
+        semaphore = self._query_semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(RAG_ENGINE_CONFIG.get("max_concurrent_queries", 32))
+            self._query_semaphores[loop] = semaphore
+        return semaphore
+    
+    async def aprocess_query(self, query: str, chat_id: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        Async counterpart of process_query built on the chain's async streaming.
+        At most RAG_ENGINE_CONFIG["max_concurrent_queries"] queries run at once
+        per event loop; the rest wait for a slot.
+        """
+        if not self._ensure_chain_availability():
+            error_msg = "RAG system is currently unavailable. Please ensure documents are loaded and try again."
+            logger.error(error_msg)
+            yield error_msg
+            return
+        
+        async with self._get_query_semaphore():
+            request_trace = tracer.start(chat_id=chat_id)
+            async for chunk in tracer.atraced(self._astream_query(query, chat_id, request_trace), request_trace):
+                yield chunk
+    
+    async def _astream_query(self, query: str, chat_id: Optional[str], request_trace) -> AsyncIterator[str]:
+        """Body of aprocess_query; advanced only while request_trace is bound."""
+        start = time.perf_counter()
+        try:
+            full_response = ""
+            
+            history = self._load_history(chat_id)
+            chain_input = {"input": query, "chat_id": chat_id, "history": history, "request_state": {}}
+            
+            query_vector = None
+            if answer_cache.enabled:
+                standalone_query_obj = await self._areformulate_query(query, history)
+                chain_input["standalone"] = standalone_query_obj
+                with tracer.span("query.answer_cache") as span:
+                    index_version = await asyncio.to_thread(document_catalog.index_version)
+                    query_vector = await vector_store_manager.embeddings.aembed_query(standalone_query_obj.query)
+                    cached_answer = answer_cache.lookup(query_vector, standalone_query_obj.language, index_version)
+                    span["hit"] = bool(cached_answer)
+                if cached_answer:
+                    tracer.record("query.first_token", time.perf_counter() - start, cached=True)
+                    for chunk in self._replay_answer(cached_answer):
+                        yield chunk
+                    logger.info("Query served from answer cache")
+                    self._save_to_memory(query, cached_answer, chat_id)
+                    return
+            
+            async for chunk in self.chain.astream(chain_input):
+                if chunk:
+                    if not full_response:
+                        tracer.record("query.first_token", time.perf_counter() - start)
+                    full_response += chunk
+                    yield chunk
+            tokens = self._record_tokens(chain_input["request_state"], full_response, time.perf_counter() - start)
+            
+            logger.info(f"Async query processed in {(time.perf_counter() - start) * 1000:.0f} ms, "
+                        f"{tokens.get('prompt', 0)} prompt + {tokens['completion']} completion tokens "
+                        f"({request_trace.breakdown()})")
+            
+            if query_vector is not None and chain_input["request_state"].get("retrieval_ok"):
+                answer_cache.store(query_vector, chain_input["standalone"].language, full_response, index_version)
+            
+            self._save_to_memory(query, full_response, chat_id)
+            
+        except Exception as e:
+            logger.error(f"Error processing query: {str(e)}")
+
+
 # Global simplified RAG engine instance
-rag_engine = SimplifiedRAGEngine()
\ No newline at end of file
+rag_engine = lazy_service("rag_engine", SimplifiedRAGEngine)
\ No newline at end of file
@@ -0,0 +1,139 @@
+"""
+LRU cache of retrieval results, invalidated by the document index version
+"""
+import asyncio
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from config.settings import RETRIEVAL_CACHE_CONFIG
+from core.document_catalog import document_catalog
+from utils.logger import get_logger
+from utils.registry import lazy_service
+
+logger = get_logger(__name__)
+
+CacheKey = Tuple[str, str, int]
+
+
+def normalize_query(query: str) -> str:
+    """Case- and whitespace-insensitive form of a query, used as the cache key."""
+    return re.sub(r"\s+", " ", query).strip().casefold()
+
+
+def _copy(documents: List[Document]) -> List[Document]:
+    # Callers may annotate metadata, which must not leak into the cached results
+    return [Document(page_content=doc.page_content, metadata=dict(doc.metadata)) for doc in documents]
+
+
+class RetrievalCache:
+    """
+    Retrieved documents keyed by (normalized query, retriever config, index version).
+
+    The index version is advanced whenever documents are added, updated or
+    deleted, so a stale entry can never be returned; entries of older versions
+    are dropped as soon as a newer version is seen.
+    """
+
+    def __init__(self):
+        self.enabled = RETRIEVAL_CACHE_CONFIG.get("enabled", True)
+        self.max_entries = RETRIEVAL_CACHE_CONFIG.get("max_entries", 2048)
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[CacheKey, List[Document]]" = OrderedDict()
+        self._version = 0
+        self._lock = threading.Lock()
+        logger.info("Retrieval cache initialized.")
+
+    def _observe_version(self, version: int) -> None:
+        """Drop every entry once a newer index version appears. Caller holds the lock."""
+        if version > self._version:
+            if self._entries:
+                logger.info(f"Retrieval cache invalidated by index version {version} "
+                            f"({len(self._entries)} entries dropped)")
+            self._entries.clear()
+            self._version = version
+
+    def lookup(self, key: CacheKey) -> Optional[List[Document]]:
+        """Return a copy of the cached documents for key, or None."""
+        with self._lock:
+            self._observe_version(key[2])
+            documents = self._entries.get(key)
+            if documents is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return _copy(documents)
+
+    def store(self, key: CacheKey, documents: List[Document]) -> None:
+        """Cache documents under key, evicting the least recently used entry when full."""
+        documents = _copy(documents)
+        with self._lock:
+            self._observe_version(key[2])
+            # Results computed while a newer version was being written are not kept
+            if key[2] < self._version:
+                return
+            self._entries[key] = documents
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Drop every cached result."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        """Return hit/miss counters and the current number of cached results."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "index_version": self._version
+        }
+
+
+class CachedRetriever(BaseRetriever):
+    """Serves repeated queries from the retrieval cache and delegates the rest."""
+
+    retriever: Any
+    cache: Any
+    # Identifies the retriever settings, so results of differently configured retrievers never mix
+    config_key: str
+
+    def _key(self, query: str) -> CacheKey:
+        # Read the version before retrieving: results that race with a write are
+        # stored under the old version and never served once it has advanced
+        return normalize_query(query), self.config_key, document_catalog.index_version()
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        key = self._key(query)
+        documents = self.cache.lookup(key)
+        if documents is None:
+            documents = self.retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+            self.cache.store(key, documents)
+        return documents
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        # The index version is a SQLite read
+        key = await asyncio.to_thread(self._key, query)
+        documents = self.cache.lookup(key)
+        if documents is None:
+            documents = await self.retriever.ainvoke(query, config={"callbacks": run_manager.get_child()})
+            self.cache.store(key, documents)
+        return documents
+
+
+# Global retrieval cache instance
+retrieval_cache = lazy_service("retrieval_cache", RetrievalCache)
@@ -0,0 +1,141 @@
+"""
+Token accounting and budget enforcement for the sections of the RAG prompt
+"""
+import threading
+from typing import Dict, List
+
+from langchain_core.messages import BaseMessage
+from config.settings import PROMPT_BUDGET_CONFIG, CONTEXT_CONFIG
+from utils.logger import get_logger
+from utils.registry import lazy_service
+from utils.token_counter import count_tokens, truncate_to_tokens
+
+logger = get_logger(__name__)
+
+# Role and separator tokens the chat format adds to every message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_TRUNCATION_MARK = " …"
+
+
+def count_message_tokens(messages: List[BaseMessage]) -> int:
+    """Count the tokens a list of chat messages takes up in a prompt."""
+    return sum(count_tokens(message.content) + MESSAGE_OVERHEAD_TOKENS for message in messages)
+
+
+class TokenBudgetManager:
+    """
+    Splits the prompt token budget between its sections by priority.
+
+    The fixed part of the prompt (system prompt and template text) and the
+    question are always sent, the question cut to max_query_tokens. Context is
+    guaranteed min_context_tokens; history then takes what it needs up to
+    max_history_tokens, dropping the oldest turns first and cutting long
+    messages; the remainder goes to context, up to its own limit.
+    """
+
+    def __init__(self):
+        self.max_prompt_tokens = PROMPT_BUDGET_CONFIG.get("max_prompt_tokens", 6000)
+        self.max_query_tokens = PROMPT_BUDGET_CONFIG.get("max_query_tokens", 500)
+        self.min_context_tokens = PROMPT_BUDGET_CONFIG.get("min_context_tokens", 1000)
+        self.max_history_tokens = PROMPT_BUDGET_CONFIG.get("max_history_tokens", 1500)
+        self.max_message_tokens = PROMPT_BUDGET_CONFIG.get("max_message_tokens", 400)
+        self.max_context_tokens = CONTEXT_CONFIG.get("max_tokens", 3000)
+        self._totals = {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                        "max_prompt_tokens": 0, "messages_dropped": 0, "messages_truncated": 0}
+        self._lock = threading.Lock()
+        logger.info("Token budget manager initialized.")
+
+    def _fit_history(self, history: List[BaseMessage], allowance: int) -> Dict:
+        """Keep the newest messages that fit in allowance, cutting each to max_message_tokens."""
+        kept: List[BaseMessage] = []
+        used = truncated = 0
+        for message in reversed(history):
+            content = message.content if isinstance(message.content, str) else str(message.content)
+            tokens = count_tokens(content)
+            cut = tokens > self.max_message_tokens
+            if cut:
+                content = truncate_to_tokens(content, self.max_message_tokens) + _TRUNCATION_MARK
+                message = message.copy(update={"content": content})
+                tokens = count_tokens(content)
+            if used + tokens + MESSAGE_OVERHEAD_TOKENS > allowance:
+                break
+            kept.append(message)
+            truncated += cut
+            used += tokens + MESSAGE_OVERHEAD_TOKENS
+        kept.reverse()
+
+        # An answer whose question was dropped would read as out of context
+        while kept and kept[0].type != "human":
+            used -= count_tokens(kept.pop(0).content) + MESSAGE_OVERHEAD_TOKENS
+        return {"messages": kept, "tokens": used, "dropped": len(history) - len(kept), "truncated": truncated}
+
+    def plan(self, history: List[BaseMessage], query: str, fixed_tokens: int) -> Dict:
+        """
+        Fit history and the question into the budget and work out what is left for context.
+
+        Args:
+            history: Conversation messages, oldest first
+            query: The question as it will appear in the prompt
+            fixed_tokens: Tokens of the system prompt and template text
+
+        Returns:
+            Dict with the trimmed history and query, the token allowance of the
+            context, and the token count of every section planned so far
+        """
+        query_tokens = count_tokens(query)
+        if query_tokens > self.max_query_tokens:
+            logger.warning(f"Question of {query_tokens} tokens cut to {self.max_query_tokens}")
+            query = truncate_to_tokens(query, self.max_query_tokens)
+            query_tokens = count_tokens(query)
+
+        available = max(0, self.max_prompt_tokens - fixed_tokens - query_tokens)
+        history_allowance = min(self.max_history_tokens, max(0, available - self.min_context_tokens))
+        fitted = self._fit_history(history, history_allowance)
+
+        return {
+            "history": fitted["messages"],
+            "query": query,
+            "context_tokens": max(0, min(self.max_context_tokens, available - fitted["tokens"])),
+            "tokens": {"fixed": fixed_tokens, "query": query_tokens, "history": fitted["tokens"]},
+            "messages_dropped": fitted["dropped"],
+            "messages_truncated": fitted["truncated"]
+        }
+
+    def account(self, plan: Dict, context: str) -> Dict[str, int]:
+        """Add the context to a plan and return the token count of every section and the prompt."""
+        tokens = dict(plan["tokens"])
+        tokens["context"] = count_tokens(context)
+        tokens["prompt"] = sum(tokens.values())
+        with self._lock:
+            self._totals["messages_dropped"] += plan["messages_dropped"]
+            self._totals["messages_truncated"] += plan["messages_truncated"]
+        logger.info(
+            f"Prompt tokens: fixed={tokens['fixed']}, history={tokens['history']}, context={tokens['context']}, "
+            f"query={tokens['query']}, total={tokens['prompt']} "
+            f"({plan['messages_dropped']} history messages dropped, {plan['messages_truncated']} cut)"
+        )
+        return tokens
+
+    def record_completion(self, tokens: Dict[str, int], response: str) -> Dict[str, int]:
+        """Count the tokens of the answer and add the request to the running totals."""
+        tokens = {**tokens, "completion": count_tokens(response)}
+        with self._lock:
+            self._totals["requests"] += 1
+            self._totals["prompt_tokens"] += tokens.get("prompt", 0)
+            self._totals["completion_tokens"] += tokens["completion"]
+            self._totals["max_prompt_tokens"] = max(self._totals["max_prompt_tokens"], tokens.get("prompt", 0))
+        return tokens
+
+    def stats(self) -> Dict:
+        """Return token totals and means over the requests recorded so far."""
+        with self._lock:
+            totals = dict(self._totals)
+        requests = totals["requests"]
+        totals["mean_prompt_tokens"] = round(totals["prompt_tokens"] / requests, 1) if requests else 0.0
+        totals["mean_completion_tokens"] = round(totals["completion_tokens"] / requests, 1) if requests else 0.0
+        return totals
+
+
+# Global token budget manager instance
+token_budget = lazy_service("token_budget", TokenBudgetManager)
@@ -1,16 +1,53 @@
 """
 Vector database operations for managing documents in ChromaDB
 """
-import os
-import tempfile
-from typing import List, Dict
+import contextvars
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.docstore.document import Document
+from config.settings import INGESTION_CONFIG
+from core.chunking import StreamingTextSplitter
 from core.vector_store import vector_store_manager
+from core.answer_cache import answer_cache
+from core.document_catalog import document_catalog
+from core.lexical_index import lexical_index
+from core.mmap_index import mmap_index
+from core.pdf_parsing import clean_pdf_text, iter_clean_pages, iter_pdf_pages
 from utils.logger import get_logger
-import re
+from utils.registry import lazy_service
+from utils.tracing import tracer
 logger = get_logger(__name__)
 
+
+def _timed(items: Iterable, stats: Dict[str, List[float]], name: str) -> Iterator:
+    """Pass items through, adding the time spent producing them and their count to stats[name]."""
+    iterator = iter(items)
+    stat = stats.setdefault(name, [0.0, 0])
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            stat[0] += time.perf_counter() - start
+            return
+        stat[0] += time.perf_counter() - start
+        stat[1] += 1
+        yield item
+
+
+def _record_parse_stages(stats: Dict[str, List[float]], chunk_count: int) -> None:
+    """Record the load, clean and split times gathered by _timed as spans."""
+    # Nested generators: each stage's time includes producing its input
+    stats["ingest.split"][0] -= stats["ingest.clean"][0]
+    stats["ingest.clean"][0] -= stats["ingest.pdf_load"][0]
+    tracer.record("ingest.pdf_load", stats["ingest.pdf_load"][0], pages=stats["ingest.pdf_load"][1])
+    tracer.record("ingest.clean", stats["ingest.clean"][0])
+    tracer.record("ingest.split", stats["ingest.split"][0], chunks=chunk_count)
+
+
 class VectorDBOperations:
     """Handles vector database CRUD operations."""
     
@@ -37,37 +74,113 @@ class VectorDBOperations:
                     logger.error("Could not reinitialize vector store.")
                     return []
             
-            collection = vector_store_manager.vector_store._collection
-            
-            # Get all documents with metadata
-            results = collection.get(include=["metadatas"])
-            
-            # Extract unique filenames from metadata
-            filenames = set()
-            for metadata in results["metadatas"]:
-                if metadata and "filename" in metadata:
-                    filenames.add(metadata["filename"])
-            
-            return sorted(list(filenames))
+            self._ensure_catalog()
+            return document_catalog.list_filenames()
             
         except Exception as e:
             logger.error(f"Error listing documents: {e}")
             return []
         
+    def _ensure_catalog(self):
+        """Build the document catalog from the collection the first time it is needed."""
+        if not document_catalog.is_bootstrapped():
+            logger.info("Document catalog not built yet. Scanning collection metadata once...")
+            collection = vector_store_manager.vector_store._collection
+            results = collection.get(include=["metadatas"])
+            document_catalog.bootstrap(results["metadatas"])
+    
+    @staticmethod
+    def index_lexical(chunk_ids: List[str], chunks: List[Document]):
+        """Add chunks to the BM25 index; it is derived data, so failures are only logged."""
+        try:
+            lexical_index.add(chunk_ids, [chunk.page_content for chunk in chunks],
+                              [chunk.metadata for chunk in chunks])
+        except Exception as e:
+            logger.error(f"Error updating lexical index: {e}")
+    
+    @staticmethod
+    def unindex_lexical(chunk_ids: List[str]):
+        """Remove chunks from the BM25 index; failures are only logged."""
+        try:
+            lexical_index.remove(chunk_ids)
+        except Exception as e:
+            logger.error(f"Error updating lexical index: {e}")
+    
+    @staticmethod
+    def index_vectors(chunk_ids: List[str]):
+        """
+        Copy chunks from Chroma into the memory-mapped index when it is the active
+        backend; like the BM25 index it is derived data, so failures are only logged.
+        """
+        if not chunk_ids or not vector_store_manager.uses_mmap_index():
+            return
+        try:
+            results = vector_store_manager.vector_store._collection.get(
+                ids=chunk_ids, include=["embeddings", "documents", "metadatas"]
+            )
+            mmap_index.upsert(results["ids"], results["embeddings"], results["documents"], results["metadatas"])
+        except Exception as e:
+            logger.error(f"Error updating memory-mapped index: {e}")
+    
+    @staticmethod
+    def unindex_vectors(chunk_ids: List[str]):
+        """Remove chunks from the memory-mapped index when it is the active backend."""
+        if not chunk_ids or not vector_store_manager.uses_mmap_index():
+            return
+        try:
+            mmap_index.remove(chunk_ids)
+        except Exception as e:
+            logger.error(f"Error updating memory-mapped index: {e}")
+    
+    @staticmethod
+    def content_hash(data: bytes) -> str:
+        """Return the SHA-256 hex digest of a file's contents."""
+        return hashlib.sha256(data).hexdigest()
+    
     @staticmethod
     def clean_pdf_text(text: str) -> str:
+        """Cleans up whitespace and line breaks from text extracted from a PDF."""
+        return clean_pdf_text(text)
+    
+    def iter_chunks(self, texts: Iterable[str], filename: str) -> Iterator[Document]:
+        """
+        Split cleaned text arriving in pieces (e.g. one per page) into chunks
+        tagged with the filename, yielding each chunk as soon as it is final.
         """
-        Cleans up whitespace and line breaks from text extracted from a PDF.
+        splitter = StreamingTextSplitter(self.text_splitter, {"source": filename, "filename": filename})
+        for text in texts:
+            yield from splitter.feed(text)
+        yield from splitter.finish()
+    
+    def split_text(self, cleaned_text: str, filename: str) -> List[Document]:
+        """
+        Split the cleaned text of a document into chunks tagged with its filename.
+        Gives the same chunks as streaming the text through iter_chunks.
         
-        - Replaces multiple newlines and spaces with a single space to join broken lines.
-        - Consolidates multiple spaces into a single space.
-        - Removes leading/trailing whitespace.
+        Args:
+            cleaned_text: Text returned by clean_pdf_text
+            filename: Name of the file
+            
+        Returns:
+            List of chunk documents
+        """
+        return list(self.iter_chunks([cleaned_text], filename))
+    
+    @staticmethod
+    def make_chunk_ids(filename: str, chunks: List[Document]) -> List[str]:
+        """
+        Create content-addressed IDs for each chunk of a document, so an unchanged
+        chunk keeps its ID when the document is re-ingested.
+        Repeated chunk texts within a document get an occurrence suffix.
         """
-        # Replace newlines that are not preceded by a punctuation mark, effectively joining sentences.
-        text = re.sub(r'(?<![.\-:])\s*\n\s*', ' ', text)
-        # Replace multiple spaces with a single space
-        text = re.sub(r'\s+', ' ', text)
-        return text.strip()
+        chunk_ids = []
+        seen: Dict[str, int] = {}
+        for chunk in chunks:
+            digest = hashlib.sha256(chunk.page_content.encode("utf-8")).hexdigest()[:16]
+            occurrence = seen.get(digest, 0)
+            seen[digest] = occurrence + 1
+            chunk_ids.append(f"{filename}_{digest}" if occurrence == 0 else f"{filename}_{digest}_{occurrence}")
+        return chunk_ids
     
     def add_pdf_to_vectorstore(self, uploaded_file, filename: str) -> Dict:
         """
@@ -92,74 +205,19 @@ class VectorDBOperations:
                     }
             
             # Check if document already exists
-            existing_docs = self.list_documents()
-            if filename in existing_docs:
+            self._ensure_catalog()
+            if document_catalog.contains(filename):
                 return {
                     "success": False,
                     "message": f"Document '{filename}' already exists in the vector store. Please delete it first or use a different name.",
                     "chunks_added": 0
                 }
             
-            # Save uploaded file to temporary location
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_file:
-                temp_file.write(uploaded_file.getvalue())
-                temp_file_path = temp_file.name
-            
-            try:
-                # Load PDF using PyMuPDFLoader
-                from langchain_community.document_loaders import PyMuPDFLoader
-                loader = PyMuPDFLoader(temp_file_path)
-                docs = loader.load()
-
-                # ... (error checking for empty docs) ...
-
-                # Merge all pages into a single text string
-                full_text = "\n".join([doc.page_content for doc in docs])
-
-                # CLEAN THE EXTRACTED TEXT
-                cleaned_text = self.clean_pdf_text(full_text)
-                
-                # ... (error checking for empty cleaned_text) ...
-
-                # Create a single document for splitting, now using the cleaned text
-                merged_doc = Document(
-                    page_content=cleaned_text, # <--- USE THE CLEANED TEXT HERE
-                    metadata={"source": filename, "filename": filename}
-                )
-
-                # Split into chunks
-                chunks = self.text_splitter.split_documents([merged_doc])
-                
-                if not chunks:
-                    return {
-                        "success": False,
-                        "message": "Failed to create chunks from the document.",
-                        "chunks_added": 0
-                    }
-                
-                # Create IDs for each chunk
-                chunk_ids = [f"{filename}_{i+1}" for i in range(len(chunks))]
-                
-                # Update metadata to ensure filename is stored
-                for chunk in chunks:
-                    chunk.metadata["filename"] = filename
-                    chunk.metadata["source"] = filename
-                
-                # Add chunks to vector store
-                vector_store_manager.vector_store.add_documents(chunks, ids=chunk_ids)
-                
-                logger.info(f"Successfully added {len(chunks)} chunks for {filename}")
-                
-                return {
-                    "success": True,
-                    "message": f"Successfully added '{filename}' to vector store.",
-                    "chunks_added": len(chunks)
-                }
-                
-            finally:
-                # Clean up temporary file
-                if os.path.exists(temp_file_path):
-                    os.unlink(temp_file_path)
+            # Parse, split, embed and insert, with every span tagged with the filename
+            data = uploaded_file.getvalue()
+            with tracer.trace(filename=filename):
+                result = self._add_pdf_bytes(data, filename)
+            return result
                     
         except Exception as e:
             logger.error(f"Error adding PDF to vector store: {e}")
@@ -169,7 +227,199 @@ class VectorDBOperations:
                 "chunks_added": 0
         }
 
+    def _add_pdf_bytes(self, data: bytes, filename: str) -> Dict:
+        """
+        Stream a PDF page by page through cleaning and splitting, embedding chunks
+        in batches while later pages are still being parsed, then insert them.
+        Stage times are recorded as spans; parse stages interleave, so each span
+        is the total time spent in that stage.
+        """
+        batch_size = INGESTION_CONFIG.get("embed_batch_size", 64)
+        stats: Dict[str, List[float]] = {}
+        chunks: List[Document] = []
+        batch: List[str] = []
+        futures = []
+        
+        def embed(texts: List[str]) -> List[List[float]]:
+            start = time.perf_counter()
+            vectors = vector_store_manager.embeddings.embed_documents(texts)
+            stat = stats.setdefault("ingest.embed", [0.0, 0])
+            stat[0] += time.perf_counter() - start
+            stat[1] += len(texts)
+            return vectors
+        
+        with ThreadPoolExecutor(max_workers=max(1, INGESTION_CONFIG.get("embed_concurrency", 4))) as pool:
+            pages = _timed(iter_pdf_pages(data), stats, "ingest.pdf_load")
+            texts = _timed(iter_clean_pages(pages), stats, "ingest.clean")
+            for chunk in _timed(self.iter_chunks(texts, filename), stats, "ingest.split"):
+                chunks.append(chunk)
+                batch.append(chunk.page_content)
+                if len(batch) >= batch_size:
+                    # Pool threads start with an empty context; carry the bound trace into them
+                    futures.append(pool.submit(contextvars.copy_context().run, embed, batch))
+                    batch = []
+            if batch:
+                futures.append(pool.submit(contextvars.copy_context().run, embed, batch))
+            # Batches finish out of order; collect them in submission order so vectors line up with chunks
+            embeddings = [vector for future in futures for vector in future.result()]
+        
+        _record_parse_stages(stats, len(chunks))
+        
+        if not chunks:
+            return {
+                "success": False,
+                "message": "Failed to create chunks from the document.",
+                "chunks_added": 0
+            }
+        tracer.record("ingest.embed", stats["ingest.embed"][0], chunks=len(chunks))
+        
+        # Add chunks to vector store; the catalog entry only persists if the add succeeds
+        with tracer.span("ingest.insert"):
+            chunk_ids = self.make_chunk_ids(filename, chunks)
+            with document_catalog.transaction() as txn:
+                txn.upsert(filename, len(chunks), byte_size=len(data), content_hash=self.content_hash(data))
+                vector_store_manager.vector_store._collection.upsert(
+                    ids=chunk_ids,
+                    embeddings=embeddings,
+                    metadatas=[chunk.metadata for chunk in chunks],
+                    documents=[chunk.page_content for chunk in chunks]
+                )
+            self.index_lexical(chunk_ids, chunks)
+            self.index_vectors(chunk_ids)
+        
+        # Cached answers and retrieval results may no longer reflect the knowledge base
+        answer_cache.clear()
+        document_catalog.bump_index_version()
+        
+        logger.info(f"Successfully added {len(chunks)} chunks for {filename}")
+        
+        return {
+            "success": True,
+            "message": f"Successfully added '{filename}' to vector store.",
+            "chunks_added": len(chunks)
+        }
+
+    
     
+    def update_document(self, uploaded_file, filename: str) -> Dict:
+        """
+        Re-ingest a changed PDF, embedding only chunks that are new and deleting
+        only chunks that vanished. Documents not yet in the store are added.
+        
+        Args:
+            uploaded_file: Streamlit uploaded file object
+            filename: Name of the file
+            
+        Returns:
+            Dict with operation status and the chunk-level diff
+        """
+        try:
+            if not vector_store_manager.is_available():
+                logger.warning("Vector store not available. Attempting to reinitialize...")
+                if not vector_store_manager.reinitialize_vector_store():
+                    return {
+                        "success": False,
+                        "message": "Vector store is not available and could not be reinitialized. Please check the database connection.",
+                        "chunks_added": 0,
+                        "chunks_deleted": 0,
+                        "chunks_unchanged": 0
+                    }
+            
+            self._ensure_catalog()
+            entry = document_catalog.get(filename)
+            if entry is None:
+                result = self.add_pdf_to_vectorstore(uploaded_file, filename)
+                return {**result, "chunks_deleted": 0, "chunks_unchanged": 0}
+            
+            data = uploaded_file.getvalue()
+            with tracer.trace(filename=filename, update=True):
+                return self._update_pdf_bytes(data, filename, entry)
+        
+        except Exception as e:
+            logger.error(f"Error updating document: {e}")
+            return {
+                "success": False,
+                "message": f"Error updating document: {str(e)}",
+                "chunks_added": 0,
+                "chunks_deleted": 0,
+                "chunks_unchanged": 0
+            }
+
+    def _update_pdf_bytes(self, data: bytes, filename: str, entry: Dict) -> Dict:
+        """Diff a changed PDF against its stored chunks, recording each stage as a span."""
+        content_hash = self.content_hash(data)
+        if entry["content_hash"] == content_hash:
+            return {
+                "success": True,
+                "message": f"'{filename}' is unchanged.",
+                "chunks_added": 0,
+                "chunks_deleted": 0,
+                "chunks_unchanged": entry["chunk_count"]
+            }
+        
+        stats: Dict[str, List[float]] = {}
+        pages = _timed(iter_pdf_pages(data), stats, "ingest.pdf_load")
+        texts = _timed(iter_clean_pages(pages), stats, "ingest.clean")
+        chunks = list(_timed(self.iter_chunks(texts, filename), stats, "ingest.split"))
+        _record_parse_stages(stats, len(chunks))
+        if not chunks:
+            return {
+                "success": False,
+                "message": "Failed to create chunks from the document.",
+                "chunks_added": 0,
+                "chunks_deleted": 0,
+                "chunks_unchanged": 0
+            }
+        
+        # Diff the new chunk IDs against the ones already stored for this file
+        with tracer.span("ingest.diff"):
+            chunk_ids = self.make_chunk_ids(filename, chunks)
+            collection = vector_store_manager.vector_store._collection
+            existing_ids = set(collection.get(where={"filename": filename}, include=[])["ids"])
+        
+        new_chunks = [(chunk_id, chunk) for chunk_id, chunk in zip(chunk_ids, chunks) if chunk_id not in existing_ids]
+        kept_chunks = [(chunk_id, chunk) for chunk_id, chunk in zip(chunk_ids, chunks) if chunk_id in existing_ids]
+        vanished_ids = sorted(existing_ids - set(chunk_ids))
+        
+        # Embedding the new chunks happens inside add_documents, so it is part of this span
+        with tracer.span("ingest.insert", chunks=len(new_chunks)):
+            with document_catalog.transaction() as txn:
+                txn.upsert(filename, len(chunks), byte_size=len(data), content_hash=content_hash)
+                # Add before deleting so a failed embedding leaves the old version intact
+                if new_chunks:
+                    vector_store_manager.vector_store.add_documents(
+                        [chunk for _, chunk in new_chunks],
+                        ids=[chunk_id for chunk_id, _ in new_chunks]
+                    )
+                # Unchanged chunks may have moved, so refresh their start_index without re-embedding
+                if kept_chunks:
+                    collection.update(
+                        ids=[chunk_id for chunk_id, _ in kept_chunks],
+                        metadatas=[chunk.metadata for _, chunk in kept_chunks]
+                    )
+                if vanished_ids:
+                    vector_store_manager.vector_store.delete(ids=vanished_ids)
+            
+            self.unindex_lexical(vanished_ids)
+            self.index_lexical(chunk_ids, chunks)
+            self.unindex_vectors(vanished_ids)
+            self.index_vectors(chunk_ids)
+        answer_cache.clear()
+        document_catalog.bump_index_version()
+        
+        logger.info(
+            f"Updated {filename}: {len(new_chunks)} added, {len(vanished_ids)} deleted, "
+            f"{len(kept_chunks)} unchanged"
+        )
+        
+        return {
+            "success": True,
+            "message": f"Successfully updated '{filename}': {len(new_chunks)} chunks added, "
+                       f"{len(vanished_ids)} deleted, {len(kept_chunks)} unchanged.",
+            "chunks_added": len(new_chunks),
+            "chunks_deleted": len(vanished_ids),
+            "chunks_unchanged": len(kept_chunks)
+        }
     
     def delete_document_by_filename(self, filename: str) -> Dict:
         """
@@ -192,11 +442,17 @@ class VectorDBOperations:
             collection = vector_store_manager.vector_store._collection
             
             # Query collection to find all chunks with matching filename in metadata
-            results = collection.get(where={"filename": filename})
+            results = collection.get(where={"filename": filename}, include=[])
             
             if results["ids"]:
-                # Delete the chunks
-                vector_store_manager.vector_store.delete(ids=results["ids"])
+                # Delete the chunks and the catalog entry together
+                with document_catalog.transaction() as txn:
+                    txn.remove(filename)
+                    vector_store_manager.vector_store.delete(ids=results["ids"])
+                self.unindex_lexical(results["ids"])
+                self.unindex_vectors(results["ids"])
+                answer_cache.clear()
+                document_catalog.bump_index_version()
                 
                 chunks_count = len(results["ids"])
                 logger.info(f"Deleted {chunks_count} chunks for filename: {filename}")
@@ -207,6 +463,10 @@ class VectorDBOperations:
                     "chunks_deleted": chunks_count
                 }
             else:
+                # Drop a stale catalog entry whose chunks are already gone
+                if document_catalog.contains(filename):
+                    with document_catalog.transaction() as txn:
+                        txn.remove(filename)
                 return {
                     "success": False,
                     "message": f"No document found with filename: '{filename}'",
@@ -243,18 +503,12 @@ class VectorDBOperations:
                         "error": "Vector store unavailable and could not be reinitialized"
                     }
             
-            collection = vector_store_manager.vector_store._collection
-            results = collection.get(include=["metadatas"])
-            
-            # Count unique documents
-            filenames = set()
-            for metadata in results["metadatas"]:
-                if metadata and "filename" in metadata:
-                    filenames.add(metadata["filename"])
+            self._ensure_catalog()
+            catalog_stats = document_catalog.stats()
             
             return {
-                "total_documents": len(filenames),
-                "total_chunks": len(results["metadatas"]),
+                "total_documents": catalog_stats["total_documents"],
+                "total_chunks": catalog_stats["total_chunks"],
                 "available": True
             }
             
@@ -269,4 +523,4 @@ class VectorDBOperations:
     
 
 # Global vector operations instance
-vector_db_operations = VectorDBOperations()
\ No newline at end of file
+vector_db_operations = lazy_service("vector_db_operations", VectorDBOperations)
\ No newline at end of file
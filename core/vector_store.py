@@ -1,11 +1,18 @@
 """
 Vector store management
 """
+import json
 import os
 from langchain_chroma import Chroma
 from models.embeddings import get_embeddings
-from config.settings import VECTOR_STORE_CONFIG
+from config.settings import VECTOR_STORE_CONFIG, LEXICAL_INDEX_CONFIG, RETRIEVAL_CACHE_CONFIG
+from core.lexical_index import lexical_index
+from core.hybrid_retriever import HybridRetriever
+from core.mmap_index import MmapRetriever, mmap_index
+from core.mmr import ChromaMMRRetriever
+from core.retrieval_cache import CachedRetriever, retrieval_cache
 from utils.logger import get_logger
+from utils.registry import lazy_service
 
 logger = get_logger(__name__)
 
@@ -19,12 +26,14 @@ class VectorStoreManager:
         self._load_vector_store()
     
     def _load_vector_store(self):
-        """Load vector store from disk or create new one if not exists."""
+        """Connect to the Chroma server, or load the embedded store from disk or create a new one."""
         try:
-            db_path = VECTOR_STORE_CONFIG["db_path"]
-            if os.path.exists(db_path):
+            if VECTOR_STORE_CONFIG.get("mode", "embedded") == "http":
+                self._connect_vector_store()
+            elif os.path.exists(VECTOR_STORE_CONFIG["db_path"]):
                 self.vector_store = Chroma(
-                    persist_directory=db_path,
+                    collection_name=VECTOR_STORE_CONFIG.get("collection_name", "langchain"),
+                    persist_directory=VECTOR_STORE_CONFIG["db_path"],
                     embedding_function=self.embeddings
                 )
                 logger.info("Vector store loaded successfully.")
@@ -35,6 +44,17 @@ class VectorStoreManager:
         except Exception as e:
             logger.error(f"Failed to load vector store: {e}")
     
+    def _connect_vector_store(self):
+        """Use the collection on the shared Chroma server, creating it if needed."""
+        from core.chroma_client import create_http_client
+        
+        self.vector_store = Chroma(
+            collection_name=VECTOR_STORE_CONFIG.get("collection_name", "langchain"),
+            client=create_http_client(),
+            embedding_function=self.embeddings
+        )
+        logger.info("Vector store connected to Chroma server.")
+    
     def _create_new_vector_store(self):
         """Create a new empty vector store."""
         try:
@@ -44,6 +64,7 @@ class VectorStoreManager:
             
             # Create a new empty Chroma vector store
             self.vector_store = Chroma(
+                collection_name=VECTOR_STORE_CONFIG.get("collection_name", "langchain"),
                 persist_directory=db_path,
                 embedding_function=self.embeddings
             )
@@ -59,18 +80,90 @@ class VectorStoreManager:
             return
         
         try:
-            self.retriever = self.vector_store.as_retriever(
-                search_type=VECTOR_STORE_CONFIG["search_type"],
-                search_kwargs={
-                    "k": VECTOR_STORE_CONFIG["k"],
-                    "fetch_k": VECTOR_STORE_CONFIG["fetch_k"],
-                    "lambda_mult": VECTOR_STORE_CONFIG["lambda_mult"]
-                }
-            )
+            if self.uses_mmap_index():
+                self._ensure_mmap_index()
+                self.retriever = MmapRetriever(
+                    index=mmap_index,
+                    embeddings=self.embeddings,
+                    k=VECTOR_STORE_CONFIG["k"],
+                    search_type=VECTOR_STORE_CONFIG["search_type"],
+                    fetch_k=VECTOR_STORE_CONFIG["fetch_k"],
+                    lambda_mult=VECTOR_STORE_CONFIG["lambda_mult"]
+                )
+            elif VECTOR_STORE_CONFIG["search_type"] == "mmr":
+                # MMR over the stored candidate embeddings instead of Chroma's built-in search
+                self.retriever = ChromaMMRRetriever(
+                    collection=self.vector_store._collection,
+                    embeddings=self.embeddings,
+                    k=VECTOR_STORE_CONFIG["k"],
+                    fetch_k=VECTOR_STORE_CONFIG["fetch_k"],
+                    lambda_mult=VECTOR_STORE_CONFIG["lambda_mult"]
+                )
+            else:
+                self.retriever = self.vector_store.as_retriever(
+                    search_type=VECTOR_STORE_CONFIG["search_type"],
+                    search_kwargs={
+                        "k": VECTOR_STORE_CONFIG["k"],
+                        "fetch_k": VECTOR_STORE_CONFIG["fetch_k"],
+                        "lambda_mult": VECTOR_STORE_CONFIG["lambda_mult"]
+                    }
+                )
+            if VECTOR_STORE_CONFIG.get("retrieval_mode", "dense") == "hybrid":
+                self._ensure_lexical_index()
+                self.retriever = HybridRetriever(
+                    dense_retriever=self.retriever,
+                    lexical_index=lexical_index,
+                    k=VECTOR_STORE_CONFIG["k"],
+                    lexical_fetch_k=LEXICAL_INDEX_CONFIG.get("fetch_k", 20),
+                    rrf_k=LEXICAL_INDEX_CONFIG.get("rrf_k", 60),
+                    lexical_fast_path=LEXICAL_INDEX_CONFIG.get("lexical_fast_path", True),
+                    decisive_min_score=LEXICAL_INDEX_CONFIG.get("decisive_min_score", 8.0),
+                    decisive_score_ratio=LEXICAL_INDEX_CONFIG.get("decisive_score_ratio", 1.5)
+                )
+            if RETRIEVAL_CACHE_CONFIG.get("enabled", True):
+                self.retriever = CachedRetriever(
+                    retriever=self.retriever,
+                    cache=retrieval_cache,
+                    config_key=self._retriever_config_key()
+                )
             logger.info("Retriever created successfully.")
         except Exception as e:
             logger.error(f"Failed to create retriever: {e}")
     
+    @staticmethod
+    def _retriever_config_key() -> str:
+        """Settings that change retrieval results, serialised as part of the cache key."""
+        config = {key: VECTOR_STORE_CONFIG.get(key) for key in (
+            "mode", "db_path", "server_host", "server_port", "collection_name",
+            "retrieval_mode", "index_backend", "search_type", "k", "fetch_k", "lambda_mult"
+        )}
+        if config["retrieval_mode"] == "hybrid":
+            config["lexical"] = {key: value for key, value in LEXICAL_INDEX_CONFIG.items() if key != "path"}
+        return json.dumps(config, sort_keys=True)
+
+    def _ensure_lexical_index(self):
+        """Build the BM25 index from the vector store if it is missing or out of step."""
+        collection = self.vector_store._collection
+        if len(lexical_index) == collection.count():
+            return
+        logger.info("Lexical index out of sync with vector store. Rebuilding...")
+        results = collection.get(include=["documents", "metadatas"])
+        lexical_index.rebuild(results["ids"], results["documents"], results["metadatas"])
+    
+    @staticmethod
+    def uses_mmap_index() -> bool:
+        """Whether dense search runs on the memory-mapped index instead of Chroma."""
+        return VECTOR_STORE_CONFIG.get("index_backend", "chroma") == "mmap"
+    
+    def _ensure_mmap_index(self):
+        """Export the vector store into the memory-mapped index if it is missing or out of step."""
+        collection = self.vector_store._collection
+        if len(mmap_index) == collection.count():
+            return
+        logger.info("Memory-mapped index out of sync with vector store. Rebuilding...")
+        results = collection.get(include=["embeddings", "documents", "metadatas"])
+        mmap_index.rebuild(results["ids"], results["embeddings"], results["documents"], results["metadatas"])
+    
     def get_retriever(self):
         """Get retriever instance."""
         return self.retriever
@@ -90,4 +183,4 @@ class VectorStoreManager:
         return self.vector_store is not None
 
 # Global vector store instance
-vector_store_manager = VectorStoreManager()
\ No newline at end of file
+vector_store_manager = lazy_service("vector_store_manager", VectorStoreManager)
\ No newline at end of file
@@ -0,0 +1,248 @@
+"""
+Persistent, content-addressed cache for embedding vectors
+"""
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# SQLite caps the number of bound parameters per statement
+_SQLITE_BATCH_SIZE = 500
+
+# LRU order only needs to be roughly right: an entry's access time is refreshed
+# at most this often, and refreshes are written in batches
+_ACCESS_REFRESH_SECONDS = 3600
+_ACCESS_FLUSH_BATCH = 256
+
+
+class EmbeddingCache:
+    """
+    SQLite-backed store of embedding vectors keyed by (model name, text hash).
+
+    Lookups are plain reads. Access times that are more than an hour old are
+    queued in memory and written together with the next insert, or once
+    enough of them have queued up. The row count is tracked in memory as an
+    upper bound and only recounted when it passes max_entries, so inserts
+    do not scan the table.
+    """
+
+    def __init__(self, path: str, max_entries: int = 200000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, model TEXT NOT NULL, vector BLOB NOT NULL, "
+            "last_access REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings(last_access)"
+        )
+        self._conn.commit()
+        self._pending_access: Dict[str, float] = {}
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        logger.info(f"Embedding cache opened at: {path}")
+
+    @staticmethod
+    def make_key(model: str, text: str) -> str:
+        """Build the content-addressed key for a text embedded with a given model."""
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{model}:{digest}"
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        """Look up a batch of keys, returning only the ones present in the cache."""
+        found: Dict[str, List[float]] = {}
+        unique_keys = list(dict.fromkeys(keys))
+        with self._lock:
+            for start in range(0, len(unique_keys), _SQLITE_BATCH_SIZE):
+                batch = unique_keys[start:start + _SQLITE_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector, last_access FROM embeddings WHERE key IN ({placeholders})",
+                    batch
+                ).fetchall()
+                now = time.time()
+                for key, blob, last_access in rows:
+                    found[key] = array("f", blob).tolist()
+                    if now - last_access > _ACCESS_REFRESH_SECONDS:
+                        self._pending_access[key] = now
+            if len(self._pending_access) >= _ACCESS_FLUSH_BATCH:
+                self._flush_access()
+                self._conn.commit()
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+        return found
+
+    def put_many(self, model: str, items: Dict[str, List[float]]) -> None:
+        """Store a batch of vectors and evict the least recently used entries if over budget."""
+        if not items:
+            return
+        now = time.time()
+        rows = [(key, model, array("f", vector).tobytes(), now) for key, vector in items.items()]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector, last_access) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._flush_access()
+            self._conn.commit()
+            # Replaced rows are counted too, so this stays an upper bound
+            self._count += len(rows)
+            if self._count > self.max_entries:
+                self._evict()
+
+    def _flush_access(self) -> None:
+        """Write queued access times in the current transaction. Caller holds the lock."""
+        if self._pending_access:
+            self._conn.executemany(
+                "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                [(accessed, key) for key, accessed in self._pending_access.items()]
+            )
+            self._pending_access.clear()
+
+    def _evict(self) -> None:
+        """Drop the least recently used entries once the cache exceeds max_entries."""
+        # Recount, since replaced rows and other processes' inserts skew the estimate
+        count = self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if count <= self.max_entries:
+            return
+        # Evict down to 90% of the budget so eviction does not run on every insert
+        excess = count - int(self.max_entries * 0.9)
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN "
+            "(SELECT key FROM embeddings ORDER BY last_access ASC LIMIT ?)",
+            (excess,)
+        )
+        self._conn.commit()
+        self._count = count - excess
+        logger.info(f"Evicted {excess} entries from embedding cache")
+
+    def stats(self) -> Dict:
+        """Return hit/miss counters and the current number of cached vectors."""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "max_entries": self.max_entries
+        }
+
+    def clear(self) -> None:
+        """Remove every cached vector and reset the counters."""
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+            self._pending_access.clear()
+            self._count = 0
+            self.hits = 0
+            self.misses = 0
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that serves repeated texts from an EmbeddingCache."""
+
+    def __init__(self, underlying: Embeddings, cache: EmbeddingCache, model_name: str,
+                 cache_queries: bool = True):
+        self.underlying = underlying
+        self.cache = cache
+        self.model_name = model_name
+        self.cache_queries = cache_queries
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts, calling the underlying model only for cache misses."""
+        keys = [EmbeddingCache.make_key(self.model_name, text) for text in texts]
+        cached = self.cache.get_many(keys)
+
+        # Embed each missing text once, even if it appears several times in the batch
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+
+        if missing:
+            vectors = self.underlying.embed_documents(list(missing.values()))
+            fresh = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(self.model_name, fresh)
+            cached.update(fresh)
+            logger.info(f"Embedded {len(missing)} new texts, {len(texts) - len(missing)} served from cache")
+
+        return [cached[key] for key in keys]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Async counterpart of embed_documents; only cache misses await the model."""
+        keys = [EmbeddingCache.make_key(self.model_name, text) for text in texts]
+        # Cache reads and writes are SQLite calls, kept off the event loop
+        cached = await asyncio.to_thread(self.cache.get_many, keys)
+
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+
+        if missing:
+            vectors = await self.underlying.aembed_documents(list(missing.values()))
+            fresh = dict(zip(missing.keys(), vectors))
+            await asyncio.to_thread(self.cache.put_many, self.model_name, fresh)
+            cached.update(fresh)
+
+        return [cached[key] for key in keys]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """Async counterpart of embed_query."""
+        if not self.cache_queries:
+            return await self.underlying.aembed_query(text)
+
+        key = EmbeddingCache.make_key(f"{self.model_name}:query", text)
+        cached = await asyncio.to_thread(self.cache.get_many, [key])
+        if key in cached:
+            return cached[key]
+
+        vector = await self.underlying.aembed_query(text)
+        await asyncio.to_thread(self.cache.put_many, self.model_name, {key: vector})
+        return vector
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a query, optionally serving it from the cache."""
+        if not self.cache_queries:
+            return self.underlying.embed_query(text)
+
+        key = EmbeddingCache.make_key(f"{self.model_name}:query", text)
+        cached = self.cache.get_many([key])
+        if key in cached:
+            return cached[key]
+
+        vector = self.underlying.embed_query(text)
+        self.cache.put_many(self.model_name, {key: vector})
+        return vector
+
+    def stats(self) -> Dict:
+        """Return the cache statistics."""
+        return self.cache.stats()
+
+
+_embedding_cache: Optional[EmbeddingCache] = None
+
+
+def get_embedding_cache(path: str, max_entries: int) -> EmbeddingCache:
+    """Return the process-wide EmbeddingCache, opening it on first use."""
+    global _embedding_cache
+    if _embedding_cache is None:
+        _embedding_cache = EmbeddingCache(path, max_entries=max_entries)
+    return _embedding_cache
@@ -1,20 +1,96 @@
 """
 Embedding models configuration
 """
+from typing import Dict
+from langchain_core.embeddings import Embeddings
 from langchain_openai import OpenAIEmbeddings
-from config.settings import MODEL_CONFIG
+from config.settings import MODEL_CONFIG, EMBEDDING_CACHE_CONFIG
+from models.embedding_cache import CachedEmbeddings, get_embedding_cache
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+
+class EmbeddingProvider:
+    """A backend that can build an embedding model."""
+
+    name = ""
+    # Whether vectors are expensive enough to be worth keeping in the embedding cache
+    cacheable = True
+
+    def create(self) -> Embeddings:
+        raise NotImplementedError
+
+    def model_id(self, embeddings: Embeddings) -> str:
+        """Identifier of the vectors produced, used to key the embedding cache."""
+        raise NotImplementedError
+
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    """OpenAI embedding API (network round trip per batch)."""
+
+    name = "openai"
+
+    def create(self) -> Embeddings:
+        return OpenAIEmbeddings(model=MODEL_CONFIG["embedding_model"])
+
+    def model_id(self, embeddings: Embeddings) -> str:
+        return MODEL_CONFIG["embedding_model"]
+
+
+class LocalEmbeddingProvider(EmbeddingProvider):
+    """Corpus-fitted TF-IDF + SVD model running on the local CPU."""
+
+    name = "local"
+    # Local inference takes about as long as a cache lookup
+    cacheable = False
+
+    def create(self) -> Embeddings:
+        from models.local_embeddings import get_local_embeddings
+        return get_local_embeddings()
+
+    def model_id(self, embeddings: Embeddings) -> str:
+        return f"tfidf-svd-{embeddings.fingerprint}"
+
+
+EMBEDDING_PROVIDERS: Dict[str, EmbeddingProvider] = {}
+
+
+def register_embedding_provider(provider: EmbeddingProvider) -> None:
+    """Make a provider selectable through MODEL_CONFIG["embedding_provider"]."""
+    EMBEDDING_PROVIDERS[provider.name] = provider
+
+
+register_embedding_provider(OpenAIEmbeddingProvider())
+register_embedding_provider(LocalEmbeddingProvider())
+
+
 def get_embeddings():
     """
-    Returns an instance of the OpenAI embedding model specified in MODEL_CONFIG.
+    Returns an instance of the embedding model of the provider selected in
+    MODEL_CONFIG["embedding_provider"], wrapped in the persistent embedding cache
+    when EMBEDDING_CACHE_CONFIG enables it and the provider benefits from it.
     """
     try:
-        embeddings = OpenAIEmbeddings(model=MODEL_CONFIG["embedding_model"])
-        logger.info("Embeddings model initialized successfully.")
+        provider_name = MODEL_CONFIG.get("embedding_provider", "openai")
+        provider = EMBEDDING_PROVIDERS.get(provider_name)
+        if provider is None:
+            raise ValueError(f"Unknown embedding provider: {provider_name}")
+
+        embeddings = provider.create()
+        if provider.cacheable and EMBEDDING_CACHE_CONFIG.get("enabled", False):
+            cache = get_embedding_cache(
+                EMBEDDING_CACHE_CONFIG["path"],
+                EMBEDDING_CACHE_CONFIG.get("max_entries", 200000)
+            )
+            embeddings = CachedEmbeddings(
+                embeddings,
+                cache,
+                model_name=provider.model_id(embeddings),
+                cache_queries=EMBEDDING_CACHE_CONFIG.get("cache_queries", True)
+            )
+        logger.info(f"Embeddings model initialized successfully ({provider_name}).")
         return embeddings
     except Exception as e:
         logger.error(f"Failed to initialize embeddings: {e}")
-        raise
\ No newline at end of file
+        raise
@@ -0,0 +1,255 @@
+"""
+Local CPU embedding model: TF-IDF features reduced with a truncated SVD (LSA)
+
+The model is fitted on the PDFs of the knowledge base, persisted as a single
+.npz file and needs no network access or downloads. Run
+    python -m models.local_embeddings --fit Docs
+to (re)fit it explicitly; otherwise it is fitted on first use.
+"""
+import argparse
+import hashlib
+import math
+import os
+import re
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from config.settings import LOCAL_EMBEDDING_CONFIG
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+# Extra random directions and power iterations of the randomized SVD
+_SVD_OVERSAMPLES = 10
+_SVD_POWER_ITERATIONS = 2
+
+
+def _features(text: str) -> Counter:
+    """Unigram and bigram counts of a text."""
+    words = _TOKEN_PATTERN.findall(text.lower())
+    features = Counter(words)
+    features.update(f"{a} {b}" for a, b in zip(words, words[1:]))
+    return features
+
+
+def _window_texts(text: str, size: int = 1200, step: int = 800) -> List[str]:
+    """Cut a document into overlapping windows comparable to the ingestion chunks."""
+    windows = []
+    for start in range(0, len(text), step):
+        windows.append(text[start:start + size])
+        if start + size >= len(text):
+            break
+    return [window for window in windows if window.strip()]
+
+
+class TfidfSvdEmbeddings(Embeddings):
+    """
+    Embeds texts as L2-normalised projections of their TF-IDF vectors onto the
+    top singular directions of the training corpus.
+
+    Inference runs in batches of batch_size texts spread over num_threads
+    threads; the matrix products release the GIL.
+    """
+
+    def __init__(self, vocabulary: Dict[str, int], idf: np.ndarray, components: np.ndarray,
+                 batch_size: int = 64, num_threads: Optional[int] = None):
+        self.vocabulary = vocabulary
+        self.idf = idf.astype(np.float32)
+        # (features, dimensions), so a batch projects with a single matmul
+        self.projection = np.ascontiguousarray(components.T, dtype=np.float32)
+        self.batch_size = batch_size
+        self.num_threads = num_threads or os.cpu_count() or 1
+        self.dimensions = self.projection.shape[1]
+        self.fingerprint = self._fingerprint()
+
+    def _fingerprint(self) -> str:
+        """Short hash identifying the fitted model, so cached vectors never outlive a refit."""
+        digest = hashlib.sha256()
+        digest.update("\n".join(sorted(self.vocabulary)).encode("utf-8"))
+        digest.update(self.projection.tobytes())
+        return digest.hexdigest()[:12]
+
+    def _tfidf(self, texts: List[str]) -> np.ndarray:
+        """Sublinear TF-IDF matrix of a batch of texts, rows L2-normalised."""
+        matrix = np.zeros((len(texts), len(self.vocabulary)), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, count in _features(text).items():
+                column = self.vocabulary.get(feature)
+                if column is not None:
+                    matrix[row, column] = 1.0 + math.log(count)
+        matrix *= self.idf
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-12)
+
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        vectors = self._tfidf(texts) @ self.projection
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def embed_array(self, texts: List[str]) -> np.ndarray:
+        """Embed texts into a (len(texts), dimensions) float32 array."""
+        if not texts:
+            return np.zeros((0, self.dimensions), dtype=np.float32)
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if len(batches) == 1 or self.num_threads == 1:
+            return np.vstack([self._embed_batch(batch) for batch in batches])
+        with ThreadPoolExecutor(max_workers=min(self.num_threads, len(batches))) as pool:
+            return np.vstack(list(pool.map(self._embed_batch, batches)))
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_array(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed_batch([text])[0].tolist()
+
+    @classmethod
+    def fit(cls, texts: List[str], dimensions: int = 256, max_features: int = 8192,
+            min_df: int = 2, **kwargs) -> "TfidfSvdEmbeddings":
+        """
+        Fit the vocabulary, IDF weights and SVD components on a corpus.
+
+        The SVD is a randomized range finder that streams the TF-IDF matrix in
+        batches, so memory stays proportional to corpus size times dimensions
+        rather than corpus size times vocabulary.
+        """
+        if not texts:
+            raise ValueError("Cannot fit the local embedding model on an empty corpus.")
+
+        document_frequency: Counter = Counter()
+        for text in texts:
+            document_frequency.update(_features(text).keys())
+        frequent = [(feature, df) for feature, df in document_frequency.items() if df >= min_df]
+        if len(frequent) < 2:
+            frequent = list(document_frequency.items())
+        frequent.sort(key=lambda item: (-item[1], item[0]))
+        frequent = frequent[:max_features]
+        vocabulary = {feature: index for index, (feature, _) in enumerate(frequent)}
+        idf = np.array(
+            [math.log((1 + len(texts)) / (1 + df)) + 1.0 for _, df in frequent], dtype=np.float32
+        )
+
+        # A model without components is enough to compute TF-IDF batches while fitting
+        model = cls(vocabulary, idf, np.zeros((1, len(vocabulary)), dtype=np.float32), **kwargs)
+        batch_size = 512
+
+        def tfidf_batches() -> Iterable[np.ndarray]:
+            for start in range(0, len(texts), batch_size):
+                yield model._tfidf(texts[start:start + batch_size])
+
+        rank = max(1, min(dimensions, len(texts), len(vocabulary)))
+        sketch = min(rank + _SVD_OVERSAMPLES, len(texts), len(vocabulary))
+        rng = np.random.default_rng(0)
+        omega = rng.standard_normal((len(vocabulary), sketch)).astype(np.float32)
+
+        # Range of X: Y = X @ omega, refined by power iterations Y = X @ (X.T @ Q)
+        basis = np.vstack([batch @ omega for batch in tfidf_batches()])
+        for _ in range(_SVD_POWER_ITERATIONS):
+            basis, _ = np.linalg.qr(basis)
+            back = np.zeros((len(vocabulary), basis.shape[1]), dtype=np.float32)
+            for start, batch in zip(range(0, len(texts), batch_size), tfidf_batches()):
+                back += batch.T @ basis[start:start + batch_size]
+            basis = np.vstack([batch @ back for batch in tfidf_batches()])
+        basis, _ = np.linalg.qr(basis)
+
+        # Small (sketch x features) matrix B = Q.T @ X whose right singular vectors we keep
+        small = np.zeros((basis.shape[1], len(vocabulary)), dtype=np.float32)
+        for start, batch in zip(range(0, len(texts), batch_size), tfidf_batches()):
+            small += basis[start:start + batch_size].T @ batch
+        _, _, components = np.linalg.svd(small, full_matrices=False)
+
+        logger.info(f"Fitted local embedding model on {len(texts)} texts: "
+                    f"{len(vocabulary)} features, {rank} dimensions")
+        return cls(vocabulary, idf, components[:rank], **kwargs)
+
+    def save(self, path: str) -> None:
+        """Persist the model atomically as a compressed .npz file."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        features = sorted(self.vocabulary, key=self.vocabulary.get)
+        temp_path = f"{path}.tmp.npz"
+        np.savez_compressed(
+            temp_path,
+            features=np.array(features, dtype=str),
+            idf=self.idf,
+            components=self.projection.T
+        )
+        os.replace(temp_path, path)
+        logger.info(f"Saved local embedding model to {path}")
+
+    @classmethod
+    def load(cls, path: str, **kwargs) -> "TfidfSvdEmbeddings":
+        """Load a model written by save()."""
+        with np.load(path) as data:
+            vocabulary = {feature: index for index, feature in enumerate(data["features"].tolist())}
+            return cls(vocabulary, data["idf"], data["components"], **kwargs)
+
+
+def load_corpus(directory: str) -> List[str]:
+    """Extract the text of every PDF in a directory, cut into chunk-sized windows."""
+    from core.pdf_parsing import extract_pdf_text
+
+    texts: List[str] = []
+    for name in sorted(os.listdir(directory)):
+        if not name.lower().endswith(".pdf"):
+            continue
+        try:
+            with open(os.path.join(directory, name), "rb") as f:
+                text, _ = extract_pdf_text(f.read())
+            texts.extend(_window_texts(text))
+        except Exception as e:
+            logger.error(f"Skipping {name} while building the embedding corpus: {e}")
+    return texts
+
+
+def fit_local_embeddings(corpus_dir: Optional[str] = None, path: Optional[str] = None) -> TfidfSvdEmbeddings:
+    """Fit the local model on the PDFs of corpus_dir and persist it."""
+    corpus_dir = corpus_dir or LOCAL_EMBEDDING_CONFIG["corpus_dir"]
+    path = path or LOCAL_EMBEDDING_CONFIG["path"]
+    model = TfidfSvdEmbeddings.fit(
+        load_corpus(corpus_dir),
+        dimensions=LOCAL_EMBEDDING_CONFIG.get("dimensions", 256),
+        max_features=LOCAL_EMBEDDING_CONFIG.get("max_features", 8192),
+        min_df=LOCAL_EMBEDDING_CONFIG.get("min_df", 2),
+        batch_size=LOCAL_EMBEDDING_CONFIG.get("batch_size", 64),
+        num_threads=LOCAL_EMBEDDING_CONFIG.get("num_threads")
+    )
+    model.save(path)
+    return model
+
+
+_local_model: Optional[TfidfSvdEmbeddings] = None
+_local_model_lock = threading.Lock()
+
+
+def get_local_embeddings() -> TfidfSvdEmbeddings:
+    """Return the process-wide local model, loading it from disk or fitting it on first use."""
+    global _local_model
+    with _local_model_lock:
+        if _local_model is None:
+            path = LOCAL_EMBEDDING_CONFIG["path"]
+            if os.path.exists(path):
+                _local_model = TfidfSvdEmbeddings.load(
+                    path,
+                    batch_size=LOCAL_EMBEDDING_CONFIG.get("batch_size", 64),
+                    num_threads=LOCAL_EMBEDDING_CONFIG.get("num_threads")
+                )
+                logger.info(f"Loaded local embedding model from {path}")
+            else:
+                logger.warning(f"No local embedding model at {path}, fitting one now...")
+                _local_model = fit_local_embeddings(path=path)
+        return _local_model
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit the local TF-IDF + SVD embedding model")
+    parser.add_argument("--fit", metavar="DIR", default=LOCAL_EMBEDDING_CONFIG["corpus_dir"],
+                        help="Directory of PDFs to fit on")
+    parser.add_argument("--output", default=LOCAL_EMBEDDING_CONFIG["path"])
+    args = parser.parse_args()
+    fitted = fit_local_embeddings(args.fit, args.output)
+    print(f"Fitted {fitted.dimensions}-dimensional model with {len(fitted.vocabulary)} features -> {args.output}")
@@ -1,107 +1,128 @@
 """
 Simplified Chat service for single chat interface
 """
-import json
-import os
+import threading
 import uuid
 from datetime import datetime
 from typing import Dict, List, Any, Optional
-from config.settings import CHAT_HISTORY_FILE
+from config.settings import CHAT_HISTORY_FILE, CHAT_STORE_CONFIG
+from services.chat_store import create_chat_store, migrate_json_history
+from services.feedback_store import feedback_store
 from utils.logger import get_logger
+from utils.registry import lazy_service
 
 logger = get_logger(__name__)
 
+# Seconds after startup before the first maintenance run, so it never competes with warm-up
+_MAINTENANCE_START_DELAY = 60
+
+
 class SimplifiedChatService:
     """Service to manage chat history with unique IDs for each session."""
     
     def __init__(self):
-        self.chat_file = CHAT_HISTORY_FILE
+        self.store = create_chat_store()
         self.current_chat_id: Optional[str] = None
-        self._ensure_data_directory()
-        self._initialize_chat_file()
-    
-    def _ensure_data_directory(self):
-        """Ensure the data directory for the chat history file exists."""
-        data_dir = os.path.dirname(self.chat_file)
-        if not os.path.exists(data_dir):
-            os.makedirs(data_dir)
-            logger.info(f"Created data directory: {data_dir}")
+        self._migrate_legacy_history()
+        self._start_maintenance()
     
-    def _initialize_chat_file(self):
-        """Ensure the chat history file exists and is a valid JSON dictionary."""
+    def _migrate_legacy_history(self):
+        """Import the legacy chat_history.json file into the chat store on first run."""
         try:
-            if not os.path.exists(self.chat_file):
-                self._create_empty_chat_file()
-            else:
-                with open(self.chat_file, 'r', encoding='utf-8') as f:
-                    # Check if file is empty or not a dictionary
-                    content = f.read()
-                    if not content or not isinstance(json.loads(content), dict):
-                        logger.warning("Chat history file is empty or malformed. Re-initializing.")
-                        self._create_empty_chat_file()
-        except (json.JSONDecodeError, Exception) as e:
-            logger.error(f"Error initializing chat file: {e}. Recreating it.")
-            self._create_empty_chat_file()
-
-    def _create_empty_chat_file(self):
-        """Create an empty JSON object in the chat history file."""
+            migrate_json_history(CHAT_HISTORY_FILE, self.store)
+        except Exception as e:
+            logger.error(f"Error migrating legacy chat history: {e}")
+    
+    def _start_maintenance(self):
+        """Run retention and compaction periodically in a daemon thread."""
+        interval_hours = CHAT_STORE_CONFIG.get("maintenance_interval_hours")
+        if not interval_hours:
+            return
+        
+        def loop():
+            delay = _MAINTENANCE_START_DELAY
+            while not self._maintenance_stop.wait(delay):
+                self.run_maintenance()
+                delay = interval_hours * 3600
+        
+        self._maintenance_stop = threading.Event()
+        threading.Thread(target=loop, name="chat-store-maintenance", daemon=True).start()
+    
+    def run_maintenance(self) -> Dict[str, int]:
+        """Expire and compact old chat history as configured in CHAT_STORE_CONFIG."""
         try:
-            with open(self.chat_file, 'w', encoding='utf-8') as f:
-                json.dump({}, f)
-            logger.info(f"Created empty chat file at: {self.chat_file}")
+            return self.store.maintain(
+                retention_days=CHAT_STORE_CONFIG.get("retention_days"),
+                compact_after_days=CHAT_STORE_CONFIG.get("compact_after_days"),
+                archive_dir=CHAT_STORE_CONFIG.get("archive_dir")
+            )
         except Exception as e:
-            logger.error(f"Error creating empty chat file: {e}")
+            logger.error(f"Error maintaining chat store: {e}")
+            return {}
     
     def load_chat_messages(self, chat_id: str) -> List[Dict[str, Any]]:
         """Load messages for a specific chat ID."""
         try:
-            with open(self.chat_file, 'r', encoding='utf-8') as f:
-                all_chats = json.load(f)
-            return all_chats.get(chat_id, {}).get("messages", [])
-        except (IOError, json.JSONDecodeError) as e:
+            return self.store.load_messages(chat_id)
+        except Exception as e:
             logger.error(f"Error loading messages for chat {chat_id}: {e}")
             return []
 
-    def save_message(self, chat_id: str, role: str, content: str) -> bool:
-        """Save a message to a specific chat session identified by chat_id."""
+    def history_revision(self, chat_id: str) -> Optional[str]:
+        """Return a value that changes whenever the stored history of a chat does, or None on error."""
+        try:
+            return self.store.history_revision(chat_id)
+        except Exception as e:
+            logger.error(f"Error reading history revision of chat {chat_id}: {e}")
+            return None
+
+    def save_message(self, chat_id: str, role: str, content: str) -> Optional[str]:
+        """
+        Save a message to a specific chat session identified by chat_id.
+        
+        Returns:
+            The new message's ID, or None if it could not be saved
+        """
         if not chat_id:
             logger.error("Cannot save message with empty chat_id.")
-            return False
+            return None
         try:
-            with open(self.chat_file, 'r+', encoding='utf-8') as f:
-                all_chats = json.load(f)
-                
-                # Create chat session if it doesn't exist
-                if chat_id not in all_chats:
-                    all_chats[chat_id] = {
-                        "created_at": datetime.now().isoformat(),
-                        "messages": []
-                    }
+            now = datetime.now().isoformat()
+            
+            # Create chat session if it doesn't exist
+            if not self.store.chat_exists(chat_id):
+                self.store.create_chat(chat_id, now)
 
-                # Append new message
-                message = {
-                    "role": role,
-                    "content": content,
-                    "timestamp": datetime.now().isoformat()
-                }
-                all_chats[chat_id]["messages"].append(message)
-                
-                # Write back to file
-                f.seek(0)
-                f.truncate()
-                json.dump(all_chats, f, ensure_ascii=False, indent=4)
+            # Append new message
+            message = {
+                "role": role,
+                "content": content,
+                "timestamp": now,
+                "message_id": uuid.uuid4().hex
+            }
+            self.store.append_message(chat_id, message)
             
             logger.info(f"Saved {role} message to chat {chat_id}")
-            return True
-        except (IOError, json.JSONDecodeError) as e:
+            return message["message_id"]
+        except Exception as e:
             logger.error(f"Error saving message to chat {chat_id}: {e}")
+            return None
+    
+    def save_feedback(self, chat_id: str, message_id: str, feedback: str) -> bool:
+        """Record feedback for an assistant message as a single append to the feedback log."""
+        try:
+            feedback_store.record(chat_id, message_id, feedback)
+            logger.info(f"Saved '{feedback}' feedback for message {message_id} in chat {chat_id}")
+            return True
+        except Exception as e:
+            logger.error(f"Error saving feedback for chat {chat_id}: {e}")
             return False
     
     def create_new_chat(self) -> str:
         """Create a new chat session, assign a new UUID, and set it as current."""
         self.current_chat_id = str(uuid.uuid4())
         logger.info(f"New chat session created with ID: {self.current_chat_id}")
-        # Ensure the new chat is initialized in the file right away
+        # Ensure the new chat is initialized in the store right away
         self.save_message(self.current_chat_id, "system", "Chat session started.")
         return self.current_chat_id
 
@@ -111,4 +132,4 @@ class SimplifiedChatService:
 
 
 # Global simplified chat service instance
-chat_service = SimplifiedChatService()
\ No newline at end of file
+chat_service = lazy_service("chat_service", SimplifiedChatService)
@@ -0,0 +1,600 @@
+"""
+Chat history storage backends
+"""
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Optional
+from config.settings import CHAT_STORE_CONFIG
+from utils.file_lock import file_lock
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def legacy_message_id(chat_id: str, message: Dict[str, Any]) -> str:
+    """Deterministic ID for a message stored before messages carried one."""
+    key = "\x1f".join([chat_id, message.get("timestamp", ""), message.get("role", ""), message.get("content", "")])
+    return "legacy-" + hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+class ChatStore:
+    """Interface for chat history storage with O(1) appends and per-chat reads."""
+
+    def create_chat(self, chat_id: str, created_at: str) -> None:
+        """Register a new chat session."""
+        raise NotImplementedError
+
+    def chat_exists(self, chat_id: str) -> bool:
+        """Check whether a chat session has been registered."""
+        raise NotImplementedError
+
+    def append_message(self, chat_id: str, message: Dict[str, Any]) -> None:
+        """Append one message, carrying its message_id, to a chat session."""
+        raise NotImplementedError
+
+    def load_messages(self, chat_id: str) -> List[Dict[str, Any]]:
+        """Return the messages of one chat session in insertion order, each with a message_id."""
+        raise NotImplementedError
+
+    def history_revision(self, chat_id: str) -> str:
+        """Return a cheap value that changes whenever a record is appended to a chat."""
+        raise NotImplementedError
+
+    def get_meta(self, key: str) -> Optional[str]:
+        """Read a store-level metadata value."""
+        raise NotImplementedError
+
+    def set_meta(self, key: str, value: str) -> None:
+        """Write a store-level metadata value."""
+        raise NotImplementedError
+
+    def maintain(self, retention_days: Optional[float] = None, compact_after_days: Optional[float] = None,
+                 archive_dir: Optional[str] = None) -> Dict[str, int]:
+        """
+        Expire history older than retention_days, archiving it to archive_dir when
+        given, and compact cold data. Meant to run in the background.
+
+        Returns:
+            Counts of what was expired and compacted
+        """
+        return {}
+
+
+class SQLiteChatStore(ChatStore):
+    """Chat store backed by SQLite in WAL mode, indexed by chat_id."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS chats (
+                chat_id TEXT PRIMARY KEY,
+                created_at TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chat_id TEXT NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                timestamp TEXT NOT NULL,
+                feedback TEXT,
+                message_id TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_messages_chat_id ON messages(chat_id, id);
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            """
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(messages)")}
+        if "message_id" not in columns:
+            # Databases created before messages had IDs
+            self._conn.execute("ALTER TABLE messages ADD COLUMN message_id TEXT")
+        self._conn.commit()
+        logger.info(f"SQLite chat store opened at: {path}")
+
+    def create_chat(self, chat_id: str, created_at: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO chats (chat_id, created_at) VALUES (?, ?)",
+                (chat_id, created_at)
+            )
+            self._conn.commit()
+
+    def chat_exists(self, chat_id: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM chats WHERE chat_id = ?", (chat_id,)).fetchone()
+        return row is not None
+
+    def append_message(self, chat_id: str, message: Dict[str, Any]) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO messages (chat_id, role, content, timestamp, feedback, message_id) VALUES (?, ?, ?, ?, ?, ?)",
+                (chat_id, message["role"], message["content"], message["timestamp"], message.get("feedback"),
+                 message.get("message_id"))
+            )
+            self._conn.commit()
+
+    def load_messages(self, chat_id: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT role, content, timestamp, feedback, message_id FROM messages WHERE chat_id = ? ORDER BY id",
+                (chat_id,)
+            ).fetchall()
+        messages = []
+        for role, content, timestamp, feedback, message_id in rows:
+            message = {"role": role, "content": content, "timestamp": timestamp}
+            # Feedback given before the feedback store existed
+            if feedback:
+                message["feedback"] = feedback
+            message["message_id"] = message_id or legacy_message_id(chat_id, message)
+            messages.append(message)
+        return messages
+
+    def history_revision(self, chat_id: str) -> str:
+        with self._lock:
+            row = self._conn.execute("SELECT MAX(id) FROM messages WHERE chat_id = ?", (chat_id,)).fetchone()
+        return str(row[0] or 0)
+
+    def get_meta(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str) -> None:
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+            self._conn.commit()
+
+    def maintain(self, retention_days: Optional[float] = None, compact_after_days: Optional[float] = None,
+                 archive_dir: Optional[str] = None) -> Dict[str, int]:
+        """
+        Delete chats whose last message is older than retention_days, after writing
+        them to a gzipped JSONL file in archive_dir when given. SQLite reuses the
+        freed pages, so the database file stops growing once traffic is steady.
+        """
+        if not retention_days:
+            return {"expired_chats": 0, "expired_messages": 0}
+        cutoff = (datetime.now() - timedelta(days=retention_days)).isoformat()
+        with self._lock:
+            expired = [row[0] for row in self._conn.execute(
+                """
+                SELECT chats.chat_id FROM chats LEFT JOIN messages ON messages.chat_id = chats.chat_id
+                GROUP BY chats.chat_id
+                HAVING COALESCE(MAX(messages.timestamp), chats.created_at) < ?
+                """,
+                (cutoff,)
+            )]
+        if not expired:
+            return {"expired_chats": 0, "expired_messages": 0}
+
+        if archive_dir:
+            os.makedirs(archive_dir, exist_ok=True)
+            archive_path = os.path.join(archive_dir, f"chats-{datetime.now():%Y%m%d-%H%M%S}.jsonl.gz")
+            with gzip.open(f"{archive_path}.tmp", "wt", encoding="utf-8") as f:
+                for chat_id in expired:
+                    f.write(json.dumps({"chat_id": chat_id, "messages": self.load_messages(chat_id)},
+                                       ensure_ascii=False) + "\n")
+            os.replace(f"{archive_path}.tmp", archive_path)
+
+        deleted = 0
+        # Small batches keep the write lock short for concurrent writers
+        for start in range(0, len(expired), 500):
+            batch = expired[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            with self._lock:
+                deleted += self._conn.execute(
+                    f"DELETE FROM messages WHERE chat_id IN ({placeholders})", batch
+                ).rowcount
+                self._conn.execute(f"DELETE FROM chats WHERE chat_id IN ({placeholders})", batch)
+                self._conn.commit()
+        logger.info(f"Expired {len(expired)} chats ({deleted} messages) older than {retention_days} days")
+        return {"expired_chats": len(expired), "expired_messages": deleted}
+
+
+class JSONLChatStore(ChatStore):
+    """
+    Chat store made of append-only JSONL segments.
+
+    Segments are partitioned by day (rotated at segment_max_bytes within a day),
+    by chat (one segment per chat) or by size alone. Every chat has a small
+    offset index file listing (segment, offset, length) of its records, so a
+    chat is read with one seek per record instead of scanning the segments.
+
+    Cold segments are compacted into gzip files holding one gzip member per
+    chat; the index then points at the member, so reading an old chat still
+    only decompresses that chat's records.
+    """
+
+    def __init__(self, directory: str, segment_max_bytes: int = 16 * 1024 * 1024, partition: str = "day"):
+        if partition not in ("day", "chat", "size"):
+            raise ValueError(f"Unknown chat store partition: {partition}")
+        self.directory = directory
+        self.segment_dir = os.path.join(directory, "segments")
+        self.index_dir = os.path.join(directory, "index")
+        self.meta_file = os.path.join(directory, "meta.json")
+        self.lock_file = os.path.join(directory, "store.lock")
+        self.segment_max_bytes = segment_max_bytes
+        self.partition = partition
+        self._lock = threading.Lock()
+        os.makedirs(self.segment_dir, exist_ok=True)
+        os.makedirs(self.index_dir, exist_ok=True)
+        self._current_segment = self._latest_segment()
+        logger.info(f"JSONL chat store opened at: {directory}")
+
+    @contextmanager
+    def _locked(self):
+        """Serialise writes across threads and, through an flock on the store's lock file, across processes."""
+        with self._lock, file_lock(self.lock_file):
+            yield
+
+    def _latest_segment(self) -> str:
+        """Return the name of the newest shared segment, creating the first one if needed."""
+        if self.partition == "chat":
+            return ""
+        prefix = self._segment_prefix()
+        segments = sorted(name for name in os.listdir(self.segment_dir)
+                          if name.startswith(f"{prefix}-") and name.endswith(".jsonl"))
+        return segments[-1] if segments else f"{prefix}-000001.jsonl"
+
+    def _segment_prefix(self) -> str:
+        if self.partition == "day":
+            return f"segment-{datetime.now():%Y%m%d}"
+        return "segment"
+
+    @staticmethod
+    def _next_segment(segment: str) -> str:
+        """Return the name of the segment following the given one."""
+        stem, number = segment[:-len(".jsonl")].rsplit("-", 1)
+        return f"{stem}-{int(number) + 1:06d}.jsonl"
+
+    def _segment_for(self, chat_id: str) -> str:
+        """Pick the segment to append to, rotating full or already compacted ones."""
+        if self.partition == "chat":
+            segment = f"chat-{self._chat_digest(chat_id)}-000001.jsonl"
+            while os.path.exists(os.path.join(self.segment_dir, f"{segment}.gz")):
+                segment = self._next_segment(segment)
+            return segment
+
+        if self.partition == "day" and not self._current_segment.startswith(f"{self._segment_prefix()}-"):
+            self._current_segment = self._latest_segment()
+        while True:
+            segment_path = os.path.join(self.segment_dir, self._current_segment)
+            full = os.path.exists(segment_path) and os.path.getsize(segment_path) >= self.segment_max_bytes
+            if not full and not os.path.exists(f"{segment_path}.gz"):
+                return self._current_segment
+            self._current_segment = self._next_segment(self._current_segment)
+
+    @staticmethod
+    def _chat_digest(chat_id: str) -> str:
+        return hashlib.sha1(chat_id.encode("utf-8")).hexdigest()
+
+    def _index_path(self, chat_id: str) -> str:
+        """Map a chat_id to its index file without trusting it as a path component."""
+        return os.path.join(self.index_dir, f"{self._chat_digest(chat_id)}.idx")
+
+    def _append_record(self, chat_id: str, record: Dict[str, Any]) -> None:
+        """Append a record to the chat's segment and its location to the chat index."""
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._locked():
+            segment = self._segment_for(chat_id)
+            fd = os.open(os.path.join(self.segment_dir, segment), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                # Other processes append to the same segment; the lock keeps the end of file still
+                offset = os.lseek(fd, 0, os.SEEK_END)
+                view = memoryview(line)
+                while view:
+                    view = view[os.write(fd, view):]
+            finally:
+                os.close(fd)
+            with open(self._index_path(chat_id), "a", encoding="utf-8") as f:
+                f.write(f"{segment} {offset} {len(line)}\n")
+
+    def _read_index(self, index_path: str) -> List[List[str]]:
+        with open(index_path, "r", encoding="utf-8") as f:
+            return [line.split() for line in f if line.strip()]
+
+    def _read_records(self, chat_id: str) -> List[Dict[str, Any]]:
+        """Read every record of a chat through its offset index."""
+        index_path = self._index_path(chat_id)
+        # A segment compacted while reading moves to a .gz; the second pass sees the new index
+        for attempt in range(2):
+            if not os.path.exists(index_path):
+                return []
+            try:
+                return self._read_entries(self._read_index(index_path), skip_missing=attempt > 0)
+            except FileNotFoundError:
+                continue
+        return []
+
+    def _read_entries(self, entries: List[List[str]], skip_missing: bool) -> List[Dict[str, Any]]:
+        records = []
+        handles = {}
+        try:
+            for segment, offset, length in entries:
+                if segment not in handles:
+                    try:
+                        handles[segment] = open(os.path.join(self.segment_dir, segment), "rb")
+                    except FileNotFoundError:
+                        # Expired by retention but not yet pruned from the index
+                        if not skip_missing:
+                            raise
+                        handles[segment] = None
+                handle = handles[segment]
+                if handle is None:
+                    continue
+                handle.seek(int(offset))
+                data = handle.read(int(length))
+                lines = gzip.decompress(data).splitlines() if segment.endswith(".gz") else [data]
+                records.extend(json.loads(line.decode("utf-8")) for line in lines if line.strip())
+        finally:
+            for handle in handles.values():
+                if handle is not None:
+                    handle.close()
+        return records
+
+    def create_chat(self, chat_id: str, created_at: str) -> None:
+        if not self.chat_exists(chat_id):
+            self._append_record(chat_id, {"type": "chat", "chat_id": chat_id, "created_at": created_at})
+
+    def chat_exists(self, chat_id: str) -> bool:
+        return os.path.exists(self._index_path(chat_id))
+
+    def append_message(self, chat_id: str, message: Dict[str, Any]) -> None:
+        self._append_record(chat_id, {"type": "message", "chat_id": chat_id, **message})
+
+    def load_messages(self, chat_id: str) -> List[Dict[str, Any]]:
+        messages = []
+        for record in self._read_records(chat_id):
+            record_type = record.pop("type", "message")
+            record.pop("chat_id", None)
+            if record_type == "message":
+                record.setdefault("message_id", legacy_message_id(chat_id, record))
+                messages.append(record)
+            elif record_type == "feedback":
+                # Feedback records written before the feedback store existed
+                for message in messages:
+                    if message["role"] == "assistant" and message["content"] == record["content"]:
+                        message["feedback"] = record["feedback"]
+        return messages
+
+    def history_revision(self, chat_id: str) -> str:
+        # The chat index only grows on appends (compaction rewrites it, costing one extra reload)
+        try:
+            return str(os.stat(self._index_path(chat_id)).st_size)
+        except FileNotFoundError:
+            return "0"
+
+    def _read_meta(self) -> Dict[str, str]:
+        if not os.path.exists(self.meta_file):
+            return {}
+        with open(self.meta_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def get_meta(self, key: str) -> Optional[str]:
+        return self._read_meta().get(key)
+
+    def set_meta(self, key: str, value: str) -> None:
+        with self._locked():
+            meta = self._read_meta()
+            meta[key] = value
+            with open(self.meta_file, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+
+    def _cold_segments(self, older_than_days: float, compacted: bool) -> List[str]:
+        """Segments, plain or compacted, last written more than older_than_days ago."""
+        cutoff = time.time() - older_than_days * 86400
+        cold = []
+        for name in sorted(os.listdir(self.segment_dir)):
+            if name.endswith(".tmp") or name.endswith(".gz") != compacted:
+                continue
+            if name == self._current_segment:
+                continue
+            try:
+                if os.path.getmtime(os.path.join(self.segment_dir, name)) < cutoff:
+                    cold.append(name)
+            except FileNotFoundError:
+                continue
+        return cold
+
+    def _rewrite_index(self, index_path: str, entries: List[List[str]]) -> None:
+        if not entries:
+            os.remove(index_path)
+            return
+        with open(f"{index_path}.tmp", "w", encoding="utf-8") as f:
+            f.writelines(" ".join(entry) + "\n" for entry in entries)
+        os.replace(f"{index_path}.tmp", index_path)
+
+    def _compact_segment(self, segment: str) -> bool:
+        """
+        Rewrite a cold segment as a gzip file with one member per chat and point
+        the chats' indexes at their members. Safe to repeat after a crash: the
+        plain segment is only removed once every index has been switched over.
+        """
+        path = os.path.join(self.segment_dir, segment)
+        groups: Dict[str, List[bytes]] = {}
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    chat_id = json.loads(line.decode("utf-8"))["chat_id"]
+                except (ValueError, KeyError):
+                    # A torn final write was never indexed
+                    continue
+                groups.setdefault(chat_id, []).append(line)
+            size = f.tell()
+
+        compacted = f"{segment}.gz"
+        compacted_path = os.path.join(self.segment_dir, compacted)
+        members = {}
+        with open(f"{compacted_path}.tmp", "wb") as out:
+            for chat_id, lines in groups.items():
+                member = gzip.compress(b"".join(lines), mtime=0)
+                members[chat_id] = [compacted, str(out.tell()), str(len(member))]
+                out.write(member)
+        os.replace(f"{compacted_path}.tmp", compacted_path)
+
+        with self._locked():
+            if os.path.getsize(path) != size:
+                # Written to while compacting; leave it for the next run
+                os.remove(compacted_path)
+                return False
+            for chat_id, member in members.items():
+                index_path = self._index_path(chat_id)
+                if not os.path.exists(index_path):
+                    continue
+                entries, replaced = [], False
+                # A chat's records in one segment are consecutive in its index
+                for entry in self._read_index(index_path):
+                    if entry[0] != segment:
+                        entries.append(entry)
+                    elif not replaced:
+                        entries.append(member)
+                        replaced = True
+                self._rewrite_index(index_path, entries)
+            os.remove(path)
+        return True
+
+    def _expire_segments(self, segments: List[str], archive_dir: Optional[str]) -> None:
+        """Archive or delete expired segments, then drop their entries from every chat index."""
+        for segment in segments:
+            path = os.path.join(self.segment_dir, segment)
+            if not archive_dir:
+                os.remove(path)
+            elif segment.endswith(".gz"):
+                os.makedirs(archive_dir, exist_ok=True)
+                shutil.move(path, os.path.join(archive_dir, segment))
+            else:
+                os.makedirs(archive_dir, exist_ok=True)
+                with open(path, "rb") as src, gzip.open(os.path.join(archive_dir, f"{segment}.gz"), "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+                os.remove(path)
+
+        expired = set(segments)
+        for name in os.listdir(self.index_dir):
+            if not name.endswith(".idx"):
+                continue
+            index_path = os.path.join(self.index_dir, name)
+            with self._locked():
+                entries = self._read_index(index_path)
+                kept = [entry for entry in entries if entry[0] not in expired]
+                if len(kept) != len(entries):
+                    self._rewrite_index(index_path, kept)
+
+    def _acquire_maintenance_lock(self) -> Optional[str]:
+        """Let only one process maintain the store at a time; stale locks expire after an hour."""
+        lock_path = os.path.join(self.directory, "maintenance.lock")
+        try:
+            if time.time() - os.path.getmtime(lock_path) > 3600:
+                os.remove(lock_path)
+        except OSError:
+            pass
+        try:
+            os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return lock_path
+        except FileExistsError:
+            return None
+
+    def maintain(self, retention_days: Optional[float] = None, compact_after_days: Optional[float] = None,
+                 archive_dir: Optional[str] = None) -> Dict[str, int]:
+        """
+        Expire segments last written more than retention_days ago and gzip plain
+        segments untouched for compact_after_days. Chats whose records all
+        expired disappear with their index.
+        """
+        lock_path = self._acquire_maintenance_lock()
+        if lock_path is None:
+            logger.info("Chat store maintenance already running in another process")
+            return {}
+        try:
+            expired: List[str] = []
+            if retention_days:
+                expired = (self._cold_segments(retention_days, compacted=False)
+                           + self._cold_segments(retention_days, compacted=True))
+                if expired:
+                    self._expire_segments(expired, archive_dir)
+
+            compacted = 0
+            if compact_after_days is not None:
+                for segment in self._cold_segments(compact_after_days, compacted=False):
+                    try:
+                        compacted += self._compact_segment(segment)
+                    except Exception as e:
+                        logger.error(f"Error compacting chat segment {segment}: {e}")
+
+            if expired or compacted:
+                logger.info(f"Chat store maintenance: {len(expired)} segments expired, {compacted} compacted")
+            return {"expired_segments": len(expired), "compacted_segments": compacted}
+        finally:
+            os.remove(lock_path)
+
+
+def create_chat_store() -> ChatStore:
+    """Create the chat store backend selected in CHAT_STORE_CONFIG."""
+    backend = CHAT_STORE_CONFIG.get("backend", "sqlite")
+    if backend == "sqlite":
+        return SQLiteChatStore(CHAT_STORE_CONFIG["sqlite_path"])
+    if backend == "jsonl":
+        return JSONLChatStore(
+            CHAT_STORE_CONFIG["jsonl_dir"],
+            segment_max_bytes=CHAT_STORE_CONFIG.get("segment_max_bytes", 16 * 1024 * 1024),
+            partition=CHAT_STORE_CONFIG.get("partition", "day")
+        )
+    raise ValueError(f"Unknown chat store backend: {backend}")
+
+
+def migrate_json_history(json_path: str, store: ChatStore) -> int:
+    """
+    One-shot import of the legacy chat_history.json file into a chat store.
+
+    The migration is recorded in the store's metadata so it only runs once;
+    the original file is left untouched.
+
+    Returns:
+        Number of messages imported
+    """
+    if store.get_meta("migrated_from_json") or not os.path.exists(json_path):
+        return 0
+
+    try:
+        with open(json_path, "r", encoding="utf-8") as f:
+            content = f.read()
+        all_chats = json.loads(content) if content.strip() else {}
+        if not isinstance(all_chats, dict):
+            raise ValueError("chat history file is not a JSON object")
+    except (IOError, ValueError) as e:
+        logger.error(f"Skipping migration of malformed chat history file {json_path}: {e}")
+        store.set_meta("migrated_from_json", json_path)
+        return 0
+
+    imported = 0
+    for chat_id, chat in all_chats.items():
+        if store.chat_exists(chat_id):
+            continue
+        store.create_chat(chat_id, chat.get("created_at", ""))
+        for message in chat.get("messages", []):
+            record = {
+                "role": message.get("role", ""),
+                "content": message.get("content", ""),
+                "timestamp": message.get("timestamp", chat.get("created_at", "")),
+                **({"feedback": message["feedback"]} if message.get("feedback") else {})
+            }
+            store.append_message(chat_id, {**record, "message_id": legacy_message_id(chat_id, record)})
+            imported += 1
+
+    store.set_meta("migrated_from_json", json_path)
+    logger.info(f"Migrated {imported} messages from {len(all_chats)} chats in {json_path}")
+    return imported
@@ -0,0 +1,80 @@
+"""
+Append-only log of feedback on assistant messages
+"""
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterator, Optional, Tuple
+from config.settings import FEEDBACK_CONFIG
+from utils.logger import get_logger
+from utils.registry import lazy_service
+
+logger = get_logger(__name__)
+
+FEEDBACK_VALUES = ("up", "down")
+
+
+class FeedbackStore:
+    """
+    Feedback events keyed by (chat_id, message_id), appended as JSON lines.
+
+    Recording a click is a single append; nothing is ever rewritten. A later
+    event for the same message supersedes earlier ones when aggregating.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or FEEDBACK_CONFIG["path"]
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+
+    def record(self, chat_id: str, message_id: str, feedback: str) -> None:
+        """Append one feedback event."""
+        if feedback not in FEEDBACK_VALUES:
+            raise ValueError(f"Unknown feedback value: {feedback}")
+        line = json.dumps({
+            "chat_id": chat_id,
+            "message_id": message_id,
+            "feedback": feedback,
+            "timestamp": datetime.now().isoformat()
+        }, ensure_ascii=False) + "\n"
+        # One write on an O_APPEND file, so lines from several processes never interleave
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+    def iter_events(self) -> Iterator[Dict[str, Any]]:
+        """Stream every event in the order it was recorded."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # A torn write at the end of the file
+                    continue
+
+    def latest(self, chat_id: Optional[str] = None) -> Dict[Tuple[str, str], str]:
+        """Current feedback per (chat_id, message_id), optionally for one chat."""
+        current: Dict[Tuple[str, str], str] = {}
+        for event in self.iter_events():
+            if chat_id is None or event["chat_id"] == chat_id:
+                current[(event["chat_id"], event["message_id"])] = event["feedback"]
+        return current
+
+    def aggregate(self) -> Dict[str, int]:
+        """Count rated messages by their current feedback, in one pass over the log."""
+        current: Dict[Tuple[str, str], str] = {}
+        events = 0
+        for event in self.iter_events():
+            current[(event["chat_id"], event["message_id"])] = event["feedback"]
+            events += 1
+        counts = {value: 0 for value in FEEDBACK_VALUES}
+        for feedback in current.values():
+            counts[feedback] = counts.get(feedback, 0) + 1
+        counts["events"] = events
+        return counts
+
+
+# Global feedback store instance
+feedback_store = lazy_service("feedback_store", FeedbackStore)
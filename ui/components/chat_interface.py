@@ -4,7 +4,6 @@ Simplified Chat interface components for single chat interface
 import streamlit as st
 from datetime import datetime
 from core.rag_engine import rag_engine
-from core.memory_manager import memory_manager
 from services.chat_service import chat_service
 from utils.logger import get_logger
 
@@ -47,41 +46,32 @@ def render_chat_messages():
 
             with st.chat_message(display_role, avatar=avatar):
                 st.write(content)
-                # Show feedback buttons for assistant responses
-                if role == "assistant":
+                # Show feedback buttons for assistant responses; a reply that
+                # could not be saved has no message_id to attach feedback to
+                if role == "assistant" and message.get("message_id"):
+                    # Stable across reruns, unlike id(message)
+                    widget_id = message["message_id"]
                     col1, col2, col3 = st.columns([0.85, 0.07, 0.07])
                     with col2:
-                        if st.button("👍", key=f"thumbs_up_{id(message)}", help="Thumbs up", use_container_width=True):
+                        if st.button("👍", key=f"thumbs_up_{widget_id}", help="Thumbs up", use_container_width=True):
                             _save_feedback(message, "up")
                     with col3:
-                        if st.button("👎", key=f"thumbs_down_{id(message)}", help="Thumbs down", use_container_width=True):
+                        if st.button("👎", key=f"thumbs_down_{widget_id}", help="Thumbs down", use_container_width=True):
                             _save_feedback(message, "down")
     else:
         _render_empty_chat_placeholder()
 
 def _save_feedback(message, feedback):
-    """Save feedback for a specific assistant message in chat_history.json."""
-    import json
-    from services.chat_service import chat_service
+    """Save feedback for a specific assistant message in the chat store."""
     chat_id = st.session_state.get("chat_id")
     if not chat_id:
         st.error("No chat ID found.")
         return
-    # Load all chats
-    chat_file = chat_service.chat_file
-    try:
-        with open(chat_file, "r", encoding="utf-8") as f:
-            all_chats = json.load(f)
-        messages = all_chats.get(chat_id, {}).get("messages", [])
-        # Find the matching assistant message by content and role
-        for msg in messages:
-            if msg["role"] == "assistant" and msg["content"] == message["content"]:
-                msg["feedback"] = feedback
-        # Write back to file
-        with open(chat_file, "w", encoding="utf-8") as f:
-            json.dump(all_chats, f, ensure_ascii=False, indent=4)
-    except Exception as e:
-        st.error(f"Error saving feedback: {e}")
+    if not message.get("message_id"):
+        st.error("This response was not saved, so it cannot be rated.")
+        return
+    if not chat_service.save_feedback(chat_id, message["message_id"], feedback):
+        st.error("Error saving feedback. Please try again.")
 
 def _handle_user_query(user_query):
     """Process user query, save messages with chat_id, and display response."""
@@ -89,13 +79,14 @@ def _handle_user_query(user_query):
         # Get the current chat ID from the session state.
         chat_id = st.session_state.chat_id
         
-        # Save user message to the JSON file under the current chat_id.
-        if not chat_service.save_message(chat_id, "user", user_query):
+        # Save user message to the chat store under the current chat_id.
+        user_message_id = chat_service.save_message(chat_id, "user", user_query)
+        if not user_message_id:
             st.error("Failed to save your message. Please try again.")
             return
 
         # Append user message to the session state for immediate display.
-        user_message = {"role": "user", "content": user_query}
+        user_message = {"role": "user", "content": user_query, "message_id": user_message_id}
         st.session_state.chat_messages.append(user_message)
 
         # Display user message
@@ -108,7 +99,7 @@ def _handle_user_query(user_query):
             full_response = ""
             
             # Get the response generator from the RAG engine
-            response_generator = rag_engine.process_query(user_query)
+            response_generator = rag_engine.process_query(user_query, chat_id=chat_id)
             
             # Use the spinner only to wait for the first chunk of the response
             with st.spinner("🤔 Thinking..."):
@@ -139,9 +130,10 @@ def _handle_user_query(user_query):
             # Final render without the cursor
             response_placeholder.markdown(full_response)
 
-            # Save assistant response to the JSON file under the current chat_id.
-            if full_response and chat_service.save_message(chat_id, "assistant", full_response):
-                assistant_message = {"role": "assistant", "content": full_response}
+            # Save assistant response to the chat store under the current chat_id.
+            assistant_message_id = chat_service.save_message(chat_id, "assistant", full_response) if full_response else None
+            if assistant_message_id:
+                assistant_message = {"role": "assistant", "content": full_response, "message_id": assistant_message_id}
                 st.session_state.chat_messages.append(assistant_message)
                 logger.info("Saved assistant response to session and file.")
             else:
@@ -65,8 +65,8 @@ def _render_clean_chat_section():
     
     if st.button("✨ Start New Chat", use_container_width=True, type="primary"):
         try:
-            # 1. Reset conversation memory for a fresh start.
-            memory_manager.reset_memory()
+            # 1. Release the conversation memory of the chat being archived.
+            memory_manager.reset_memory(st.session_state.get("chat_id"))
             
             # 2. Create a new chat ID via the chat service.
             new_chat_id = chat_service.create_new_chat()
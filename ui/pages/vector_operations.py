@@ -3,7 +3,9 @@ Vector database operations page
 """
 import streamlit as st
 from core.vector_operations import vector_db_operations
+from core.ingestion import ingestion_pipeline
 from utils.logger import get_logger
+from utils.tracing import tracer
 from ui.styles.vectordb_page import apply_vector_operations_styling
 
 logger = get_logger(__name__)
@@ -85,11 +87,16 @@ def _show_add_documents_tab():
         for file in uploaded_files:
             st.write(f"📄 {file.name} ({file.size / 1024:.1f} KB)")
         
+        update_existing = st.checkbox(
+            "🔁 Update documents that already exist",
+            help="Re-ingest changed PDFs, embedding only new chunks and removing vanished ones"
+        )
+        
         # Add documents button
         if st.button("🚀 Add Documents to Vector Store", type="primary", use_container_width=True):
-            _process_document_uploads(uploaded_files)
+            _process_document_uploads(uploaded_files, update_existing)
 
-def _process_document_uploads(uploaded_files):
+def _process_document_uploads(uploaded_files, update_existing=False):
     """Process document uploads with enhanced progress tracking."""
     
     # Create a container for the progress display
@@ -105,33 +112,58 @@ def _process_document_uploads(uploaded_files):
         # Individual file processing status
         file_status_container = st.container()
     
-    results = []
+    stage_labels = {
+        "parse": "Parsing PDFs",
+        "embed": "Embedding chunks",
+        "insert": "Writing to vector store"
+    }
+    stage_weights = {"parse": (0.0, 0.3), "embed": (0.3, 0.9), "insert": (0.9, 1.0)}
     
-    with st.spinner("Initializing document processing..."):
-        # Small delay for better UX
-        import time
-        time.sleep(0.5)
+    def update_progress(stage, done, total):
+        """Map per-stage progress onto the overall progress bar."""
+        start, end = stage_weights.get(stage, (0.0, 1.0))
+        overall_progress.progress(min(1.0, start + (end - start) * done / max(total, 1)))
+        overall_status.text(f"{stage_labels.get(stage, stage)}: {done} of {total}")
     
-    for i, uploaded_file in enumerate(uploaded_files):
-        # Update overall status
-        overall_status.text(f"Processing file {i+1} of {len(uploaded_files)}: {uploaded_file.name}")
-        overall_progress.progress(i / len(uploaded_files))
-        
-        # Show individual file processing with spinner
-        with file_status_container:
-            with st.spinner(f"📄 Processing {uploaded_file.name}..."):
-                # Process the file
-                result = vector_db_operations.add_pdf_to_vectorstore(uploaded_file, uploaded_file.name)
-                results.append({
-                    "filename": uploaded_file.name,
-                    "result": result
-                })
-                
-                # Show immediate feedback for this file
-                if result["success"]:
-                    st.success(f"✅ {uploaded_file.name}: Successfully processed")
-                else:
-                    st.error(f"❌ {uploaded_file.name}: {result['message']}")
+    # Existing documents are diffed chunk by chunk instead of being rejected
+    existing_docs = set(vector_db_operations.list_documents()) if update_existing else set()
+    updated_files = [f for f in uploaded_files if f.name in existing_docs]
+    new_files = [f for f in uploaded_files if f.name not in existing_docs]
+    
+    update_results = {}
+    for uploaded_file in updated_files:
+        overall_status.text(f"Updating {uploaded_file.name}...")
+        with st.spinner(f"🔁 Updating {uploaded_file.name}..."):
+            update_results[uploaded_file.name] = vector_db_operations.update_document(uploaded_file, uploaded_file.name)
+    
+    # Process all new files through the parallel ingestion pipeline
+    with st.spinner(f"📄 Processing {len(new_files)} file(s)..."):
+        report = ingestion_pipeline.ingest(
+            [(uploaded_file.name, uploaded_file.getvalue()) for uploaded_file in new_files],
+            progress_callback=update_progress
+        )
+    report["results"].update(update_results)
+    
+    results = []
+    with file_status_container:
+        for uploaded_file in uploaded_files:
+            result = report["results"].get(uploaded_file.name, {
+                "success": False,
+                "message": "File was not processed.",
+                "chunks_added": 0
+            })
+            results.append({
+                "filename": uploaded_file.name,
+                "result": result
+            })
+            
+            # Show feedback for this file
+            if result["success"] and uploaded_file.name in update_results:
+                st.success(f"✅ {uploaded_file.name}: {result['message']}")
+            elif result["success"]:
+                st.success(f"✅ {uploaded_file.name}: Successfully processed")
+            else:
+                st.error(f"❌ {uploaded_file.name}: {result['message']}")
     
     # Complete the progress
     overall_progress.progress(1.0)
@@ -151,9 +183,45 @@ def _process_document_uploads(uploaded_files):
         else:
             st.error(f"❌ Failed to process any files. Please check the error messages above.")
         
+        # Per-stage throughput of the ingestion pipeline
+        if report["stages"]:
+            st.caption(f"Completed in {report['total_seconds']:.1f}s")
+            st.table([
+                {
+                    "Stage": stage,
+                    "Seconds": stats["seconds"],
+                    "Items": f"{stats['items']} {stats['unit']}",
+                    "Throughput": f"{stats['per_second']} {stats['unit']}/s"
+                }
+                for stage, stats in report["stages"].items()
+            ])
+        
+        _show_stage_latency()
+        
         if success_count > 0:
             st.balloons()
 
+def _show_stage_latency():
+    """Show the ingestion stage latencies recorded by this process and export its traces."""
+    stages = {name: stats for name, stats in tracer.summary().items() if name.startswith("ingest.")}
+    if not stages:
+        return
+    with st.expander("⏱️ Stage latency (all uploads since the app started)"):
+        st.table([
+            {
+                "Stage": name,
+                "Runs": stats["count"],
+                "Mean (ms)": stats["mean_ms"],
+                "p95 (ms)": stats["p95_ms"],
+                "Max (ms)": stats["max_ms"]
+            }
+            for name, stats in stages.items()
+        ])
+        try:
+            st.caption(f"Traces exported to {tracer.export(tracer.process_export_path())}")
+        except OSError as e:
+            logger.error(f"Failed to export traces: {e}")
+
 def _show_list_documents_tab():
     """Show list documents tab."""
     st.subheader("📋 Document List")
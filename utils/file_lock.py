@@ -0,0 +1,30 @@
+"""
+Advisory file lock for read-modify-write sequences shared between processes
+"""
+import os
+from contextlib import contextmanager
+from typing import Iterator
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: callers still serialise threads with their own locks
+    fcntl = None
+
+
+@contextmanager
+def file_lock(path: str) -> Iterator[None]:
+    """
+    Hold an exclusive flock on path, creating it if needed, for the duration of the block.
+    The lock file is opened per call, so forked processes never share a lock.
+    """
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
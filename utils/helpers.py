@@ -1,3 +1,139 @@
 """
 Utility helper functions
 """
+import re
+from typing import Iterable, List
+
+# Unicode script ranges for the Indian and other non-Latin scripts students write in
+_SCRIPT_RANGES = [
+    ((0x0900, 0x097F), "Hindi"),
+    ((0x0980, 0x09FF), "Bengali"),
+    ((0x0A00, 0x0A7F), "Punjabi"),
+    ((0x0A80, 0x0AFF), "Gujarati"),
+    ((0x0B00, 0x0B7F), "Odia"),
+    ((0x0B80, 0x0BFF), "Tamil"),
+    ((0x0C00, 0x0C7F), "Telugu"),
+    ((0x0C80, 0x0CFF), "Kannada"),
+    ((0x0D00, 0x0D7F), "Malayalam"),
+    ((0x0600, 0x06FF), "Urdu"),
+    ((0x0400, 0x04FF), "Russian"),
+    ((0x4E00, 0x9FFF), "Chinese"),
+]
+
+# Common words of romanized Hindi ("Hinglish"); one of these is enough to mark a query
+_ROMANIZED_HINDI_WORDS = {
+    "kya", "kaise", "kahan", "kitne", "kitna", "kitni", "nahi", "kaun", "kyun",
+    "batao", "bataiye", "hota", "hoti", "karna", "chahiye", "liye"
+}
+
+# Short romanized Hindi words that are also English words, names or abbreviations
+# ("KI", "KE"); these need a second Hindi word unless the query is only a few words
+_AMBIGUOUS_HINDI_WORDS = {"ki", "ke", "ka", "ko", "kar", "hai", "hain", "kab", "aur", "bhi", "mein"}
+_SHORT_QUERY_WORDS = 4
+
+# Function words and common verbs around a demonstrative used as a pronoun
+# ("does this cost", "about that"), as opposed to one that determines a noun ("this course")
+_FUNCTION_WORDS = {
+    "what", "how", "when", "where", "why", "which", "is", "are", "was", "were", "be",
+    "been", "do", "does", "did", "has", "have", "had", "can", "could", "will", "would",
+    "should", "may", "must", "also", "again", "too", "still", "only", "now", "then",
+    "there", "here", "for", "in", "on", "of", "to", "at", "by", "with", "from", "about",
+    "and", "or", "but", "if", "cost", "costs", "mean", "means", "take", "takes", "need",
+    "needs", "require", "requires", "include", "includes", "start", "starts", "end",
+    "ends", "open", "opens", "close", "closes", "apply", "get", "work", "works", "offer",
+    "offers", "accept", "accepts"
+}
+
+# Pronouns whose role is fixed by their form: possessives always refer back, and
+# demonstratives only when they stand alone rather than before a noun
+_POSSESSIVE_PRONOUNS = {"its", "their", "his", "her"}
+_DEMONSTRATIVE_PRONOUNS = {"this", "that", "these", "those"}
+_DETERMINERS = {
+    "the", "a", "an", "this", "that", "these", "those", "my", "your", "our", "his", "her",
+    "its", "their", "some", "any", "all", "every", "each", "no"
+}
+
+_WORD_PATTERN = re.compile(r"[a-z']+")
+
+
+def detect_language(text: str) -> str:
+    """
+    Detect the language of a query locally, without a model call.
+
+    Returns "English" only when the text is plain ASCII English; non-Latin
+    scripts are mapped to their most likely language and anything else
+    (accented Latin, romanized Hindi) is reported as "Unknown".
+    """
+    letters = [char for char in text if char.isalpha()]
+    if not letters:
+        return "English"
+
+    script_counts = {}
+    non_ascii = 0
+    for char in letters:
+        code = ord(char)
+        if code < 128:
+            continue
+        non_ascii += 1
+        for (low, high), language in _SCRIPT_RANGES:
+            if low <= code <= high:
+                script_counts[language] = script_counts.get(language, 0) + 1
+                break
+
+    if script_counts:
+        return max(script_counts, key=script_counts.get)
+    if non_ascii:
+        return "Unknown"
+
+    words = _WORD_PATTERN.findall(text.lower())
+    if any(word in _ROMANIZED_HINDI_WORDS for word in words):
+        return "Unknown"
+    ambiguous = sum(1 for word in words if word in _AMBIGUOUS_HINDI_WORDS)
+    if ambiguous >= 2 or (ambiguous and len(words) <= _SHORT_QUERY_WORDS):
+        return "Unknown"
+    return "English"
+
+
+def references_prior_turns(
+    query: str,
+    openers: Iterable[str],
+    pronouns: Iterable[str],
+    phrases: Iterable[str] = (),
+    max_short_words: int = 3
+) -> bool:
+    """
+    Heuristically decide whether a query depends on earlier conversation turns.
+
+    A query does when it is too short to stand alone, starts with a connective
+    opener ("what about", "also"), contains a referring phrase ("the above"), or
+    uses a pronoun as a reference. Possessives ("its cutoff") always count;
+    personal pronouns count unless a determiner follows them; demonstratives count
+    when they lead or end the query or stand between function words, so "what
+    does that cost" counts but "is that course free for girls" does not.
+    """
+    words: List[str] = _WORD_PATTERN.findall(query.lower())
+    if len(words) <= max_short_words:
+        return True
+
+    normalized = " " + " ".join(words) + " "
+    if any(normalized.startswith(f" {opener} ") for opener in openers):
+        return True
+    if any(f" {phrase} " in normalized for phrase in phrases):
+        return True
+
+    pronouns = set(pronouns)
+    last = len(words) - 1
+    for position, word in enumerate(words):
+        if word not in pronouns:
+            continue
+        if word in _POSSESSIVE_PRONOUNS or position == last:
+            return True
+        following = words[position + 1]
+        if word not in _DEMONSTRATIVE_PRONOUNS:
+            if following not in _DETERMINERS:
+                return True
+        elif position == 0 or (words[position - 1] in _FUNCTION_WORDS and following in _FUNCTION_WORDS):
+            # A content word before a demonstrative makes it a conjunction
+            # ("documents that are"), one after it a determiner
+            return True
+    return False
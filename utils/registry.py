@@ -0,0 +1,112 @@
+"""
+Registry of lazily constructed service singletons and their warm-up
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# name -> callable that brings the service up; kept in registration order, which
+# follows import order and therefore dependency order
+_warmup_hooks: "OrderedDict[str, Callable[[], Any]]" = OrderedDict()
+_init_seconds: Dict[str, float] = {}
+
+
+class LazyService:
+    """
+    Stand-in for a module-level singleton that constructs it on first use.
+
+    Attribute access is forwarded to the real instance, so call sites such as
+    vector_store_manager.get_retriever() work unchanged while importing the
+    module stays free of side effects.
+    """
+
+    __slots__ = ("_name", "_factory", "_instance", "_lock")
+
+    def __init__(self, name: str, factory: Callable[[], Any]):
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_factory", factory)
+        object.__setattr__(self, "_instance", None)
+        object.__setattr__(self, "_lock", threading.Lock())
+
+    def resolve(self) -> Any:
+        """Return the underlying instance, constructing it if needed."""
+        instance = self._instance
+        if instance is None:
+            with self._lock:
+                instance = self._instance
+                if instance is None:
+                    start = time.perf_counter()
+                    instance = self._factory()
+                    _init_seconds[self._name] = time.perf_counter() - start
+                    object.__setattr__(self, "_instance", instance)
+                    logger.info(f"Initialized {self._name} in {_init_seconds[self._name]:.3f}s")
+        return instance
+
+    @property
+    def is_initialized(self) -> bool:
+        return self._instance is not None
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self.resolve(), attr)
+
+    def __setattr__(self, attr: str, value: Any) -> None:
+        setattr(self.resolve(), attr, value)
+
+    def __len__(self) -> int:
+        return len(self.resolve())
+
+    def __bool__(self) -> bool:
+        # Truthiness of the proxy must not depend on (or trigger) construction
+        return True
+
+    def __repr__(self) -> str:
+        state = repr(self._instance) if self._instance is not None else "not initialized"
+        return f"<LazyService {self._name}: {state}>"
+
+
+def register_warmup(name: str, hook: Callable[[], Any]) -> None:
+    """Register a callable that warmup() runs, e.g. to preload a model or tokenizer."""
+    _warmup_hooks[name] = hook
+
+
+def lazy_service(name: str, factory: Callable[[], Any]) -> LazyService:
+    """Create a lazily constructed singleton and register it for warm-up."""
+    service = LazyService(name, factory)
+    register_warmup(name, service.resolve)
+    return service
+
+
+def warmup(names: Optional[Iterable[str]] = None) -> Dict[str, float]:
+    """
+    Construct the registered services (all of them, or only the given names) now
+    rather than on first request. Already initialized services are skipped.
+
+    Returns:
+        Dict of name -> seconds spent warming that service in this call
+    """
+    selected = list(names) if names is not None else list(_warmup_hooks)
+    timings: Dict[str, float] = {}
+    for name in selected:
+        hook = _warmup_hooks.get(name)
+        if hook is None:
+            logger.warning(f"No service registered under '{name}'")
+            continue
+        start = time.perf_counter()
+        try:
+            hook()
+        except Exception as e:
+            logger.error(f"Error warming up {name}: {e}")
+        timings[name] = round(time.perf_counter() - start, 4)
+    if timings:
+        logger.info(f"Warm-up finished in {sum(timings.values()):.3f}s: {timings}")
+    return timings
+
+
+def init_stats() -> Dict[str, float]:
+    """Construction time of every service initialized so far, however it was triggered."""
+    return {name: round(seconds, 4) for name, seconds in _init_seconds.items()}
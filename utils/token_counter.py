@@ -0,0 +1,56 @@
+"""
+Token counting helpers backed by tiktoken
+"""
+from functools import lru_cache
+import tiktoken
+from config.settings import MODEL_CONFIG
+from utils.logger import get_logger
+from utils.registry import register_warmup
+
+logger = get_logger(__name__)
+
+# Rough characters-per-token ratio used when no encoding can be loaded
+_CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=None)
+def _get_encoding(model: str):
+    """
+    Return the tiktoken encoding of a model, falling back to the GPT-4o encoding.
+    Returns None if no encoding can be loaded (e.g. the BPE file cannot be downloaded).
+    """
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        logger.error(f"Could not load tiktoken encoding for {model}, estimating tokens from length: {e}")
+        return None
+
+
+def count_tokens(text: str, model: str = None) -> int:
+    """Count the tokens of a text for the configured chat model."""
+    if not text:
+        return 0
+    encoding = _get_encoding(model or MODEL_CONFIG["chat_model"])
+    if encoding is None:
+        return -(-len(text) // _CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: str = None) -> str:
+    """Cut a text down to at most max_tokens tokens."""
+    if max_tokens <= 0:
+        return ""
+    encoding = _get_encoding(model or MODEL_CONFIG["chat_model"])
+    if encoding is None:
+        return text[:max_tokens * _CHARS_PER_TOKEN]
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
+
+
+# Loading the BPE ranks takes a noticeable moment, so let warmup() do it ahead of the first query
+register_warmup("tokenizer", lambda: _get_encoding(MODEL_CONFIG["chat_model"]))
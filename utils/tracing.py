@@ -0,0 +1,234 @@
+"""
+Lightweight in-process tracing: timed spans, per-stage histograms and export
+"""
+import contextvars
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from config.settings import TRACING_CONFIG
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Tags (e.g. chat_id) and span collector of the request being traced
+_current_tags: contextvars.ContextVar = contextvars.ContextVar("trace_tags", default={})
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("trace_collector", default=None)
+
+# Histogram buckets grow by 2**(1/4) from 0.05 ms, i.e. percentiles are within ~10%
+_BUCKET_BASE_MS = 0.05
+_BUCKET_GROWTH = 2 ** 0.25
+_BUCKET_COUNT = 100
+
+
+class _Histogram:
+    """Log-bucketed latency histogram with exact count, sum, min and max."""
+
+    def __init__(self):
+        self.buckets = [0] * _BUCKET_COUNT
+        self.count = 0
+        self.total_ms = 0.0
+        self.min_ms = math.inf
+        self.max_ms = 0.0
+
+    def add(self, value_ms: float) -> None:
+        if value_ms <= _BUCKET_BASE_MS:
+            index = 0
+        else:
+            index = min(_BUCKET_COUNT - 1, int(math.log(value_ms / _BUCKET_BASE_MS, _BUCKET_GROWTH)) + 1)
+        self.buckets[index] += 1
+        self.count += 1
+        self.total_ms += value_ms
+        self.min_ms = min(self.min_ms, value_ms)
+        self.max_ms = max(self.max_ms, value_ms)
+
+    def percentile(self, p: float) -> float:
+        """Upper bound of the bucket holding the p-th percentile, clamped to the observed range."""
+        if not self.count:
+            return 0.0
+        rank = p * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.buckets):
+            seen += bucket_count
+            if seen >= rank:
+                upper = _BUCKET_BASE_MS * _BUCKET_GROWTH ** index
+                return max(self.min_ms, min(upper, self.max_ms))
+        return self.max_ms
+
+    def to_dict(self) -> Dict:
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "p50_ms": round(self.percentile(0.50), 3),
+            "p95_ms": round(self.percentile(0.95), 3),
+            "p99_ms": round(self.percentile(0.99), 3),
+            "min_ms": round(self.min_ms, 3) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 3)
+        }
+
+
+class RequestTrace:
+    """Spans recorded while handling one request, for a per-request breakdown."""
+
+    def __init__(self, tags: Dict[str, Any]):
+        self.trace_id = uuid.uuid4().hex
+        self.tags = tags
+        self.spans: List[Dict] = []
+
+    def breakdown(self) -> str:
+        """Human-readable 'stage=ms' summary for log lines."""
+        return ", ".join(f"{span['name']}={span['duration_ms']:.1f}ms" for span in self.spans)
+
+
+class Tracer:
+    """
+    Records timed spans, tags them with the current request's tags (such as
+    chat_id), aggregates them into per-stage histograms and keeps the most
+    recent spans for export.
+    """
+
+    def __init__(self):
+        self.enabled = TRACING_CONFIG.get("enabled", True)
+        self.export_path = TRACING_CONFIG.get("export_path", "logs/traces.json")
+        self._histograms: Dict[str, _Histogram] = {}
+        self._recent: deque = deque(maxlen=TRACING_CONFIG.get("max_spans", 10000))
+        self._lock = threading.Lock()
+
+    def start(self, **tags: Any) -> RequestTrace:
+        """Create a request trace without binding it; see bind() and traced()."""
+        return RequestTrace({**_current_tags.get(), **tags})
+
+    @contextmanager
+    def bind(self, request: RequestTrace) -> Iterator[RequestTrace]:
+        """Make request the current trace for the enclosed block, which must not yield."""
+        tags_token = _current_tags.set(request.tags)
+        trace_token = _current_trace.set(request)
+        try:
+            yield request
+        finally:
+            _current_trace.reset(trace_token)
+            _current_tags.reset(tags_token)
+
+    @contextmanager
+    def trace(self, **tags: Any) -> Iterator[RequestTrace]:
+        """Bind tags to every span recorded inside the block and collect those spans."""
+        with self.bind(self.start(**tags)) as request:
+            yield request
+
+    def traced(self, iterator: Iterator, request: RequestTrace) -> Iterator:
+        """
+        Iterate with request bound around each step only. A generator shares its
+        consumer's context, so binding across a yield would leak the trace into
+        whatever the consumer does between items.
+        """
+        try:
+            while True:
+                with self.bind(request):
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        return
+                yield item
+        finally:
+            # Closed early, e.g. the reader stopped; let the iterator clean up inside the trace
+            with self.bind(request):
+                iterator.close()
+
+    async def atraced(self, iterator: AsyncIterator, request: RequestTrace) -> AsyncIterator:
+        """Async counterpart of traced()."""
+        try:
+            while True:
+                with self.bind(request):
+                    try:
+                        item = await iterator.__anext__()
+                    except StopAsyncIteration:
+                        return
+                yield item
+        finally:
+            with self.bind(request):
+                await iterator.aclose()
+
+    @contextmanager
+    def span(self, name: str, **tags: Any) -> Iterator[Dict[str, Any]]:
+        """
+        Time the enclosed block as a span named name.
+        The yielded dict can be used to add tags once the outcome is known.
+        """
+        extra: Dict[str, Any] = dict(tags)
+        start = time.perf_counter()
+        try:
+            yield extra
+        finally:
+            self.record(name, time.perf_counter() - start, **extra)
+
+    def record(self, name: str, seconds: float, **tags: Any) -> None:
+        """Record a span of known duration, e.g. time to first token."""
+        if not self.enabled:
+            return
+        duration_ms = seconds * 1000
+        request = _current_trace.get()
+        span = {
+            "name": name,
+            "timestamp": time.time(),
+            "duration_ms": round(duration_ms, 3),
+            "trace_id": request.trace_id if request else None,
+            "tags": {**_current_tags.get(), **tags}
+        }
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = _Histogram()
+            histogram.add(duration_ms)
+            self._recent.append(span)
+        if request is not None:
+            request.spans.append(span)
+        logger.debug(f"Span {name}: {duration_ms:.2f} ms {span['tags']}")
+
+    def summary(self) -> Dict[str, Dict]:
+        """Return the latency histogram of every stage."""
+        with self._lock:
+            return {name: histogram.to_dict() for name, histogram in sorted(self._histograms.items())}
+
+    def recent_spans(self, limit: Optional[int] = None) -> List[Dict]:
+        """Return the most recent spans, oldest first."""
+        with self._lock:
+            spans = list(self._recent)
+        return spans[-limit:] if limit else spans
+
+    def process_export_path(self) -> str:
+        """The export path of this process, e.g. logs/traces-1234.json, so workers never overwrite each other."""
+        root, ext = os.path.splitext(self.export_path)
+        return f"{root}-{os.getpid()}{ext}"
+
+    def export(self, path: Optional[str] = None) -> str:
+        """
+        Write the stage histograms and recent spans to a JSON file.
+        Returns the path written.
+        """
+        path = path or self.export_path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        snapshot = {
+            "exported_at": time.time(),
+            "stages": self.summary(),
+            "spans": self.recent_spans()
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, ensure_ascii=False, indent=2)
+        logger.info(f"Exported {len(snapshot['spans'])} spans to {path}")
+        return path
+
+    def reset(self) -> None:
+        """Drop all recorded spans and histograms."""
+        with self._lock:
+            self._histograms.clear()
+            self._recent.clear()
+
+
+# Global tracer instance
+tracer = Tracer()